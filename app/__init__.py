@@ -1,7 +1,7 @@
 import os
 from flask import Flask
 from dotenv import load_dotenv
-from .extensions import db
+from .extensions import configure_database, location_context
 from flask_login import LoginManager
 
 load_dotenv()
@@ -13,14 +13,114 @@ def create_app():
     app = Flask(__name__)  # use name with underscores
 
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///../instance/inventory.db'
-    app.config['UPLOAD_FOLDER'] = 'app/static/uploads'
+    app.config['DATABASE_PATH'] = os.getenv('DATABASE_PATH', os.path.join(app.instance_path, 'inventory.db'))
+    app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', 16)) * 1024 * 1024
+    # 'fifo' or 'average'; how the inventory page and reports value stock.
+    app.config['VALUATION_METHOD'] = os.getenv('VALUATION_METHOD', 'fifo')
 
-    db.init_app(app)
+    # Reorder forecasting (forecast.py): look-back windows in days, supplier
+    # lead time and review period in days, and the safety-stock z-score.
+    app.config['FORECAST_WINDOW_DAYS'] = int(os.getenv('FORECAST_WINDOW_DAYS', 28))
+    app.config['FORECAST_SHORT_WINDOW_DAYS'] = int(os.getenv('FORECAST_SHORT_WINDOW_DAYS', 7))
+    app.config['REORDER_LEAD_DAYS'] = float(os.getenv('REORDER_LEAD_DAYS', 3))
+    app.config['REORDER_REVIEW_DAYS'] = float(os.getenv('REORDER_REVIEW_DAYS', 7))
+    app.config['REORDER_SERVICE_Z'] = float(os.getenv('REORDER_SERVICE_Z', 1.65))
+
+    # Location shards (see locations.py). LOCATION pins CLI commands or a
+    # whole process to one location id; unset means the home database.
+    app.config['LOCATIONS_DIR'] = os.getenv('LOCATIONS_DIR', os.path.join(app.instance_path, 'locations'))
+    app.config['HOME_LOCATION_NAME'] = os.getenv('HOME_LOCATION_NAME', 'Main')
+    app.config['LOCATION'] = int(os.environ['LOCATION']) if os.getenv('LOCATION') else None
+
+    # Columnar ledger snapshot (snapshot.py) for as-of inventory and reports;
+    # off by default. SNAPSHOT_TAIL_ROWS appended actions trigger a re-sort.
+    app.config['SNAPSHOT_ENABLED'] = os.getenv('SNAPSHOT_ENABLED', '0').lower() not in ('0', 'false', 'no')
+    app.config['SNAPSHOT_DIR'] = os.getenv('SNAPSHOT_DIR', os.path.join(app.instance_path, 'snapshots'))
+    app.config['SNAPSHOT_TAIL_ROWS'] = int(os.getenv('SNAPSHOT_TAIL_ROWS', 20000))
+
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no')
+    app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 200))
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+
+    # Gzip for HTML/JSON responses at least GZIP_MIN_BYTES long, and the
+    # on-disk Jinja bytecode cache (empty JINJA_CACHE_DIR turns it off).
+    app.config['GZIP_ENABLED'] = os.getenv('GZIP_ENABLED', '1').lower() not in ('0', 'false', 'no')
+    app.config['GZIP_MIN_BYTES'] = int(os.getenv('GZIP_MIN_BYTES', 1024))
+    app.config['GZIP_LEVEL'] = int(os.getenv('GZIP_LEVEL', 6))
+    # Load third-party assets from their CDN while static/vendor is empty;
+    # ASSETS_CDN_FALLBACK=0 is for offline installs that must vendor them.
+    app.config['ASSETS_CDN_FALLBACK'] = os.getenv('ASSETS_CDN_FALLBACK', '1').lower() not in ('0', 'false', 'no')
+    app.config['JINJA_CACHE_DIR'] = os.getenv('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+    # Part of every page ETag (versions.conditional), so a deploy that changes
+    # templates or assets is not answered with 304s for pages from the old one.
+    from .versions import build_digest
+    app.config['BUILD_ID'] = os.getenv('APP_VERSION') or build_digest(app)
+
+    configure_database(app, app.config['DATABASE_PATH'])
+
+    from .metrics import init_metrics
+    init_metrics(app)
 
     from .routes import main
     app.register_blueprint(main)
 
+    from .assets import init_assets
+    init_assets(app)
+
     login_manager.init_app(app)
 
+    from .locations import init_locations, location_pool
+    init_locations(app)
+    location_pool.configure(int(os.getenv('LOCATION_WORKERS', 4)))
+
+    from .users import user_cache
+    user_cache.configure(
+        int(os.getenv('USER_CACHE_SIZE', 1024)),
+        float(os.getenv('USER_CACHE_TTL', 300)),
+    )
+
+    from .passwords import password_hasher, DEFAULT_METHOD
+    password_hasher.configure(
+        os.getenv('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        int(os.getenv('PASSWORD_HASH_WORKERS', 2)),
+        int(os.getenv('PASSWORD_HASH_QUEUE', 32)),
+        float(os.getenv('PASSWORD_HASH_WAIT', 10)),
+    )
+
+    from .writer import action_writer
+    app.config['WRITE_QUEUE_ENABLED'] = os.getenv('WRITE_QUEUE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+    action_writer.configure(
+        int(os.getenv('WRITE_BATCH_ROWS', 500)),
+        float(os.getenv('WRITE_BATCH_DELAY_MS', 5)) / 1000,
+        int(os.getenv('WRITE_QUEUE_SIZE', 1000)),
+        int(os.getenv('WRITE_RETRIES', 5)),
+        float(os.getenv('WRITE_BACKOFF_MS', 20)) / 1000,
+        float(os.getenv('WRITE_WAIT', 30)),
+        os.getenv('WRITE_SYNCHRONOUS', 'FULL'),
+    )
+    action_writer.init_app(app)
+
+    from .stock import stock_cli
+    from .migrations import schema_cli, upgrade
+    from .importer import actions_cli
+    from .uploads import uploads_cli
+    from .changes import changes_cli
+    from .locations import locations_cli, upgrade_locations
+    from .assets import assets_cli
+    from .snapshot import snapshot_cli
+    app.cli.add_command(stock_cli)
+    app.cli.add_command(actions_cli)
+    app.cli.add_command(uploads_cli)
+    app.cli.add_command(schema_cli)
+    app.cli.add_command(changes_cli)
+    app.cli.add_command(locations_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(snapshot_cli)
+    with app.app_context():
+        # The home database first, whatever LOCATION says, then every shard.
+        with location_context(None):
+            upgrade()
+        upgrade_locations()
+
     return app
\ No newline at end of file
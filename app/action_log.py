@@ -0,0 +1,79 @@
+from sqlalchemy import text
+from .extensions import db
+from .dates import canonical_date
+from .ledger import ACTION_TYPES
+
+# Keyset pagination over the action log, newest first. A cursor is the
+# (date, id) of the last row on the previous page, so every page is an index
+# range read no matter how deep into the ledger it is.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+LOG_SQL = """
+    SELECT a.id, a.date, a.action_type, c.name AS category_name, i.name AS item_name,
+           u.name AS unit_name, a.quantity, a.price, a.photo_path
+    FROM actions a
+    JOIN category c ON a.category_id = c.id
+    JOIN item i ON a.item_id = i.id
+    JOIN unit u ON a.unit_id = u.id
+    WHERE {where_sql}
+    ORDER BY a.date DESC, a.id DESC
+    LIMIT :limit
+"""
+
+
+def encode_cursor(row):
+    return f"{row.date}~{row.id}"
+
+
+def decode_cursor(cursor):
+    date, _, action_id = cursor.partition('~')
+    return canonical_date(date), int(action_id)
+
+
+def log_filters(args):
+    """Turn request args into a WHERE clause; raises ValueError on bad input."""
+    where_clauses = ["1 = 1"]
+    params = {}
+
+    for field in ('item_id', 'category_id', 'unit_id'):
+        if args.get(field):
+            where_clauses.append(f"a.{field} = :{field}")
+            params[field] = int(args[field])
+
+    action_type = args.get('action_type')
+    if action_type:
+        if action_type not in ACTION_TYPES:
+            raise ValueError(f"Unknown action type: {action_type!r}")
+        where_clauses.append("a.action_type = :action_type")
+        params['action_type'] = action_type
+
+    if args.get('start_date'):
+        where_clauses.append("a.date >= :start_date")
+        params['start_date'] = canonical_date(args['start_date'])
+    if args.get('end_date'):
+        where_clauses.append("a.date <= :end_date")
+        params['end_date'] = canonical_date(args['end_date'])
+
+    return where_clauses, params
+
+
+def fetch_page(args):
+    where_clauses, params = log_filters(args)
+
+    cursor = args.get('cursor')
+    if cursor:
+        params['cursor_date'], params['cursor_id'] = decode_cursor(cursor)
+        where_clauses.append("(a.date, a.id) < (:cursor_date, :cursor_id)")
+
+    limit = max(1, min(int(args.get('limit') or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    # One extra row tells us whether there is another page.
+    params['limit'] = limit + 1
+
+    rows = db.session.execute(
+        text(LOG_SQL.format(where_sql=" AND ".join(where_clauses))), params
+    ).fetchall()
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
@@ -0,0 +1,213 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import urllib.request
+import click
+from flask import Response, current_app, redirect, request, send_from_directory, url_for
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.security import safe_join
+
+# Front-end delivery. asset_url('styles.css') in a template gives
+# /assets/styles.<hash>.css, with <hash> taken from the file content, so the
+# URL changes whenever the file does and browsers may keep it for a year
+# without revalidating (Cache-Control: immutable). Third-party scripts and
+# stylesheets are vendored under static/vendor by 'flask assets vendor' so
+# the pages work without internet access. Until that has been run they load
+# from their CDN and the startup log lists the missing files; with
+# ASSETS_CDN_FALLBACK=0 (offline installs) every page shows a warning banner
+# instead.
+#
+# Gzipping a response changes its bytes, so a strong ETag set by
+# conditional() is made weak on the compressed copy.
+#
+# Text assets are gzipped once and kept in memory; HTML and JSON responses
+# above GZIP_MIN_BYTES are gzipped on the way out. Compiled templates are
+# kept in a bytecode cache on disk (JINJA_CACHE_DIR), so a fresh worker
+# loads them instead of compiling every template again.
+
+assets_cli = AppGroup('assets', help='Vendor and inspect front-end assets.')
+
+# Vendored file -> where 'flask assets vendor' downloads it from.
+VENDOR = {
+    'vendor/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css',
+    'vendor/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js',
+    'vendor/bootstrap-icons.css': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.css',
+    # bootstrap-icons.css loads these relative to itself.
+    'vendor/fonts/bootstrap-icons.woff2': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff2',
+    'vendor/fonts/bootstrap-icons.woff': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff',
+    'vendor/jquery.min.js': 'https://code.jquery.com/jquery-3.6.0.min.js',
+    'vendor/jquery.dataTables.min.css': 'https://cdn.datatables.net/1.13.6/css/jquery.dataTables.min.css',
+    'vendor/jquery.dataTables.min.js': 'https://cdn.datatables.net/1.13.6/js/jquery.dataTables.min.js',
+    'vendor/chart.umd.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js',
+}
+
+FINGERPRINTED = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<ext>\.[^./]+)$')
+COMPRESSIBLE_ASSETS = ('.css', '.js', '.svg', '.json', '.txt')
+COMPRESSIBLE_RESPONSES = ('text/html', 'application/json')
+ONE_YEAR = 365 * 24 * 3600
+
+_lock = threading.Lock()
+_digests = {}  # filename -> (mtime_ns, size, digest)
+_gzipped = {}  # (filename, digest) -> bytes
+
+
+def static_path(filename):
+    """The file's path inside static/, or None if it escapes the folder or isn't a file."""
+    path = safe_join(current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
+
+def digest(filename):
+    """Short content hash of a file under static/, or None if it doesn't exist."""
+    path = static_path(filename)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cached = _digests.get(filename)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    with open(path, 'rb') as f:
+        value = hashlib.sha256(f.read()).hexdigest()[:12]
+    with _lock:
+        _digests[filename] = (stat.st_mtime_ns, stat.st_size, value)
+    return value
+
+
+def asset_url(filename):
+    value = digest(filename)
+    if value is None:
+        if filename in VENDOR and current_app.config['ASSETS_CDN_FALLBACK']:
+            return VENDOR[filename]
+        return url_for('static', filename=filename)
+    stem, ext = os.path.splitext(filename)
+    return url_for('asset', filename=f"{stem}.{value}{ext}")
+
+
+def missing_vendor_assets():
+    """Vendored files not downloaded yet; empty when the CDN fallback is on."""
+    if current_app.config['ASSETS_CDN_FALLBACK']:
+        return []
+    return [filename for filename in VENDOR if digest(filename) is None]
+
+
+def _gzipped_asset(path, value):
+    key = (path, value)
+    data = _gzipped.get(key)
+    if data is None:
+        with open(path, 'rb') as f:
+            data = gzip.compress(f.read(), current_app.config['GZIP_LEVEL'])
+        with _lock:
+            _gzipped[key] = data
+    return data
+
+
+def serve_asset(filename):
+    match = FINGERPRINTED.match(filename)
+    if not match:
+        # Files referenced relative to a vendored stylesheet (fonts) have no
+        # hash in their name; they get the normal static caching.
+        return send_from_directory(current_app.static_folder, filename)
+
+    real = match['stem'] + match['ext']
+    # Only files that resolve inside static/ are served or redirected to.
+    path = static_path(real)
+    value = digest(real) if path else None
+    if value is None:
+        return Response(status=404)
+    if value != match['digest']:
+        # A page rendered before the file changed; send the current version.
+        return redirect(asset_url(real))
+
+    if real.endswith(COMPRESSIBLE_ASSETS) and 'gzip' in request.accept_encodings:
+        mimetype = mimetypes.guess_type(real)[0] or 'application/octet-stream'
+        response = Response(_gzipped_asset(path, value), mimetype=mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+    else:
+        response = send_from_directory(current_app.static_folder, real, etag=False, conditional=False)
+    response.cache_control.public = True
+    response.cache_control.max_age = ONE_YEAR
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    app.add_url_rule('/assets/<path:filename>', 'asset', serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.jinja_env.globals['missing_vendor_assets'] = missing_vendor_assets
+
+    with app.app_context():
+        missing = [filename for filename in VENDOR if digest(filename) is None]
+    if missing and app.config['ASSETS_CDN_FALLBACK']:
+        app.logger.info(
+            "Loading %s from the CDN until 'flask assets vendor' has been run.", ", ".join(missing)
+        )
+    elif missing:
+        app.logger.warning(
+            "Front-end assets missing from static/vendor: %s. Run 'flask assets vendor' "
+            "or set ASSETS_CDN_FALLBACK=1.", ", ".join(missing)
+        )
+
+    cache_dir = app.config['JINJA_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    if not app.config['GZIP_ENABLED']:
+        return
+
+    @app.after_request
+    def compress(response):
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_RESPONSES
+                or 'gzip' not in request.accept_encodings):
+            return response
+        data = response.get_data()
+        if len(data) < app.config['GZIP_MIN_BYTES']:
+            return response
+        response.set_data(gzip.compress(data, app.config['GZIP_LEVEL']))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+@assets_cli.command('vendor')
+@click.option('--force', is_flag=True, help='Download again even if the file exists.')
+def vendor_command(force):
+    """Download the third-party assets into static/vendor."""
+    for filename, url in VENDOR.items():
+        path = os.path.join(current_app.static_folder, filename)
+        if os.path.exists(path) and not force:
+            click.echo(f"{filename}: already vendored")
+            continue
+        with urllib.request.urlopen(url, timeout=30) as response:
+            data = response.read()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+        click.echo(f"{filename}: {len(data)} bytes from {url}")
+
+
+@assets_cli.command('list')
+def list_command():
+    """Show where each vendored asset is served from."""
+    for filename in VENDOR:
+        value = digest(filename)
+        source = f"vendored ({value})" if value else "missing"
+        click.echo(f"{filename}\t{source}")
@@ -0,0 +1,131 @@
+import json
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from .extensions import db
+
+# Change feed for actions and the reference tables. Triggers append one
+# change_log row per insert, update and delete, so every writer (routes,
+# importer, CLI, sqlite3 shell) is captured in the same transaction as the
+# change itself. Consumers poll /changes?since=<seq> and keep the last seq
+# they saw as their cursor.
+#
+# Compaction drops entries that a later entry for the same row supersedes,
+# so a client resuming from an old cursor still ends up with the current
+# state of every row, including deletes. Since the surviving entry for a row
+# may be an 'update', consumers should apply inserts and updates as upserts.
+
+changes_cli = AppGroup('changes', help='Maintain the change_log feed.')
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Columns copied into the JSON payload for inserts and updates.
+TRACKED_TABLES = {
+    'actions': ('date', 'action_type', 'category_id', 'item_id', 'unit_id', 'quantity', 'price', 'photo_path'),
+    'item': ('name',),
+    'category': ('name',),
+    'unit': ('name',),
+}
+
+CHANGE_LOG_DDL = """
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+        data TEXT,
+        changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+CHANGE_LOG_ROW_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_change_log_row
+    ON change_log (table_name, row_id, seq)
+"""
+
+
+def trigger_ddl(table, columns):
+    payload = "json_object(" + ", ".join(f"'{c}', NEW.{c}" for c in columns) + ")"
+    statements = []
+    for event, op, row_id, data in (
+        ('INSERT', 'insert', 'NEW.id', payload),
+        ('UPDATE', 'update', 'NEW.id', payload),
+        ('DELETE', 'delete', 'OLD.id', 'NULL'),
+    ):
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS change_log_{table}_{op}
+            AFTER {event} ON {table}
+            BEGIN
+                INSERT INTO change_log (table_name, row_id, op, data)
+                VALUES ('{table}', {row_id}, '{op}', {data});
+            END
+        """)
+    return statements
+
+
+def install_change_log():
+    db.session.execute(text(CHANGE_LOG_DDL))
+    db.session.execute(text(CHANGE_LOG_ROW_INDEX))
+    for table, columns in TRACKED_TABLES.items():
+        for statement in trigger_ddl(table, columns):
+            db.session.execute(text(statement))
+
+
+def fetch_changes(since, limit=DEFAULT_LIMIT):
+    """Changes after seq 'since', oldest first; returns (changes, next_cursor, has_more)."""
+    since = int(since or 0)
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+    rows = db.session.execute(
+        text("""
+            SELECT seq, table_name, row_id, op, data, changed_at
+            FROM change_log
+            WHERE seq > :since
+            ORDER BY seq
+            LIMIT :limit
+        """),
+        {"since": since, "limit": limit + 1}
+    ).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changes = [
+        {
+            "seq": row.seq,
+            "table": row.table_name,
+            "id": row.row_id,
+            "op": row.op,
+            "data": json.loads(row.data) if row.data else None,
+            "changed_at": row.changed_at,
+        }
+        for row in rows
+    ]
+    next_cursor = str(rows[-1].seq) if rows else str(since)
+    return changes, next_cursor, has_more
+
+
+def compact_changes(older_than_days):
+    """Delete entries older than the cutoff that a later entry for the same row supersedes."""
+    result = db.session.execute(
+        text("""
+            DELETE FROM change_log
+            WHERE changed_at < datetime('now', :cutoff)
+              AND EXISTS (
+                  SELECT 1 FROM change_log later
+                  WHERE later.table_name = change_log.table_name
+                    AND later.row_id = change_log.row_id
+                    AND later.seq > change_log.seq
+              )
+        """),
+        {"cutoff": f"-{int(older_than_days)} days"}
+    )
+    return result.rowcount
+
+
+@changes_cli.command('compact')
+@click.option('--days', default=30, show_default=True, help='Only compact entries older than this.')
+def compact_command(days):
+    """Drop change_log entries superseded by a later change to the same row."""
+    removed = compact_changes(days)
+    db.session.commit()
+    click.echo(f"Removed {removed} superseded change_log entries.")
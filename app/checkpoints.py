@@ -0,0 +1,367 @@
+import calendar
+import click
+from collections import namedtuple
+from datetime import date, timedelta
+from sqlalchemy import text
+from .extensions import db
+from .lookups import reference_lists
+from .stock import LEDGER_BALANCE_SQL, stock_cli
+from . import valuation
+
+# Month-end stock checkpoints. stock_checkpoint holds the balance of every
+# (item, unit) at the close of each completed month, so "what was on hand on
+# date D" starts from the nearest checkpoint at or before D and only replays
+# the actions after it. stock_checkpoint_period lists the months that have
+# been checkpointed.
+#
+# Each checkpoint also carries the key's cost valuation at that close: the
+# running average cost, any unsettled deficit and, in stock_checkpoint_layer,
+# the FIFO layers still open. Valuing stock as of D replays the actions after
+# the checkpoint through valuation.apply(), the same fold that maintains
+# stock_valuation, so past dates are valued with VALUATION_METHOD like today.
+#
+# A back-dated insert or a delete inside a checkpointed month invalidates
+# that key's checkpoints from the month onwards and rebuilds them from the
+# previous checkpoint; other keys are untouched.
+
+CHECKPOINT_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS stock_checkpoint_period (
+        period_end DATE PRIMARY KEY
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stock_checkpoint (
+        period_end DATE NOT NULL,
+        item_id INTEGER NOT NULL,
+        unit_id INTEGER NOT NULL,
+        net_quantity REAL NOT NULL,
+        avg_cost REAL NOT NULL DEFAULT 0,
+        deficit REAL NOT NULL DEFAULT 0,
+        next_seq INTEGER NOT NULL DEFAULT 0,
+        latest_date DATE,
+        latest_delivery_date DATE,
+        latest_unit_price REAL,
+        PRIMARY KEY (item_id, unit_id, period_end)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_stock_checkpoint_period
+    ON stock_checkpoint (period_end)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stock_checkpoint_layer (
+        period_end DATE NOT NULL,
+        item_id INTEGER NOT NULL,
+        unit_id INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        date DATE NOT NULL,
+        quantity REAL NOT NULL,
+        unit_cost REAL NOT NULL,
+        PRIMARY KEY (item_id, unit_id, period_end, seq)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_stock_checkpoint_layer_period
+    ON stock_checkpoint_layer (period_end)
+    """,
+)
+
+INSERT_CHECKPOINT_SQL = """
+    INSERT INTO stock_checkpoint (period_end, item_id, unit_id, net_quantity, avg_cost, deficit, next_seq,
+                                  latest_date, latest_delivery_date, latest_unit_price)
+    VALUES (:period_end, :item_id, :unit_id, :net_quantity, :avg_cost, :deficit, :next_seq,
+            :latest_date, :latest_delivery_date, :latest_unit_price)
+"""
+
+INSERT_CHECKPOINT_LAYER_SQL = """
+    INSERT INTO stock_checkpoint_layer (period_end, item_id, unit_id, seq, date, quantity, unit_cost)
+    VALUES (:period_end, :item_id, :unit_id, :seq, :date, :quantity, :unit_cost)
+"""
+
+CHECKPOINT_COLUMNS = "item_id, unit_id, net_quantity, latest_date, latest_delivery_date, latest_unit_price"
+VALUATION_COLUMNS = "item_id, unit_id, net_quantity, avg_cost, deficit, next_seq"
+
+InventoryRow = namedtuple('InventoryRow', 'item_name unit_name latest_date net_quantity total_price')
+
+
+def month_end(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def last_closed_period(today=None):
+    """The most recent month end strictly before today."""
+    today = today or date.today()
+    return today.replace(day=1) - timedelta(days=1)
+
+
+WINDOW_FILTER = "AND date > :after AND date <= :until"
+KEY_WINDOW_FILTER = "AND item_id = :item_id AND unit_id = :unit_id " + WINDOW_FILTER
+
+
+def new_state():
+    return {'net_quantity': 0.0, 'latest_date': None, 'latest_delivery_date': None, 'latest_unit_price': None}
+
+
+def window_actions(after, until, key=None):
+    """Actions in (after, until] in the order valuation folds them."""
+    params = dict(key or {}, after=after or '', until=until)
+    key_filter = KEY_WINDOW_FILTER if key else WINDOW_FILTER
+    return db.session.execute(
+        text(f"""
+            SELECT item_id, unit_id, date, action_type, quantity, price FROM actions
+            WHERE 1 = 1 {key_filter}
+            ORDER BY item_id, unit_id, date, id
+        """),
+        params
+    )
+
+
+def replay(valuations, actions):
+    for action in actions:
+        key = (action.item_id, action.unit_id)
+        state = valuations.get(key)
+        if state is None:
+            state = valuations[key] = valuation.new_state()
+        valuation.apply(key, state, action)
+
+
+def window_deltas(after, until, key=None):
+    """Per-key movement in (after, until], via the same aggregation as stock_balance."""
+    params = dict(key or {}, after=after or '', until=until)
+    key_filter = KEY_WINDOW_FILTER if key else WINDOW_FILTER
+    return db.session.execute(text(LEDGER_BALANCE_SQL.format(key_filter=key_filter)), params).fetchall()
+
+
+def merge(state, delta):
+    state['net_quantity'] += delta.net_quantity or 0.0
+    if state['latest_date'] is None or delta.latest_date > state['latest_date']:
+        state['latest_date'] = delta.latest_date
+    if delta.latest_delivery_date is not None:
+        state['latest_delivery_date'] = delta.latest_delivery_date
+        state['latest_unit_price'] = delta.latest_unit_price
+
+
+def checkpoint_params(period_end, key, state, valued):
+    return dict(
+        state, period_end=period_end, item_id=key[0], unit_id=key[1],
+        avg_cost=valued['avg_cost'], deficit=valued['deficit'], next_seq=valued['next_seq'],
+    )
+
+
+def layer_params(period_end, key, valued):
+    return [
+        {'period_end': period_end, 'item_id': key[0], 'unit_id': key[1],
+         'seq': layer[0], 'date': layer[1], 'quantity': layer[2], 'unit_cost': layer[3]}
+        for layer in valued['layers'][valued['head']:]
+    ]
+
+
+def save_checkpoints(period_end, states, valuations):
+    empty = valuation.new_state()
+    params, layers = [], []
+    for key, state in states.items():
+        valued = valuations.get(key, empty)
+        params.append(checkpoint_params(period_end, key, state, valued))
+        layers.extend(layer_params(period_end, key, valued))
+    if params:
+        db.session.execute(text(INSERT_CHECKPOINT_SQL), params)
+    if layers:
+        db.session.execute(text(INSERT_CHECKPOINT_LAYER_SQL), layers)
+
+
+def load_states(period_end, key=None):
+    if period_end is None:
+        return {}
+    key_filter = "AND item_id = :item_id AND unit_id = :unit_id" if key else ""
+    rows = db.session.execute(
+        text(f"SELECT {CHECKPOINT_COLUMNS} FROM stock_checkpoint WHERE period_end = :period_end {key_filter}"),
+        dict(key or {}, period_end=period_end)
+    ).fetchall()
+    return {
+        (r.item_id, r.unit_id): {
+            'net_quantity': r.net_quantity,
+            'latest_date': r.latest_date,
+            'latest_delivery_date': r.latest_delivery_date,
+            'latest_unit_price': r.latest_unit_price,
+        }
+        for r in rows
+    }
+
+
+def load_valuations(period_end, key=None):
+    """{(item_id, unit_id): valuation state} at a checkpoint, with its open layers in memory."""
+    if period_end is None:
+        return {}
+    key_filter = "AND item_id = :item_id AND unit_id = :unit_id" if key else ""
+    params = dict(key or {}, period_end=period_end)
+    valuations = {}
+    for r in db.session.execute(
+        text(f"SELECT {VALUATION_COLUMNS} FROM stock_checkpoint WHERE period_end = :period_end {key_filter}"),
+        params
+    ):
+        state = valuation.new_state()
+        state.update(on_hand=r.net_quantity, avg_cost=r.avg_cost, deficit=r.deficit, next_seq=r.next_seq)
+        valuations[(r.item_id, r.unit_id)] = state
+    for r in db.session.execute(
+        text(f"""
+            SELECT item_id, unit_id, seq, date, quantity, unit_cost FROM stock_checkpoint_layer
+            WHERE period_end = :period_end {key_filter}
+            ORDER BY item_id, unit_id, seq
+        """),
+        params
+    ):
+        # Kept in memory only, like layers created during a pass (valuation.py).
+        valuations[(r.item_id, r.unit_id)]['layers'].append([r.seq, r.date, r.quantity, r.unit_cost, None])
+    return valuations
+
+
+def period_bounds():
+    row = db.session.execute(text("SELECT MIN(period_end), MAX(period_end) FROM stock_checkpoint_period")).fetchone()
+    return row[0], row[1]
+
+
+def nearest_period(day, inclusive=True):
+    op = '<=' if inclusive else '<'
+    return db.session.execute(
+        text(f"SELECT MAX(period_end) FROM stock_checkpoint_period WHERE period_end {op} :day"),
+        {"day": day}
+    ).scalar()
+
+
+def extend_checkpoints(until=None):
+    """Checkpoint every closed month after the latest one; returns the number of months added."""
+    until = until or last_closed_period()
+    latest = period_bounds()[1]
+    if latest is None:
+        first = db.session.execute(text("SELECT MIN(date) FROM actions")).scalar()
+        if first is None:
+            return 0
+        period = month_end(date.fromisoformat(first))
+    else:
+        period = month_end(date.fromisoformat(latest) + timedelta(days=1))
+    if period > until:
+        return 0
+
+    states = load_states(latest)
+    valuations = load_valuations(latest)
+    previous = latest
+    added = 0
+    while period <= until:
+        period_end = period.isoformat()
+        for delta in window_deltas(previous, period_end):
+            merge(states.setdefault((delta.item_id, delta.unit_id), new_state()), delta)
+        replay(valuations, window_actions(previous, period_end))
+        save_checkpoints(period_end, states, valuations)
+        db.session.execute(text("INSERT INTO stock_checkpoint_period (period_end) VALUES (:p)"), {"p": period_end})
+        added += 1
+        previous = period_end
+        period = month_end(period + timedelta(days=1))
+    return added
+
+
+def rebuild_key_from(item_id, unit_id, day):
+    """Drop and recompute one key's checkpoints for every period ending on or after day."""
+    periods = [
+        row.period_end for row in db.session.execute(
+            text("SELECT period_end FROM stock_checkpoint_period WHERE period_end >= :day ORDER BY period_end"),
+            {"day": day}
+        )
+    ]
+    if not periods:
+        return
+
+    key = {"item_id": item_id, "unit_id": unit_id}
+    for table in ('stock_checkpoint', 'stock_checkpoint_layer'):
+        db.session.execute(
+            text(f"""
+                DELETE FROM {table}
+                WHERE item_id = :item_id AND unit_id = :unit_id AND period_end >= :day
+            """),
+            dict(key, day=periods[0])
+        )
+
+    previous = nearest_period(periods[0], inclusive=False)
+    state = load_states(previous, key).get((item_id, unit_id)) or new_state()
+    valuations = load_valuations(previous, key)
+    for period_end in periods:
+        for delta in window_deltas(previous, period_end, key):
+            merge(state, delta)
+        replay(valuations, window_actions(previous, period_end, key))
+        if state['latest_date'] is not None:
+            save_checkpoints(period_end, {(item_id, unit_id): state}, valuations)
+        previous = period_end
+
+
+def touch_checkpoints(rows):
+    """Bring checkpoints up to date after ledger writes; the caller owns the transaction.
+
+    rows are the inserted or deleted actions (dicts or result rows).
+    """
+    earliest = {}
+    for row in rows:
+        row = row if isinstance(row, dict) else row._mapping
+        key = (int(row['item_id']), int(row['unit_id']))
+        if key not in earliest or row['date'] < earliest[key]:
+            earliest[key] = row['date']
+
+    first, latest = period_bounds()
+    if first is not None and earliest and min(earliest.values()) < first[:8] + '01':
+        # The change predates the first checkpointed month.
+        rebuild_checkpoints()
+        return
+    if latest is not None:
+        for (item_id, unit_id), day in earliest.items():
+            if day <= latest:
+                rebuild_key_from(item_id, unit_id, day)
+    extend_checkpoints()
+
+
+def rebuild_checkpoints():
+    db.session.execute(text("DELETE FROM stock_checkpoint"))
+    db.session.execute(text("DELETE FROM stock_checkpoint_layer"))
+    db.session.execute(text("DELETE FROM stock_checkpoint_period"))
+    return extend_checkpoints()
+
+
+def stock_as_of(day, method, snapshot=None):
+    """Inventory rows as of the end of day, valued with method, newest activity first.
+
+    With a ledger snapshot (snapshot.py) the balances come from its columns
+    instead of the nearest checkpoint plus the actions after it; the values
+    always replay the checkpoint's valuation forward.
+    """
+    period = nearest_period(day)
+    if snapshot:
+        states = snapshot.balances_as_of(day)
+    else:
+        states = load_states(period)
+        for delta in window_deltas(period, day):
+            merge(states.setdefault((delta.item_id, delta.unit_id), new_state()), delta)
+    valuations = load_valuations(period)
+    replay(valuations, window_actions(period, day))
+
+    lists = reference_lists()
+    names = {table: {row.id: row.name for row in lists[table]} for table in ('item', 'unit')}
+    rows = []
+    for key, state in states.items():
+        valued = valuations.get(key)
+        value = None if valued is None else valuation.state_value(valued, method)
+        rows.append(InventoryRow(
+            names['item'].get(key[0]),
+            names['unit'].get(key[1]),
+            state['latest_date'],
+            round(state['net_quantity'], 1),
+            None if value is None else round(value, 2),
+        ))
+    rows.sort(key=lambda row: row.latest_date, reverse=True)
+    return rows
+
+
+@stock_cli.command('checkpoint')
+@click.option('--rebuild', is_flag=True, help='Drop all checkpoints and recompute them.')
+def checkpoint_command(rebuild):
+    """Checkpoint every closed month that has no checkpoint yet."""
+    added = rebuild_checkpoints() if rebuild else extend_checkpoints()
+    db.session.commit()
+    click.echo(f"Added {added} monthly checkpoints.")
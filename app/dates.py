@@ -0,0 +1,26 @@
+from datetime import datetime
+
+# Every date in the actions ledger is stored as ISO 'YYYY-MM-DD' so that
+# string comparison, ORDER BY and the (item_id, date) indexes agree with
+# calendar order.
+CANONICAL_FORMAT = '%Y-%m-%d'
+
+ACCEPTED_FORMATS = (
+    '%Y-%m-%d',
+    '%Y/%m/%d',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%dT%H:%M',
+    '%d.%m.%Y',
+    '%d/%m/%Y',
+)
+
+
+def canonical_date(value):
+    value = (value or '').strip()
+    for fmt in ACCEPTED_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime(CANONICAL_FORMAT)
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date: {value!r}")
@@ -0,0 +1,94 @@
+import csv
+import io
+from .dates import canonical_date
+from .extensions import read_connection
+
+# Streaming CSV exports. Each export runs one query on a read-only
+# connection and pulls rows in fetchmany() chunks, so memory stays flat no
+# matter how many years of ledger are exported and the first bytes go out
+# before the query has finished.
+
+CHUNK_SIZE = 1000
+
+ACTIONS_EXPORT_SQL = """
+    SELECT a.id, a.date, a.action_type, c.name AS category, i.name AS item, u.name AS unit,
+           a.quantity, a.price, a.photo_path
+    FROM actions a
+    JOIN category c ON a.category_id = c.id
+    JOIN item i ON a.item_id = i.id
+    JOIN unit u ON a.unit_id = u.id
+    WHERE {where_sql}
+    ORDER BY a.date, a.id
+"""
+
+INVENTORY_EXPORT_SQL = """
+    SELECT i.name AS item, u.name AS unit, ROUND(s.net_quantity, 1) AS quantity,
+           s.latest_unit_price AS latest_unit_price,
+           ROUND(v.fifo_value, 2) AS fifo_value,
+           ROUND(v.avg_cost, 4) AS average_cost,
+           ROUND(MAX(v.on_hand, 0) * v.avg_cost, 2) AS average_value,
+           s.latest_date, s.latest_delivery_date
+    FROM stock_balance s
+    JOIN item i ON s.item_id = i.id
+    JOIN unit u ON s.unit_id = u.id
+    LEFT JOIN stock_valuation v ON v.item_id = s.item_id AND v.unit_id = s.unit_id
+    WHERE {where_sql}
+    ORDER BY i.name, u.name
+"""
+
+REPORT_EXPORT_SQL = """
+    SELECT s.date, i.name AS item, u.name AS unit, s.action_type, s.quantity, s.price, s.action_count
+    FROM daily_item_summary s
+    JOIN item i ON s.item_id = i.id
+    JOIN unit u ON s.unit_id = u.id
+    WHERE {where_sql}
+    ORDER BY s.item_id, s.unit_id, s.date, s.action_type
+"""
+
+
+def item_date_filters(args, alias, with_dates=True):
+    """WHERE clause for the reports() filters: item_id (repeatable), start_date, end_date.
+
+    Raises ValueError on a bad item_id or date.
+    """
+    where_clauses = ["1 = 1"]
+    params = {}
+
+    item_ids = [int(i) for i in args.getlist('item_id') if i]
+    if item_ids:
+        names = [f"item_{n}" for n in range(len(item_ids))]
+        where_clauses.append(f"{alias}.item_id IN ({', '.join(':' + name for name in names)})")
+        params.update(zip(names, item_ids))
+    if with_dates and args.get('start_date'):
+        where_clauses.append(f"{alias}.date >= :start_date")
+        params['start_date'] = canonical_date(args['start_date'])
+    if with_dates and args.get('end_date'):
+        where_clauses.append(f"{alias}.date <= :end_date")
+        params['end_date'] = canonical_date(args['end_date'])
+
+    return " AND ".join(where_clauses), params
+
+
+def stream_csv(sql, params):
+    """Yield CSV text for the query, header first, one chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    with read_connection() as conn:
+        cursor = conn.execute(sql, params)
+        writer.writerow([column[0] for column in cursor.description])
+        yield flush()
+
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            writer.writerows(rows)
+            yield flush()
+        cursor.close()
@@ -1,3 +1,180 @@
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+import sqlite3
+import threading
 
-db = SQLAlchemy()
+
+class LocationSession(Session):
+    """Sends statements to the current location's shard; see locations.py."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.bind is not None:
+            # A session opened on one connection (see writer.py) stays on it.
+            return self.bind
+        if bind is None and mapper is None:
+            location = current_location()
+            if location is not None:
+                return shard_engines(location)[0]
+        return super().get_bind(mapper, clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': LocationSession})
+
+# Every route goes through the engines below: the default bind for normal
+# reads and writes, and a 'readonly' bind for report queries so long reads
+# never hold the write lock. Both are pooled and get their pragmas once per
+# connection instead of once per request.
+
+SQLITE_DEFAULTS = {
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    'SQLITE_CACHE_SIZE_KB': 20000,
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    'SQLITE_POOL_SIZE': 5,
+    'SQLITE_MAX_OVERFLOW': 10,
+}
+
+
+def configure_database(app, path):
+    for key, value in SQLITE_DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+    uri = f"sqlite:///{path}"
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config.setdefault('SQLALCHEMY_BINDS', {})['readonly'] = uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _engine_options(app.config)
+
+    db.init_app(app)
+
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            _listen(engine, app.config, readonly=bind == 'readonly')
+
+    # Opt-in X-Query-Count response header, handy for checking that a page
+    # does not issue more statements than expected.
+    app.config.setdefault('QUERY_COUNT_HEADER', False)
+
+    @app.after_request
+    def add_query_count(response):
+        if app.config['QUERY_COUNT_HEADER']:
+            response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+        return response
+
+
+def _engine_options(config):
+    return {
+        'pool_size': config['SQLITE_POOL_SIZE'],
+        'max_overflow': config['SQLITE_MAX_OVERFLOW'],
+        'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000},
+    }
+
+
+def _listen(engine, config, readonly):
+    event.listen(engine, 'connect', _pragma_listener(config, readonly=readonly))
+    event.listen(engine, 'before_cursor_execute', _count_query)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def _pragma_listener(config, readonly):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+        cursor.execute(f"PRAGMA cache_size = -{int(config['SQLITE_CACHE_SIZE_KB'])}")
+        cursor.execute(f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}")
+        if readonly:
+            cursor.execute("PRAGMA query_only = ON")
+            dbapi_connection.row_factory = sqlite3.Row
+        else:
+            # WAL lets readers keep going while a writer commits.
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.close()
+    return set_pragmas
+
+
+# Location shards. Each location keeps its ledger in its own database file,
+# listed in the home database's location table; the home database itself
+# holds users and serves everyone without a location (location None).
+# Engines for a shard are created on first use and kept for the process.
+
+_shards = {}
+_shards_lock = threading.Lock()
+
+
+def current_location():
+    """The location id statements are routed to; None means the home database."""
+    if 'location' in g:
+        return g.location
+    return current_app.config.get('LOCATION')
+
+
+def shard_engines(location_id):
+    """(write, readonly) engines for a location's shard database."""
+    engines = _shards.get(location_id)
+    if engines is not None:
+        return engines
+
+    with _shards_lock:
+        engines = _shards.get(location_id)
+        if engines is None:
+            with db.engine.connect() as conn:
+                path = conn.execute(
+                    text("SELECT db_path FROM location WHERE id = :id"), {"id": location_id}
+                ).scalar()
+            if path is None:
+                raise LookupError(f"Unknown location: {location_id!r}")
+
+            config = current_app.config
+            engines = tuple(
+                create_engine(f"sqlite:///{path}", **_engine_options(config)) for _ in range(2)
+            )
+            for engine, readonly in zip(engines, (False, True)):
+                _listen(engine, config, readonly)
+                if current_app.extensions.get('metrics_enabled'):
+                    from .metrics import instrument_engine
+                    instrument_engine(engine)
+            _shards[location_id] = engines
+    return engines
+
+
+def home_bind():
+    """bind_arguments for the user and location tables, which only the home database has."""
+    return {'bind': db.engine}
+
+
+@contextmanager
+def location_context(location_id, app=None):
+    """A fresh app context whose session and read connections use one location.
+
+    Pass app when calling from a thread that has no app context of its own.
+    """
+    app = app or current_app._get_current_object()
+    with app.app_context():
+        g.location = location_id
+        try:
+            yield
+        finally:
+            db.session.remove()
+
+
+@contextmanager
+def read_connection():
+    """A pooled, query-only DB-API connection with sqlite3.Row rows."""
+    location = current_location()
+    engine = db.engines['readonly'] if location is None else shard_engines(location)[1]
+    conn = engine.raw_connection()
+    try:
+        if current_app.extensions.get('metrics_enabled'):
+            # Raw DB-API statements skip the engine events, so time them here.
+            from .metrics import TimedConnection
+            yield TimedConnection(conn)
+        else:
+            yield conn
+    finally:
+        conn.close()
@@ -0,0 +1,155 @@
+import math
+import threading
+from array import array
+from datetime import date, timedelta
+from flask import current_app
+from sqlalchemy import text
+from .extensions import current_location, db
+from .stock import OUT_TYPES
+from .versions import LEDGER, REFERENCE, current_version
+
+# Reorder points and stock-out dates for every (item, unit) at once.
+#
+# One grouped query over the daily_item_summary rollup returns, per key,
+# the on-hand quantity and three sums of the daily out-quantity (sales +
+# consumption + waste) over the look-back window: the total, the sum of
+# squares and the total of the short window. Days without activity are
+# zeros, so mean and variance come straight from those sums without
+# building a day-by-day series in Python. The arithmetic then runs column
+# by column over flat arrays instead of per-item objects:
+#
+#   usage          max(short, long moving average) per day, so a recent
+#                  surge raises the reorder point at once while a lull
+#                  does not drop it
+#   safety stock   z * daily std dev * sqrt(lead time)
+#   reorder point  usage * lead time + safety stock
+#   days of cover  on hand / usage
+#   order qty      up to usage * (lead time + review period) + safety stock
+#
+# Results are cached per location until the next ledger or reference write.
+
+FORECAST_SQL = """
+    WITH daily AS (
+        SELECT item_id, unit_id, date, SUM(quantity) AS out_quantity
+        FROM daily_item_summary
+        WHERE action_type IN ({out_types}) AND date > :start AND date <= :end
+        GROUP BY item_id, unit_id, date
+    )
+    SELECT
+        s.item_id, s.unit_id, i.name AS item_name, u.name AS unit_name, s.net_quantity,
+        COALESCE(SUM(d.out_quantity), 0) AS total,
+        COALESCE(SUM(d.out_quantity * d.out_quantity), 0) AS total_squares,
+        COALESCE(SUM(CASE WHEN d.date > :short_start THEN d.out_quantity END), 0) AS short_total
+    FROM stock_balance s
+    JOIN item i ON s.item_id = i.id
+    JOIN unit u ON s.unit_id = u.id
+    LEFT JOIN daily d ON d.item_id = s.item_id AND d.unit_id = s.unit_id
+    GROUP BY s.item_id, s.unit_id
+""".format(out_types=", ".join(f"'{t}'" for t in OUT_TYPES))
+
+_lock = threading.Lock()
+_cached = {}  # location -> (key, Forecast)
+
+
+def settings():
+    config = current_app.config
+    return (
+        config['FORECAST_WINDOW_DAYS'],
+        config['FORECAST_SHORT_WINDOW_DAYS'],
+        config['REORDER_LEAD_DAYS'],
+        config['REORDER_REVIEW_DAYS'],
+        config['REORDER_SERVICE_Z'],
+    )
+
+
+class Forecast:
+    """Column arrays, one position per (item, unit)."""
+
+    def __init__(self, rows, today, window, short_window, lead_days, review_days, z):
+        self.today = today
+        self.window = window
+        self.item_ids = array('q', (row.item_id for row in rows))
+        self.unit_ids = array('q', (row.unit_id for row in rows))
+        self.item_names = [row.item_name for row in rows]
+        self.unit_names = [row.unit_name for row in rows]
+        on_hand = array('d', (float(row.net_quantity or 0) for row in rows))
+        total = array('d', (float(row.total) for row in rows))
+        squares = array('d', (float(row.total_squares) for row in rows))
+        short_total = array('d', (float(row.short_total) for row in rows))
+
+        average = array('d', (t / window for t in total))
+        short_average = array('d', (t / short_window for t in short_total))
+        usage = array('d', map(max, average, short_average))
+        deviation = array('d', (
+            math.sqrt(max(s / window - a * a, 0.0)) for s, a in zip(squares, average)
+        ))
+        safety = array('d', (z * d * math.sqrt(lead_days) for d in deviation))
+        reorder_point = array('d', (u * lead_days + s for u, s in zip(usage, safety)))
+        order_up_to = array('d', (u * (lead_days + review_days) + s for u, s in zip(usage, safety)))
+
+        self.on_hand = on_hand
+        self.usage = usage
+        self.average = average
+        self.short_average = short_average
+        self.safety_stock = safety
+        self.reorder_point = reorder_point
+        # inf where nothing is used: never runs out at the current rate.
+        self.days_of_cover = array('d', (
+            max(h, 0.0) / u if u > 0 else math.inf for h, u in zip(on_hand, usage)
+        ))
+        self.order_quantity = array('d', (
+            max(t - h, 0.0) if h <= r and u > 0 else 0.0
+            for t, h, r, u in zip(order_up_to, on_hand, reorder_point, usage)
+        ))
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def low_stock(self):
+        """Positions at or below their reorder point, soonest stock-out first."""
+        positions = [
+            i for i in range(len(self))
+            if self.usage[i] > 0 and self.on_hand[i] <= self.reorder_point[i]
+        ]
+        positions.sort(key=lambda i: self.days_of_cover[i])
+        return positions
+
+    def row(self, i):
+        cover = self.days_of_cover[i]
+        finite = not math.isinf(cover)
+        return {
+            'item_id': self.item_ids[i],
+            'item_name': self.item_names[i],
+            'unit_id': self.unit_ids[i],
+            'unit_name': self.unit_names[i],
+            'on_hand': round(self.on_hand[i], 2),
+            'daily_usage': round(self.usage[i], 3),
+            'average_usage': round(self.average[i], 3),
+            'recent_usage': round(self.short_average[i], 3),
+            'safety_stock': round(self.safety_stock[i], 2),
+            'reorder_point': round(self.reorder_point[i], 2),
+            'days_of_cover': round(cover, 1) if finite else None,
+            'stockout_date': (self.today + timedelta(days=int(cover))).isoformat() if finite else None,
+            'order_quantity': round(self.order_quantity[i], 2),
+        }
+
+
+def forecast():
+    """The Forecast for the current location, rebuilt after ledger or reference writes."""
+    location = current_location()
+    today = date.today()
+    key = (current_version(LEDGER), current_version(REFERENCE), today, settings())
+    cached_key, result = _cached.get(location, (None, None))
+    if result is not None and cached_key == key:
+        return result
+
+    window, short_window, lead_days, review_days, z = key[3]
+    rows = db.session.execute(text(FORECAST_SQL), {
+        "start": (today - timedelta(days=window)).isoformat(),
+        "short_start": (today - timedelta(days=short_window)).isoformat(),
+        "end": today.isoformat(),
+    }).fetchall()
+    result = Forecast(rows, today, window, short_window, lead_days, review_days, z)
+    with _lock:
+        _cached[location] = (key, result)
+    return result
@@ -0,0 +1,162 @@
+import csv
+import io
+import json
+import time
+import click
+from flask.cli import AppGroup
+from .extensions import db
+from .dates import canonical_date
+from .ledger import ACTION_TYPES, insert_actions, validate_amounts
+from .lookups import reference_lists
+
+# Bulk import of ledger rows (end-of-day POS sales, supplier invoices) from
+# CSV or JSON Lines. The file is read one line at a time and written in
+# executemany batches inside a single transaction.
+#
+# Each record needs date, action_type, quantity and price (may be empty),
+# plus category/item/unit either by name ("item") or by id ("item_id").
+
+DEFAULT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 200
+
+actions_cli = AppGroup('actions', help='Bulk operations on the actions ledger.')
+
+
+class NameLookup:
+    """Case-insensitive name -> id maps for categories, items and units, loaded once per import."""
+
+    TABLES = ('category', 'item', 'unit')
+
+    def __init__(self):
+        self.ids = {}
+        self.names = {}
+        lists = reference_lists()
+        for table in self.TABLES:
+            rows = lists[table]
+            self.ids[table] = {row.id for row in rows}
+            self.names[table] = {row.name.strip().lower(): row.id for row in rows}
+
+    def resolve(self, table, record):
+        if record.get(f'{table}_id') not in (None, ''):
+            try:
+                value = int(record[f'{table}_id'])
+            except (TypeError, ValueError):
+                raise ValueError(f"{table}_id must be an integer")
+            if value not in self.ids[table]:
+                raise ValueError(f"Unknown {table}_id {value}")
+            return value
+
+        name = str(record.get(table) or '').strip()
+        if not name:
+            raise ValueError(f"Missing {table}")
+        try:
+            return self.names[table][name.lower()]
+        except KeyError:
+            raise ValueError(f"Unknown {table} {name!r}")
+
+
+def read_records(stream, fmt):
+    """Yield (line_number, record) pairs without loading the whole file."""
+    lines = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, ValueError(f"Invalid JSON: {e.msg}")
+                continue
+            if not isinstance(record, dict):
+                record = ValueError("Each line must be a JSON object")
+            yield line_number, record
+    else:
+        raise ValueError(f"Unsupported format {fmt!r}; use csv or jsonl")
+
+
+def build_row(record, lookup):
+    # Same checks the action() form applies, plus name resolution.
+    if isinstance(record, ValueError):
+        raise record
+
+    action_type = str(record.get('action_type') or '').strip().lower()
+    if action_type not in ACTION_TYPES:
+        raise ValueError(f"Unknown action_type {action_type!r}")
+
+    quantity, price = validate_amounts(record.get('quantity'), record.get('price'))
+
+    return {
+        'date': canonical_date(str(record.get('date') or '')),
+        'action_type': action_type,
+        'category_id': lookup.resolve('category', record),
+        'item_id': lookup.resolve('item', record),
+        'unit_id': lookup.resolve('unit', record),
+        'quantity': quantity,
+        'price': price,
+        'photo_path': None,
+    }
+
+
+def format_from_filename(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def import_actions(stream, fmt, batch_size=DEFAULT_BATCH_SIZE):
+    started = time.perf_counter()
+    lookup = NameLookup()
+    imported = 0
+    error_count = 0
+    errors = []
+    batch = []
+
+    try:
+        for line_number, record in read_records(stream, fmt):
+            try:
+                batch.append(build_row(record, lookup))
+            except ValueError as e:
+                error_count += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'line': line_number, 'error': str(e)})
+                continue
+
+            if len(batch) >= batch_size:
+                insert_actions(batch)
+                imported += len(batch)
+                batch = []
+
+        insert_actions(batch)
+        imported += len(batch)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    elapsed = time.perf_counter() - started
+    return {
+        'imported': imported,
+        'failed': error_count,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(imported / elapsed, 1) if elapsed else None,
+    }
+
+
+@actions_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True)
+def import_command(path, fmt, batch_size):
+    """Import ledger rows from a CSV or JSONL file."""
+    with open(path, 'rb') as stream:
+        result = import_actions(stream, fmt or format_from_filename(path), batch_size)
+
+    for error in result['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(
+        f"Imported {result['imported']} rows, {result['failed']} failed, "
+        f"in {result['seconds']}s ({result['rows_per_sec']} rows/sec)."
+    )
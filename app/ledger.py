@@ -0,0 +1,80 @@
+import math
+from sqlalchemy import text
+from .extensions import db
+from .stock import apply_actions, refresh_key
+from .rollup import add_to_rollup, remove_from_rollup
+from .checkpoints import touch_checkpoints
+from .valuation import update_valuation, revalue_key
+from .versions import LEDGER, bump_version
+
+# Write path for the actions ledger, shared by the action() form, the
+# delete route and the bulk importer, so all of them apply the same
+# validation and keep stock_balance, daily_item_summary, the stock
+# checkpoints and the cost valuation in step.
+
+ACTION_TYPES = ('delivery', 'sales', 'consumption', 'waste')
+
+INSERT_ACTION_SQL = """
+    INSERT INTO actions (date, action_type, category_id, item_id, unit_id, quantity, price, photo_path)
+    VALUES (:date, :action_type, :category_id, :item_id, :unit_id, :quantity, :price, :photo_path)
+"""
+
+
+def validate_amounts(quantity, price):
+    """Return (quantity, price) as numbers, or raise ValueError with a user-facing message."""
+    try:
+        quantity = float(quantity)
+        price = float(price) if price not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError("Please enter valid numeric values for quantity and price.")
+    # float() accepts 'nan' and 'inf', which would poison every sum they reach.
+    if not math.isfinite(quantity) or (price is not None and not math.isfinite(price)):
+        raise ValueError("Please enter valid numeric values for quantity and price.")
+
+    if quantity <= 0:
+        raise ValueError("Quantity must be greater than 0.")
+    if price is not None and price <= 0:
+        raise ValueError("Price must be greater than 0.")
+    return quantity, price
+
+
+def validate_ids(category_id, item_id, unit_id):
+    """Return the ids as ints, or raise ValueError with a user-facing message."""
+    try:
+        ids = tuple(int(value) for value in (category_id, item_id, unit_id))
+    except (TypeError, ValueError):
+        raise ValueError("Please choose a category, item and unit for every row.")
+    if min(ids) <= 0:
+        raise ValueError("Please choose a category, item and unit for every row.")
+    return ids
+
+
+def insert_actions(rows):
+    # One executemany for the ledger and one for stock_balance; the caller
+    # owns the transaction.
+    if not rows:
+        return
+    db.session.execute(text(INSERT_ACTION_SQL), rows)
+    apply_actions(rows)
+    add_to_rollup(rows)
+    touch_checkpoints(rows)
+    update_valuation()
+    bump_version(LEDGER)
+
+
+def remove_action(action_id):
+    """Delete one ledger row and update the derived tables; returns the row or None."""
+    row = db.session.execute(
+        text("SELECT id, date, action_type, item_id, unit_id, quantity, price FROM actions WHERE id = :id"),
+        {"id": action_id}
+    ).fetchone()
+    if not row:
+        return None
+
+    db.session.execute(text("DELETE FROM actions WHERE id = :id"), {"id": action_id})
+    refresh_key(row.item_id, row.unit_id)
+    remove_from_rollup(row)
+    touch_checkpoints([row])
+    revalue_key(row.item_id, row.unit_id)
+    bump_version(LEDGER)
+    return row
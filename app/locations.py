@@ -0,0 +1,287 @@
+import os
+import sqlite3
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app, g, request
+from flask.cli import AppGroup
+from flask_login import current_user
+from sqlalchemy import text
+from .extensions import db, home_bind, location_context
+from .lookups import TABLES
+from .versions import USERS, bump_version
+
+# Locations (restaurants) and their ledger shards. The home database
+# (DATABASE_PATH) keeps users and the location table; every location's
+# ledger, reference lists and derived tables live in a database file of
+# their own, so each site has its own write lock and its own actions table.
+# Requests are routed to the logged-in user's location (extensions.py);
+# users without one, and CLI commands unless LOCATION is set, use the home
+# database as before.
+#
+# Group pages run the per-location aggregation on every shard in parallel
+# through location_pool and merge the results by item and unit name, since
+# ids are only meaningful inside one shard.
+
+locations_cli = AppGroup('locations', help='Manage locations and their shard databases.')
+
+Location = namedtuple('Location', 'id name db_path')
+GroupInventoryRow = namedtuple('GroupInventoryRow', 'item_name unit_name latest_date net_quantity total_price by_location')
+GroupItem = namedtuple('GroupItem', 'id name')
+
+# Base tables a new shard starts with; the migrations add everything else.
+SHARD_TABLES = ('category', 'item', 'unit', 'inventory', 'actions')
+
+LOCATION_DDL = """
+    CREATE TABLE IF NOT EXISTS location (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        db_path TEXT NOT NULL
+    )
+"""
+
+
+def install_locations():
+    # Only the home database has users; shards skip this migration's work.
+    has_users = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user'")
+    ).first()
+    if not has_users:
+        return
+    db.session.execute(text(LOCATION_DDL))
+    columns = {row.name for row in db.session.execute(text("PRAGMA table_info(user)"))}
+    if 'location_id' not in columns:
+        db.session.execute(text("ALTER TABLE user ADD COLUMN location_id INTEGER REFERENCES location (id)"))
+
+
+def all_locations():
+    """The home database first, then every location shard."""
+    rows = db.session.execute(
+        text("SELECT id, name, db_path FROM location ORDER BY name"), bind_arguments=home_bind()
+    ).fetchall()
+    home = Location(None, current_app.config['HOME_LOCATION_NAME'], current_app.config['DATABASE_PATH'])
+    return [home] + [Location(*row) for row in rows]
+
+
+def find_location(name):
+    row = db.session.execute(
+        text("SELECT id, name, db_path FROM location WHERE name = :name"),
+        {"name": name}, bind_arguments=home_bind()
+    ).fetchone()
+    return Location(*row) if row else None
+
+
+def create_shard(path, copy_reference=True):
+    """Create a shard file with the base tables, optionally seeded with the home reference lists."""
+    if os.path.exists(path):
+        raise click.ClickException(f"{path} already exists.")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS home", (current_app.config['DATABASE_PATH'],))
+        names = ", ".join(f"'{name}'" for name in SHARD_TABLES)
+        for (ddl,) in conn.execute(
+            f"SELECT sql FROM home.sqlite_master WHERE type = 'table' AND name IN ({names})"
+        ).fetchall():
+            conn.execute(ddl)
+        if copy_reference:
+            for table in TABLES:
+                conn.execute(f"INSERT INTO main.{table} (id, name) SELECT id, name FROM home.{table}")
+        conn.commit()
+        conn.execute("DETACH DATABASE home")
+    finally:
+        conn.close()
+
+
+def upgrade_locations():
+    from .migrations import upgrade
+
+    for location in all_locations()[1:]:
+        with location_context(location.id):
+            upgrade()
+
+
+class LocationPool:
+    """Runs a function once per location, in parallel, each inside that location's context.
+
+    SQLite releases the GIL while a statement runs, so on a multi-core host
+    the shards' aggregation queries overlap instead of queueing.
+    """
+
+    def __init__(self, workers=4):
+        self._executor = None
+        self.configure(workers)
+
+    def configure(self, workers):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='location')
+
+    def map(self, fn, locations):
+        app = current_app._get_current_object()
+
+        def run(location):
+            with location_context(location.id, app):
+                return fn(location)
+
+        return list(self._executor.map(run, locations))
+
+
+location_pool = LocationPool()
+
+
+def init_locations(app):
+    @app.before_request
+    def route_to_location():
+        if request.endpoint == 'static':
+            return
+        if current_user.is_authenticated and current_user.location_id is not None:
+            g.location = current_user.location_id
+
+
+def merge_inventory(results):
+    """[(location, inventory rows)] -> one row per (item, unit) summed over locations."""
+    merged = {}
+    for location, rows in results:
+        for item_name, unit_name, latest_date, quantity, value in rows:
+            key = (item_name, unit_name)
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = [latest_date, 0.0, 0.0, {}]
+            elif latest_date and (entry[0] is None or latest_date > entry[0]):
+                entry[0] = latest_date
+            quantity = float(quantity or 0)
+            entry[1] += quantity
+            entry[2] += float(value or 0)
+            entry[3][location.name] = quantity
+
+    rows = [
+        GroupInventoryRow(item_name, unit_name, latest_date, round(quantity, 1), round(value, 2), by_location)
+        for (item_name, unit_name), (latest_date, quantity, value, by_location) in merged.items()
+    ]
+    rows.sort(key=lambda row: row.latest_date or '', reverse=True)
+    return rows
+
+
+def _carry_forward(dates, series_dates, values):
+    # Report series are cumulative, so a location's value on a date it has
+    # no rows for is its last value before that date.
+    filled = []
+    i = 0
+    last = 0.0
+    for day in dates:
+        while i < len(series_dates) and series_dates[i] <= day:
+            last = values[i]
+            i += 1
+        filled.append(last)
+    return filled
+
+
+def merge_reports(reports):
+    """Combine item_report() results from several locations into one."""
+    reports = [report for report in reports if report]
+    if not reports:
+        return None
+
+    dates = sorted(set().union(*(report['dates'] for report in reports)))
+    action_types = sorted(set().union(*(report['action_types'] for report in reports)))
+    chart_data = {atype: [0.0] * len(dates) for atype in action_types}
+    balance_data = [0.0] * len(dates)
+    for report in reports:
+        for atype, values in report['chart_data'].items():
+            filled = _carry_forward(dates, report['dates'], values)
+            chart_data[atype] = [a + b for a, b in zip(chart_data[atype], filled)]
+        filled = _carry_forward(dates, report['dates'], report['balance_data'])
+        balance_data = [a + b for a, b in zip(balance_data, filled)]
+
+    latest = max(
+        (report for report in reports if report['latest_delivery_date']),
+        key=lambda report: report['latest_delivery_date'],
+        default=None,
+    )
+    on_hand = sum(report['on_hand'] for report in reports)
+    average_value = sum(report['average_value'] for report in reports)
+    return {
+        'dates': dates,
+        'action_types': action_types,
+        'chart_data': chart_data,
+        'balance_data': balance_data,
+        'total_spend': sum(report['total_spend'] for report in reports),
+        'latest_price_per_unit': latest['latest_price_per_unit'] if latest else 0,
+        'latest_delivery_date': latest['latest_delivery_date'] if latest else None,
+        'total_sold_consumed_wasted': sum(report['total_sold_consumed_wasted'] for report in reports),
+        'on_hand': on_hand,
+        'fifo_value': sum(report['fifo_value'] for report in reports),
+        'average_value': average_value,
+        'average_cost': average_value / on_hand if on_hand > 0 else 0,
+    }
+
+
+@locations_cli.command('add')
+@click.argument('name')
+@click.option('--path', default=None, help='Shard database file (default: LOCATIONS_DIR/location_<id>.db).')
+@click.option('--copy-reference/--no-copy-reference', default=True, show_default=True,
+              help='Start with the home categories, items and units.')
+def add_command(name, path, copy_reference):
+    """Create a location and its shard database."""
+    from .migrations import upgrade
+
+    if find_location(name):
+        raise click.ClickException(f"Location {name!r} already exists.")
+    location_id = db.session.execute(
+        text("INSERT INTO location (name, db_path) VALUES (:name, '') RETURNING id"),
+        {"name": name}, bind_arguments=home_bind()
+    ).scalar()
+    path = os.path.abspath(path or os.path.join(current_app.config['LOCATIONS_DIR'], f"location_{location_id}.db"))
+    db.session.execute(
+        text("UPDATE location SET db_path = :path WHERE id = :id"),
+        {"path": path, "id": location_id}, bind_arguments=home_bind()
+    )
+    try:
+        create_shard(path, copy_reference)
+    except Exception:
+        db.session.rollback()
+        raise
+    db.session.commit()
+
+    with location_context(location_id):
+        upgrade()
+    click.echo(f"Added location {location_id} {name!r} at {path}.")
+
+
+@locations_cli.command('list')
+def list_command():
+    """List locations with their shard files and user counts."""
+    counts = dict(db.session.execute(
+        text("SELECT location_id, COUNT(*) FROM user GROUP BY location_id"), bind_arguments=home_bind()
+    ).fetchall())
+    for location in all_locations():
+        label = location.id if location.id is not None else '-'
+        click.echo(f"{label}\t{location.name}\t{location.db_path}\t{counts.get(location.id, 0)} users")
+
+
+@locations_cli.command('assign')
+@click.argument('username')
+@click.argument('location', required=False)
+def assign_command(username, location):
+    """Move a user to a location; without LOCATION, back to the home database.
+
+    Bumps the 'users' version, so running app processes reload the user and
+    route it to the new location on its next request.
+    """
+    location_id = None
+    if location:
+        found = find_location(location)
+        if not found:
+            raise click.ClickException(f"Unknown location {location!r}.")
+        location_id = found.id
+    result = db.session.execute(
+        text("UPDATE user SET location_id = :location_id WHERE username = :username"),
+        {"location_id": location_id, "username": username}, bind_arguments=home_bind()
+    )
+    if not result.rowcount:
+        raise click.ClickException(f"Unknown user {username!r}.")
+    bump_version(USERS, bind_arguments=home_bind())
+    db.session.commit()
+    click.echo(f"{username} -> {location or current_app.config['HOME_LOCATION_NAME']}")
@@ -0,0 +1,48 @@
+import threading
+from sqlalchemy import text
+from .extensions import current_location, db
+from .versions import REFERENCE, current_version, bump_version
+
+# In-process cache of the category / item / unit lists used by the action,
+# setup and report pages. Every setup write bumps the 'reference' version in
+# cache_versions inside its own transaction; readers compare that one
+# integer against the version they cached, so all worker processes see a
+# change on their next request. Each location shard has its own lists and
+# counter, so entries are kept per location.
+
+TABLES = ('category', 'item', 'unit')
+
+_lock = threading.Lock()
+_cached = {}  # location -> (version, lists)
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def reference_lists():
+    """Return {'category': rows, 'item': rows, 'unit': rows}, each ordered by name."""
+    location = current_location()
+    version = current_version(REFERENCE)
+    cached_version, lists = _cached.get(location, (None, None))
+    if lists is not None and cached_version == version:
+        with _lock:
+            _stats['hits'] += 1
+        return lists
+
+    lists = {
+        table: db.session.execute(text(f"SELECT id, name FROM {table} ORDER BY name")).fetchall()
+        for table in TABLES
+    }
+    with _lock:
+        _stats['misses'] += 1
+        _cached[location] = (version, lists)
+    return lists
+
+
+def bump_reference_version():
+    bump_version(REFERENCE)
+    with _lock:
+        _stats['invalidations'] += 1
+
+
+def cache_stats():
+    with _lock:
+        return dict(_stats, version=_cached.get(current_location(), (None, None))[0])
@@ -0,0 +1,220 @@
+import logging
+import threading
+import time
+from flask import Response, abort, g, has_request_context, request
+from flask_login import login_required
+from sqlalchemy import event
+from .extensions import db
+
+# Request and SQL instrumentation, exported in Prometheus text format at
+# /metrics. With METRICS_ENABLED off nothing below is registered, so the
+# request path carries no extra work.
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+            for label_values, (counts, total, count) in items:
+                labels = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values)]
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, counts):
+                    cumulative += bucket
+                    le = ",".join(labels + [f'le="{bound}"'])
+                    lines.append(f"{self.name}_bucket{{{le}}} {cumulative}")
+                le = ",".join(labels + ['le="+Inf"'])
+                lines.append(f"{self.name}_bucket{{{le}}} {count}")
+                suffix = "{" + ",".join(labels) + "}" if labels else ""
+                lines.append(f"{self.name}_sum{suffix} {total}")
+                lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_latency = Histogram(
+    'inventory_http_request_duration_seconds', 'Request latency by endpoint.',
+    LATENCY_BUCKETS, ('endpoint', 'method', 'status'))
+request_sql_count = Histogram(
+    'inventory_sql_statements_per_request', 'SQL statements issued per request.',
+    COUNT_BUCKETS, ('endpoint',))
+request_sql_time = Histogram(
+    'inventory_sql_seconds_per_request', 'Time spent in SQL per request.',
+    LATENCY_BUCKETS, ('endpoint',))
+statement_latency = Histogram(
+    'inventory_sql_statement_duration_seconds', 'Latency of individual SQL statements.',
+    LATENCY_BUCKETS)
+slow_queries = Counter('inventory_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.')
+
+_settings = {'slow_query_seconds': 0.2}
+
+
+def record_statement(elapsed, statement, explain=None, counted=False):
+    """Record one statement; explain() is only called for slow SELECTs to log their plan."""
+    statement_latency.observe(elapsed)
+    if has_request_context():
+        if not counted:
+            g.query_count = g.get('query_count', 0) + 1
+        g.sql_time = g.get('sql_time', 0.0) + elapsed
+    if elapsed >= _settings['slow_query_seconds']:
+        slow_queries.inc()
+        plan = None
+        if explain and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            try:
+                plan = [row[-1] for row in explain()]
+            except Exception:
+                plan = None
+        log.warning("Slow query (%.1f ms): %s\nplan: %s", elapsed * 1000, " ".join(statement.split()), plan)
+
+
+class TimedConnection:
+    """Wraps a DB-API connection used outside SQLAlchemy so its statements are measured too."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        cursor = self._conn.execute(sql, params)
+        record_statement(
+            time.perf_counter() - started, sql,
+            lambda: self._conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        )
+        return cursor
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    # The plan is fetched on the DB-API connection so it doesn't re-enter these events.
+    explain = None
+    if not executemany:
+        explain = lambda: cursor.connection.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    # extensions._count_query already counted this statement for the request.
+    record_statement(elapsed, statement, explain, counted=True)
+
+
+def instrument_engine(engine):
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def render_metrics():
+    from .lookups import cache_stats
+    from .users import user_cache
+    from .writer import action_writer
+
+    lines = []
+    for metric in (request_latency, request_sql_count, request_sql_time, statement_latency, slow_queries):
+        lines.extend(metric.render())
+
+    reference = cache_stats()
+    users = user_cache.stats()
+    for name, help, value in (
+        ('inventory_reference_cache_hits_total', 'Reference list cache hits.', reference['hits']),
+        ('inventory_reference_cache_misses_total', 'Reference list cache misses.', reference['misses']),
+        ('inventory_user_cache_hits_total', 'User loader cache hits.', users['hits']),
+        ('inventory_user_cache_misses_total', 'User loader cache misses.', users['misses']),
+    ):
+        lines.extend([f"# HELP {name} {help}", f"# TYPE {name} counter", f"{name} {value}"])
+
+    writer = action_writer.stats()
+    for name, help, kind, value in (
+        ('inventory_write_batches_total', 'Group-commit batches written.', 'counter', writer['batches']),
+        ('inventory_write_rows_total', 'Action rows written through the write queue.', 'counter', writer['rows']),
+        ('inventory_write_retries_total', 'Batch retries after lock contention.', 'counter', writer['retries']),
+        ('inventory_write_failures_total', 'Submissions that failed to commit.', 'counter', writer['failures']),
+        ('inventory_write_queue_depth', 'Submissions waiting for the writer.', 'gauge', writer['queued']),
+    ):
+        lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
+
+
+def init_metrics(app):
+    app.config.setdefault('METRICS_ENABLED', True)
+    app.config.setdefault('SLOW_QUERY_MS', 200)
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.extensions['metrics_enabled'] = app.config['METRICS_ENABLED']
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    _settings['slow_query_seconds'] = app.config['SLOW_QUERY_MS'] / 1000
+
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_engine(engine)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        if started is None or request.endpoint == 'metrics':
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        request_latency.observe(time.perf_counter() - started, endpoint, request.method, str(response.status_code))
+        request_sql_count.observe(g.get('query_count', 0), endpoint)
+        request_sql_time.observe(g.get('sql_time', 0.0), endpoint)
+        return response
+
+    def metrics():
+        token = app.config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            abort(401)
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    if not app.config['METRICS_TOKEN']:
+        # Without a scrape token the page is for logged-in users only.
+        metrics = login_required(metrics)
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,339 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from .extensions import db
+from .dates import canonical_date
+
+# Versioned schema changes for inventory.db. Each migration runs once, in
+# order, and is recorded in schema_migrations. upgrade() is called from
+# create_app(), and 'flask schema upgrade' runs the same thing by hand.
+# Location shards get the same migrations; upgrade() works on whichever
+# database the session is routed to (LOCATION=<id> for the CLI).
+#
+# Several workers may boot at once, so each migration runs under BEGIN
+# IMMEDIATE and re-reads schema_migrations once it holds the write lock;
+# the workers that lose the race wait, then find the migration applied.
+
+schema_cli = AppGroup('schema', help='Schema migrations and query plan checks.')
+
+
+def _canonical_action_dates():
+    rows = db.session.execute(
+        text("SELECT id, date FROM actions WHERE date IS NOT date(date)")
+    ).fetchall()
+    for row in rows:
+        try:
+            fixed = canonical_date(str(row.date))
+        except ValueError:
+            current_app.logger.warning("actions.id=%s has an unparseable date %r", row.id, row.date)
+            continue
+        db.session.execute(
+            text("UPDATE actions SET date = :date WHERE id = :id"),
+            {"date": fixed, "id": row.id}
+        )
+
+    # Keep new rows canonical; date() returns NULL for anything it can't parse.
+    for event in ("INSERT", "UPDATE OF date"):
+        name = "actions_canonical_date_" + event.split()[0].lower()
+        db.session.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS {name}
+            BEFORE {event} ON actions
+            WHEN NEW.date IS NOT date(NEW.date)
+            BEGIN
+                SELECT RAISE(ABORT, 'actions.date must be YYYY-MM-DD');
+            END
+        """))
+
+
+def _ledger_indexes():
+    # Covers the per-item report query (filter, group and sum) without
+    # touching the table.
+    db.session.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_actions_item_date
+        ON actions (item_id, date, action_type, quantity, price)
+    """))
+    # Per (item, unit) lookups: stock_balance refresh and latest delivery.
+    db.session.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_actions_item_unit_type_date
+        ON actions (item_id, unit_id, action_type, date)
+    """))
+    # The action log is listed newest first.
+    db.session.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_actions_date_id
+        ON actions (date, id)
+    """))
+
+
+def _stock_balance():
+    from .stock import rebuild_stock_balance
+
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS stock_balance (
+            item_id INTEGER NOT NULL,
+            unit_id INTEGER NOT NULL,
+            net_quantity REAL NOT NULL DEFAULT 0,
+            latest_date DATE,
+            latest_delivery_date DATE,
+            latest_unit_price REAL,
+            PRIMARY KEY (item_id, unit_id)
+        )
+    """))
+    rebuild_stock_balance()
+
+
+def _action_log_indexes():
+    # Keyset pages of the action log filtered by item or category walk these
+    # in (date, id) order; the rowid is the implicit last column.
+    db.session.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_actions_item_log
+        ON actions (item_id, date)
+    """))
+    db.session.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_actions_category_log
+        ON actions (category_id, date)
+    """))
+
+
+def _cache_versions():
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """))
+
+
+def _cache_versions_updated_at():
+    db.session.execute(text("ALTER TABLE cache_versions ADD COLUMN updated_at TEXT"))
+    db.session.execute(text("UPDATE cache_versions SET updated_at = CURRENT_TIMESTAMP"))
+
+
+def _daily_item_summary():
+    from .rollup import ROLLUP_DDL, ROLLUP_DATE_INDEX, rebuild_rollup
+
+    db.session.execute(text(ROLLUP_DDL))
+    db.session.execute(text(ROLLUP_DATE_INDEX))
+    rebuild_rollup()
+
+
+def _stock_checkpoints():
+    from .checkpoints import CHECKPOINT_DDL, extend_checkpoints
+
+    for ddl in CHECKPOINT_DDL:
+        db.session.execute(text(ddl))
+    extend_checkpoints()
+
+
+def _stock_valuation():
+    from .valuation import VALUATION_DDL, rebuild_valuation
+
+    for ddl in VALUATION_DDL:
+        db.session.execute(text(ddl))
+    rebuild_valuation()
+
+
+def _change_log():
+    from .changes import install_change_log
+
+    install_change_log()
+
+
+def _locations():
+    from .locations import install_locations
+
+    install_locations()
+
+
+def _valuation_head_seq():
+    columns = {row.name for row in db.session.execute(text("PRAGMA table_info(stock_valuation)"))}
+    if 'head_seq' not in columns:
+        db.session.execute(text("ALTER TABLE stock_valuation ADD COLUMN head_seq INTEGER NOT NULL DEFAULT 0"))
+    db.session.execute(text("""
+        UPDATE stock_valuation SET head_seq = COALESCE(
+            (SELECT MIN(seq) FROM cost_layer c
+             WHERE c.item_id = stock_valuation.item_id AND c.unit_id = stock_valuation.unit_id),
+            next_seq
+        )
+    """))
+
+
+def _drop_item_date_index():
+    # The reports read daily_item_summary now; nothing plans through this
+    # covering index any more, and every ledger insert paid to maintain it.
+    db.session.execute(text("DROP INDEX IF EXISTS idx_actions_item_date"))
+
+
+def _valued_checkpoints():
+    # Checkpoints are derived data: rebuild them in the new shape.
+    from .checkpoints import CHECKPOINT_DDL, extend_checkpoints
+
+    db.session.execute(text("DROP TABLE IF EXISTS stock_checkpoint"))
+    db.session.execute(text("DROP TABLE IF EXISTS stock_checkpoint_layer"))
+    db.session.execute(text("DELETE FROM stock_checkpoint_period"))
+    for ddl in CHECKPOINT_DDL:
+        db.session.execute(text(ddl))
+    extend_checkpoints()
+
+
+MIGRATIONS = [
+    (1, 'canonical action dates', _canonical_action_dates),
+    (2, 'ledger indexes', _ledger_indexes),
+    (3, 'stock_balance table', _stock_balance),
+    (4, 'action log indexes', _action_log_indexes),
+    (5, 'cache_versions table', _cache_versions),
+    (6, 'cache_versions.updated_at', _cache_versions_updated_at),
+    (7, 'daily_item_summary rollup', _daily_item_summary),
+    (8, 'stock checkpoints', _stock_checkpoints),
+    (9, 'FIFO and average cost valuation', _stock_valuation),
+    (10, 'change_log feed and triggers', _change_log),
+    (11, 'locations and user.location_id', _locations),
+    (12, 'stock_valuation.head_seq', _valuation_head_seq),
+    (13, 'drop idx_actions_item_date', _drop_item_date_index),
+    (14, 'checkpoint valuation and FIFO layers', _valued_checkpoints),
+]
+
+
+def applied_versions():
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+    return {row.version for row in db.session.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def _lock_database():
+    """Take SQLite's write lock for the session's transaction, waiting out other migrators."""
+    db.session.rollback()
+    while True:
+        try:
+            db.session.execute(text("BEGIN IMMEDIATE"))
+            return
+        except OperationalError as e:
+            # busy_timeout has already waited; a long migration elsewhere can outlast it.
+            db.session.rollback()
+            if 'locked' not in str(e):
+                raise
+            current_app.logger.info("Waiting for another process to finish migrating")
+
+
+def upgrade():
+    applied = applied_versions()
+    ran = []
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        _lock_database()
+        try:
+            applied = applied_versions()
+            if version in applied:
+                db.session.rollback()
+                continue
+            migrate()
+            db.session.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                {"version": version, "name": name}
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        ran.append((version, name))
+    db.session.commit()
+    return ran
+
+
+# Queries on the hot paths and the index each one must use. A plan that
+# falls back to a full scan of actions is reported by 'flask schema check-plans'.
+def hot_queries():
+    from .reporting import GROUPED_SQL, LATEST_DELIVERY_SQL, report_filters
+    from .stock import LEDGER_BALANCE_SQL, KEY_FILTER
+    from .action_log import LOG_SQL
+
+    where_sql, params = report_filters(1, "2000-01-01", "2100-01-01")
+    log_where = "1 = 1"
+    keyset = "(a.date, a.id) < (:cursor_date, :cursor_id)"
+    log_params = {"cursor_date": "2100-01-01", "cursor_id": 1, "limit": 51}
+    return [
+        (
+            'reports: grouped series',
+            GROUPED_SQL.format(where_sql=where_sql), params,
+            'PRIMARY KEY',
+        ),
+        (
+            'reports: latest delivery',
+            LATEST_DELIVERY_SQL.format(where_sql=where_sql), params,
+            'INDEX idx_actions_item_log',
+        ),
+        (
+            'stock_balance: refresh key',
+            LEDGER_BALANCE_SQL.format(key_filter=KEY_FILTER), {"item_id": 1, "unit_id": 1},
+            'INDEX idx_actions_item_unit_type_date',
+        ),
+        (
+            'action log: newest first',
+            LOG_SQL.format(where_sql=log_where + " AND " + keyset), log_params,
+            'INDEX idx_actions_date_id',
+        ),
+        (
+            'action log: one item',
+            LOG_SQL.format(where_sql=log_where + " AND a.item_id = :item_id AND " + keyset),
+            dict(log_params, item_id=1),
+            'INDEX idx_actions_item_log',
+        ),
+    ]
+
+
+def query_plan(sql, params):
+    connection = db.session.connection()
+    if isinstance(params, list):
+        params = tuple(params)
+    rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def check_query_plans():
+    failures = []
+    for name, sql, params, expected in hot_queries():
+        plan = query_plan(sql, params)
+        full_scan = any(
+            step.startswith(("SCAN actions", "SCAN daily_item_summary")) and "INDEX" not in step
+            for step in plan
+        )
+        if full_scan or not any(expected in step for step in plan):
+            failures.append((name, expected, plan))
+    return failures
+
+
+@schema_cli.command('upgrade')
+def upgrade_command():
+    """Apply pending migrations."""
+    ran = upgrade()
+    for version, name in ran:
+        click.echo(f"Applied {version}: {name}")
+    if not ran:
+        click.echo("Schema is up to date.")
+
+
+@schema_cli.command('status')
+def status_command():
+    """List migrations and whether they have been applied."""
+    applied = applied_versions()
+    for version, name, _ in MIGRATIONS:
+        mark = "x" if version in applied else " "
+        click.echo(f"[{mark}] {version}: {name}")
+
+
+@schema_cli.command('check-plans')
+def check_plans_command():
+    """Fail if a hot query no longer uses its index."""
+    failures = check_query_plans()
+    for name, expected, plan in failures:
+        click.echo(f"{name}: expected {expected!r}, got {plan}")
+    if failures:
+        raise SystemExit(1)
+    click.echo("All hot queries use their indexes.")
@@ -0,0 +1,54 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing runs on a small dedicated pool instead of the request
+# thread, so a burst of logins at shift change queues up here rather than
+# occupying every worker thread. hashlib's scrypt and pbkdf2 release the GIL,
+# so the pool threads really run in parallel with request handling.
+
+DEFAULT_METHOD = 'scrypt'
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full for longer than the wait timeout."""
+
+
+class PasswordHasher:
+    def __init__(self, method=DEFAULT_METHOD, workers=2, queue_limit=32, wait_timeout=10.0):
+        self._executor = None
+        self.configure(method, workers, queue_limit, wait_timeout)
+
+    def configure(self, method, workers, queue_limit, wait_timeout):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.method = method
+        self.wait_timeout = wait_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        # Running plus waiting jobs; beyond this callers block, then give up.
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._prefix = None
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise HashingBusy()
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        # Werkzeug hashes look like 'scrypt:32768:8:1$salt$hash'; the part
+        # before the first '$' is the full algorithm and cost profile.
+        if self._prefix is None:
+            self._prefix = self.hash('').split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,116 @@
+from .valuation import item_valuation
+
+OUT_TYPES = ('sales', 'consumption', 'waste')
+
+# Reads the daily_item_summary rollup (see rollup.py); it is already one
+# row per (item, date, unit, action_type), so this only folds units together.
+GROUPED_SQL = """
+    SELECT date, action_type, SUM(quantity) AS quantity, SUM(price) AS price
+    FROM daily_item_summary
+    WHERE {where_sql}
+    GROUP BY date, action_type
+    ORDER BY date
+"""
+
+LATEST_DELIVERY_SQL = """
+    SELECT price, quantity, date
+    FROM actions
+    WHERE {where_sql} AND action_type = 'delivery'
+    ORDER BY date DESC, id DESC
+    LIMIT 1
+"""
+
+
+def report_filters(item_id, start_date, end_date):
+    where_clauses = ["item_id = ?"]
+    params = [item_id]
+
+    if start_date:
+        where_clauses.append("date >= ?")
+        params.append(start_date)
+    if end_date:
+        where_clauses.append("date <= ?")
+        params.append(end_date)
+
+    return " AND ".join(where_clauses), params
+
+
+def item_report(conn, item_id, start_date="", end_date="", snapshot=None):
+    """Build the chart series and KPIs for one item in a single pass.
+
+    The rollup already groups the ledger into one row per (date,
+    action_type), so the Python loop below touches each group once instead
+    of rescanning every raw action for every date. With a ledger snapshot
+    (snapshot.py) the groups and the latest delivery come from its columns.
+    """
+    where_sql, params = report_filters(item_id, start_date, end_date)
+
+    grouped = snapshot.report_groups(item_id, start_date, end_date) if snapshot else None
+    if grouped is None:
+        snapshot = None
+        grouped = conn.execute(GROUPED_SQL.format(where_sql=where_sql), params).fetchall()
+
+    if not grouped:
+        return None
+
+    action_types = sorted({row[1] for row in grouped})
+    type_index = {atype: i for i, atype in enumerate(action_types)}
+
+    dates = []
+    chart_columns = [[] for _ in action_types]
+    balance_data = []
+
+    running = [0.0] * len(action_types)
+    cumulative_balance = 0.0
+    total_spend = 0.0
+    total_out = 0.0
+
+    for date, atype, quantity, price in grouped:
+        if not dates or dates[-1] != date:
+            # Close the previous day before opening a new one
+            if dates:
+                for i, column in enumerate(chart_columns):
+                    column.append(running[i])
+                balance_data.append(cumulative_balance)
+            dates.append(date)
+
+        quantity = float(quantity or 0)
+        running[type_index[atype]] += quantity
+        if atype == 'delivery':
+            cumulative_balance += quantity
+            total_spend += float(price or 0)
+        elif atype in OUT_TYPES:
+            cumulative_balance -= quantity
+            total_out += quantity
+
+    for i, column in enumerate(chart_columns):
+        column.append(running[i])
+    balance_data.append(cumulative_balance)
+
+    if snapshot:
+        latest = snapshot.latest_delivery(item_id, start_date, end_date)
+    else:
+        latest = conn.execute(LATEST_DELIVERY_SQL.format(where_sql=where_sql), params).fetchone()
+    if latest and latest[0] and float(latest[1]):
+        latest_price_per_unit = float(latest[0]) / float(latest[1])
+    else:
+        latest_price_per_unit = 0
+    latest_delivery_date = latest[2] if latest else None
+
+    # Current valuation, independent of the date range.
+    on_hand, fifo_value, average_value = item_valuation(conn, item_id)
+
+    return {
+        'dates': dates,
+        'action_types': action_types,
+        'chart_data': dict(zip(action_types, chart_columns)),
+        'balance_data': balance_data,
+        'total_spend': total_spend,
+        'latest_price_per_unit': latest_price_per_unit,
+        'latest_delivery_date': latest_delivery_date,
+        'total_sold_consumed_wasted': total_out,
+        'on_hand': on_hand,
+        'fifo_value': fifo_value,
+        'average_value': average_value,
+        'average_cost': average_value / on_hand if on_hand > 0 else 0,
+    }
@@ -0,0 +1,148 @@
+from sqlalchemy import text
+from .extensions import db
+
+# daily_item_summary holds one row per (item, date, unit, action_type) with
+# summed quantity and price. It is kept in step with the ledger by
+# insert_actions() / remove_action(), so per-day report series cost
+# days x items instead of the raw number of actions.
+
+ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS daily_item_summary (
+        item_id INTEGER NOT NULL,
+        date DATE NOT NULL,
+        unit_id INTEGER NOT NULL,
+        action_type VARCHAR(20) NOT NULL,
+        quantity REAL NOT NULL DEFAULT 0,
+        price REAL NOT NULL DEFAULT 0,
+        action_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (item_id, date, unit_id, action_type)
+    ) WITHOUT ROWID
+"""
+
+ROLLUP_DATE_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_daily_item_summary_date
+    ON daily_item_summary (date, item_id)
+"""
+
+REBUILD_SQL = """
+    INSERT INTO daily_item_summary (item_id, date, unit_id, action_type, quantity, price, action_count)
+    SELECT item_id, date, unit_id, action_type, SUM(quantity), SUM(COALESCE(price, 0)), COUNT(*)
+    FROM actions
+    GROUP BY item_id, date, unit_id, action_type
+"""
+
+UPSERT_SQL = """
+    INSERT INTO daily_item_summary (item_id, date, unit_id, action_type, quantity, price, action_count)
+    VALUES (:item_id, :date, :unit_id, :action_type, :quantity, :price, :action_count)
+    ON CONFLICT (item_id, date, unit_id, action_type) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        price = price + excluded.price,
+        action_count = action_count + excluded.action_count
+"""
+
+
+def rollup_key(row):
+    return (int(row['item_id']), row['date'], int(row['unit_id']), row['action_type'])
+
+
+def add_to_rollup(rows):
+    totals = {}
+    for row in rows:
+        key = rollup_key(row)
+        total = totals.setdefault(key, {
+            'item_id': key[0],
+            'date': key[1],
+            'unit_id': key[2],
+            'action_type': key[3],
+            'quantity': 0.0,
+            'price': 0.0,
+            'action_count': 0,
+        })
+        total['quantity'] += float(row['quantity'])
+        total['price'] += float(row['price'] or 0)
+        total['action_count'] += 1
+
+    if totals:
+        db.session.execute(text(UPSERT_SQL), list(totals.values()))
+
+
+def remove_from_rollup(row):
+    key = {
+        'item_id': row.item_id,
+        'date': row.date,
+        'unit_id': row.unit_id,
+        'action_type': row.action_type,
+    }
+    db.session.execute(text("""
+        UPDATE daily_item_summary
+        SET quantity = quantity - :quantity,
+            price = price - :price,
+            action_count = action_count - 1
+        WHERE item_id = :item_id AND date = :date AND unit_id = :unit_id AND action_type = :action_type
+    """), dict(key, quantity=float(row.quantity), price=float(row.price or 0)))
+    db.session.execute(text("""
+        DELETE FROM daily_item_summary
+        WHERE item_id = :item_id AND date = :date AND unit_id = :unit_id AND action_type = :action_type
+          AND action_count <= 0
+    """), key)
+
+
+def rebuild_rollup():
+    db.session.execute(text("DELETE FROM daily_item_summary"))
+    db.session.execute(text(REBUILD_SQL))
+
+
+def daily_series(conn, item_ids, start_date, end_date):
+    """Per (item, unit) columnar day series between two dates, read from the rollup.
+
+    Returns a list of dicts with 'dates', per action type quantity columns in
+    'quantity', a delivery 'spend' column and range 'totals'.
+    """
+    where_clauses = ["s.date >= ?", "s.date <= ?"]
+    params = [start_date, end_date]
+    if item_ids:
+        where_clauses.append(f"s.item_id IN ({', '.join('?' for _ in item_ids)})")
+        params.extend(item_ids)
+
+    rows = conn.execute(
+        f"""
+        SELECT s.item_id, i.name AS item_name, s.unit_id, u.name AS unit_name,
+               s.date, s.action_type, s.quantity, s.price
+        FROM daily_item_summary s
+        JOIN item i ON s.item_id = i.id
+        JOIN unit u ON s.unit_id = u.id
+        WHERE {' AND '.join(where_clauses)}
+        ORDER BY s.item_id, s.unit_id, s.date
+        """,
+        params
+    ).fetchall()
+
+    series = []
+    current = None
+    for item_id, item_name, unit_id, unit_name, date, action_type, quantity, price in rows:
+        if current is None or (current['item_id'], current['unit_id']) != (item_id, unit_id):
+            current = {
+                'item_id': item_id,
+                'item_name': item_name,
+                'unit_id': unit_id,
+                'unit_name': unit_name,
+                'dates': [],
+                'quantity': {},
+                'spend': [],
+                'totals': {},
+            }
+            series.append(current)
+        if not current['dates'] or current['dates'][-1] != date:
+            current['dates'].append(date)
+            current['spend'].append(0.0)
+            for column in current['quantity'].values():
+                column.append(0.0)
+
+        day = len(current['dates']) - 1
+        column = current['quantity'].setdefault(action_type, [0.0] * len(current['dates']))
+        column[day] += quantity
+        current['totals'][action_type] = current['totals'].get(action_type, 0.0) + quantity
+        if action_type == 'delivery':
+            current['spend'][day] += price
+
+    return series
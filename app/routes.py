@@ -1,42 +1,47 @@
-from flask import current_app, Blueprint, render_template, request, redirect, url_for, flash
-from .extensions import db
+from flask import current_app, Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
+from .extensions import db, home_bind, read_connection
+from .ledger import insert_actions, remove_action, validate_amounts, validate_ids, ACTION_TYPES
+from .reporting import item_report
+from .rollup import daily_series
+from .checkpoints import stock_as_of
+from .valuation import inventory_rows
+from .dates import canonical_date
+from .action_log import fetch_page, log_filters
+from .export import ACTIONS_EXPORT_SQL, INVENTORY_EXPORT_SQL, REPORT_EXPORT_SQL, item_date_filters, stream_csv
+from .importer import import_actions, format_from_filename
+from .lookups import reference_lists, bump_reference_version, cache_stats
+from .search import search_names
+from .changes import fetch_changes
+from .forecast import forecast
+from .snapshot import ledger_snapshot
+from .locations import GroupItem, all_locations, location_pool, merge_inventory, merge_reports
+from .users import User, get_user, user_cache
+from .passwords import password_hasher, HashingBusy
+from .writer import action_writer, WriteQueueBusy
+from .uploads import store_upload, thumbnail_url_path
+from .versions import LEDGER, REFERENCE, USERS, conditional, home_version
 from sqlalchemy import text
-from werkzeug.utils import secure_filename
-import os
-import sqlite3
 from collections import defaultdict
 from sqlalchemy.exc import IntegrityError
-from flask_login import UserMixin, logout_user, login_required, login_user, current_user
+from flask_login import logout_user, login_required, login_user, current_user
 from app import login_manager
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
 main = Blueprint('main', __name__)
-DB_PATH = "instance/inventory.db"
-
-class User(UserMixin):
-    def __init__(self, id, username, email, password_hash):
-        self.id = id
-        self.username = username
-        self.email = email
-        self.password_hash = password_hash
 
+@main.errorhandler(HashingBusy)
+@main.errorhandler(WriteQueueBusy)
+def hashing_busy(e):
+    flash("The server is busy, please try again in a moment.", "danger")
+    return redirect(request.url)
 
 @login_manager.user_loader
 def load_user(user_id):
-    result = db.session.execute(
-        text("SELECT id, username, email, password_hash FROM user WHERE id = :id"),
-        {"id": user_id}
-    ).fetchone()
-
-    if result:
-        return User(result.id, result.username, result.email, result.password_hash)
-    return None
+    return get_user(user_id)
 
 @main.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
-        print("Register POST received")  # debug
         username = request.form.get('username')
         email = request.form.get('email')
         password = request.form.get('password')
@@ -52,23 +57,23 @@ def register():
 
         user_exists = db.session.execute(
             text("SELECT id FROM user WHERE username = :username OR email = :email"),
-            {"username": username, "email": email}
+            {"username": username, "email": email}, bind_arguments=home_bind()
         ).fetchone()
 
         if user_exists:
             flash('Username or email already registered.', 'danger')
             return redirect(url_for('main.register'))
 
-        password_hash = generate_password_hash(password)
+        password_hash = password_hasher.hash(password)
 
         try:
             db.session.execute(
                 text("INSERT INTO user (username, email, password_hash) VALUES (:username, :email, :password_hash)"),
-                {"username": username, "email": email, "password_hash": password_hash}
+                {"username": username, "email": email, "password_hash": password_hash}, bind_arguments=home_bind()
             )
             db.session.commit()
         except Exception as e:
-            print("DB Insert Error:", e)
+            current_app.logger.exception("Registration insert failed for %s: %s", username, e)
             flash('An error occurred. Please try again.', 'danger')
             return redirect(url_for('main.register'))
 
@@ -85,66 +90,65 @@ def home():
 
 @main.route('/inventory')
 @login_required
+@conditional(LEDGER, REFERENCE, config=('VALUATION_METHOD',))
 def inventory():
-    query = text("""
-                WITH ranked_deliveries AS (
-                    SELECT 
-                        a.item_id,
-                        a.unit_id,
-                        a.price,
-                        a.quantity,
-                        a.date,
-                        ROW_NUMBER() OVER (PARTITION BY a.item_id, a.unit_id ORDER BY a.date DESC) AS rn
-                    FROM actions a
-                    WHERE a.action_type = 'delivery'
-                ),
-                latest_delivery AS (
-                    SELECT 
-                        item_id,
-                        unit_id,
-                        price,
-                        quantity
-                    FROM ranked_deliveries
-                    WHERE rn = 1
-                ),
-                inventory_summary AS (
-                    SELECT 
-                        item_id,
-                        unit_id,
-                        MAX(date) AS latest_date,
-                        SUM(CASE 
-                                WHEN action_type = 'delivery' THEN quantity
-                                WHEN action_type IN ('sales', 'consumption', 'waste') THEN -quantity
-                                ELSE 0 
-                            END) AS net_quantity
-                    FROM actions
-                    GROUP BY item_id, unit_id
-                )
-                SELECT 
-                    i.name AS item_name,
-                    u.name AS unit_name,
-                    s.latest_date,
-                    ROUND(s.net_quantity, 1) AS net_quantity,
-                    ROUND(s.net_quantity * (ld.price * 1.0 / NULLIF(ld.quantity, 0)), 2) AS total_price
-                FROM inventory_summary s
-                LEFT JOIN latest_delivery ld
-                    ON s.item_id = ld.item_id AND s.unit_id = ld.unit_id
-                JOIN item i ON s.item_id = i.id
-                JOIN unit u ON s.unit_id = u.id
-                ORDER BY s.latest_date DESC;
-
-    """)
-
-    inventory = db.session.execute(query).fetchall()
+    # ?as_of=YYYY-MM-DD shows stock at the close of that day, replayed from
+    # the nearest monthly checkpoint.
+    as_of = request.args.get('as_of', '')
+    as_of_error = None
+    if as_of:
+        try:
+            as_of = canonical_date(as_of)
+        except ValueError:
+            # Shown inline: the page is ETag-cached per query string, so a
+            # flash carried across a redirect could be lost to a 304.
+            as_of, as_of_error = '', "Please enter a valid date."
+    if as_of:
+        inventory = stock_as_of(as_of, current_app.config['VALUATION_METHOD'], ledger_snapshot())
+    else:
+        inventory = inventory_rows(current_app.config['VALUATION_METHOD'])
     total_inventory_price = sum(row.total_price for row in inventory if row.total_price)
     formatted_total_inventory = f"${total_inventory_price:,.2f}"
-    return render_template('inventory.html', inventory=inventory, total_inventory_price=total_inventory_price, formatted_total_inventory=formatted_total_inventory)
+    page = render_template('inventory.html', inventory=inventory, as_of=as_of, as_of_error=as_of_error, total_inventory_price=total_inventory_price, formatted_total_inventory=formatted_total_inventory)
+    return (page, 400) if as_of_error else page
+
+# Not conditional(): the forecast also moves with the calendar day, which
+# the ETag doesn't cover. forecast() is cached until the next ledger write.
+
+@main.route('/low-stock')
+@login_required
+def low_stock():
+    result = forecast()
+    rows = [result.row(i) for i in result.low_stock()]
+    return render_template(
+        'low_stock.html',
+        rows=rows,
+        tracked=len(result),
+        window=current_app.config['FORECAST_WINDOW_DAYS'],
+        lead_days=current_app.config['REORDER_LEAD_DAYS']
+    )
+
+@main.route('/api/forecast')
+@login_required
+def forecast_api():
+    # ?all=1 returns every (item, unit), not only those at or below their reorder point.
+    result = forecast()
+    positions = range(len(result)) if request.args.get('all') else result.low_stock()
+    return jsonify({
+        "as_of": result.today.isoformat(),
+        "window_days": result.window,
+        "items": [result.row(i) for i in positions],
+    })
 
 @main.route('/action', methods=['GET', 'POST'])
 @login_required
 def action():
     if request.method == 'POST':
-        date = request.form['date']
+        try:
+            date = canonical_date(request.form['date'])
+        except ValueError:
+            flash("Please enter a valid date.", "danger")
+            return redirect(url_for('main.action'))
         action_type = request.form['action_type']
         category_ids = request.form.getlist('category_id[]')
         item_ids = request.form.getlist('item_id[]')
@@ -155,28 +159,18 @@ def action():
 
         photo_path = None
         if photo and photo.filename:
-            filename = secure_filename(photo.filename)
-            photo_dir = os.path.join(current_app.root_path, 'static/uploads')
-            os.makedirs(photo_dir, exist_ok=True)
-            photo.save(os.path.join(photo_dir, filename))
-            photo_path = f'static/uploads/{filename}'
+            photo_path = store_upload(photo)
 
+        rows = []
         for category_id, item_id, unit_id, quantity, price in zip(category_ids, item_ids, unit_ids, quantities, prices):
             try:
-                if float(quantity) <= 0:  
-                    flash("Quantity must be greater than 0.", "danger")
-                    return redirect(url_for('main.action'))
-                if price and float(price) <= 0:
-                    flash("Price must be greater than 0.", "danger")
-                    return redirect(url_for('main.action')) 
-            except ValueError:
-                flash("Please enter valid numeric value for qunatity and pricec", "danger")
-                return redirect(url_for('main.action')) 
-                             
-            db.session.execute(text("""
-                INSERT INTO actions (date, action_type, category_id, item_id, unit_id, quantity, price, photo_path)
-                VALUES (:date, :action_type, :category_id, :item_id, :unit_id, :quantity, :price, :photo_path)
-            """), {
+                category_id, item_id, unit_id = validate_ids(category_id, item_id, unit_id)
+                quantity, price = validate_amounts(quantity, price)
+            except ValueError as e:
+                flash(str(e), "danger")
+                return redirect(url_for('main.action'))
+
+            rows.append({
                 'date': date,
                 'action_type': action_type,
                 'category_id': category_id,
@@ -187,22 +181,128 @@ def action():
                 'photo_path': photo_path
             })
 
-        db.session.commit()
+        if current_app.config['WRITE_QUEUE_ENABLED']:
+            # Committed together with other requests' rows; returns once durable.
+            action_writer.write(rows)
+        else:
+            insert_actions(rows)
+            db.session.commit()
         return redirect(url_for('main.action'))
-    categories = db.session.execute(text("SELECT id, name FROM category ORDER BY name")).fetchall()
-    items = db.session.execute(text("SELECT id, name FROM item ORDER BY name")).fetchall()
-    units = db.session.execute(text("SELECT id, name FROM unit ORDER by name")).fetchall()
+    # Categories and items are looked up through /api/search; only the short
+    # unit list is rendered into the page.
+    units = reference_lists()['unit']
+
+    return render_template('action.html', units=units, action_types=ACTION_TYPES)
+
+def static_url(path):
+    return url_for('static', filename=path.split('static/', 1)[1]) if path else None
+
+@main.route('/action/log')
+@login_required
+def action_log():
+    try:
+        rows, next_cursor = fetch_page(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "rows": [
+            {
+                "id": r.id,
+                "date": r.date,
+                "action_type": r.action_type,
+                "category_name": r.category_name,
+                "item_name": r.item_name,
+                "unit_name": r.unit_name,
+                "quantity": r.quantity,
+                "price": r.price,
+                "photo_url": static_url(r.photo_path),
+                "thumb_url": static_url(thumbnail_url_path(r.photo_path)),
+            }
+            for r in rows
+        ],
+        "next_cursor": next_cursor,
+    })
+
+
+def csv_response(sql, params, filename):
+    return Response(
+        stream_with_context(stream_csv(sql, params)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+@main.route('/export/actions.csv')
+@login_required
+def export_actions():
+    # Same filters as /action/log and reports: item_id, category_id, unit_id,
+    # action_type, start_date, end_date. Oldest first.
+    try:
+        where_clauses, params = log_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return csv_response(ACTIONS_EXPORT_SQL.format(where_sql=" AND ".join(where_clauses)), params, 'actions.csv')
 
-    actions = db.session.execute(text("""
-        SELECT a.id, a.date, a.action_type, c.name as category_name, i.name AS item_name, u.name AS unit_name, a.quantity, a.price, a.photo_path
-        FROM actions a
-        JOIN category c ON a.category_id = c.id
-        JOIN item i ON a.item_id = i.id
-        JOIN unit u ON a.unit_id = u.id
-        ORDER BY a.date DESC
-    """)).fetchall()
 
-    return render_template('action.html', categories=categories, items=items, units=units, actions=actions)
+@main.route('/export/inventory.csv')
+@login_required
+def export_inventory():
+    try:
+        where_sql, params = item_date_filters(request.args, 's', with_dates=False)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return csv_response(INVENTORY_EXPORT_SQL.format(where_sql=where_sql), params, 'inventory.csv')
+
+
+@main.route('/export/reports.csv')
+@login_required
+def export_reports():
+    # Daily per item / unit / action type totals; item_id may repeat.
+    try:
+        where_sql, params = item_date_filters(request.args, 's')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return csv_response(REPORT_EXPORT_SQL.format(where_sql=where_sql), params, 'report.csv')
+
+@main.route('/action/import', methods=['POST'])
+@login_required
+def import_action_file():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({"error": "No file uploaded."}), 400
+
+    fmt = request.form.get('format') or format_from_filename(upload.filename)
+    try:
+        result = import_actions(upload.stream, fmt)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+@main.route('/api/search')
+@login_required
+def search():
+    # ?type=item|category|unit&q=tom&limit=10
+    try:
+        results = search_names(request.args.get('type', 'item'), request.args.get('q', ''), request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"results": results})
+
+@main.route('/changes')
+@login_required
+def changes():
+    # ?since=<cursor>&limit=N; pass next_cursor back as since to continue.
+    try:
+        rows, next_cursor, has_more = fetch_changes(request.args.get('since'), request.args.get('limit'))
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers."}), 400
+    return jsonify({"changes": rows, "next_cursor": next_cursor, "has_more": has_more})
+
+@main.route('/cache/stats')
+@login_required
+def reference_cache_stats():
+    return jsonify({"reference": cache_stats(), "users": user_cache.stats()})
 
 @main.route('/action/delete', methods=['POST'])
 @login_required
@@ -212,10 +312,7 @@ def delete_action():
         flash('No action selected to delete.', 'danger')
         return redirect(url_for('main.action'))
 
-    db.session.execute(
-        text("DELETE FROM actions WHERE id = :id"),
-        {"id": action_id}
-    )
+    remove_action(action_id)
     db.session.commit()
     return redirect(url_for('main.action'))
 
@@ -235,6 +332,7 @@ def inventory_setup():
                     db.session.execute(
                         text("INSERT INTO item (name) VALUES (:name)"), {"name": name}
                     )
+                    bump_reference_version()
                     db.session.commit()
                     flash("Item added successfully!", "success")
                 except IntegrityError:
@@ -248,6 +346,7 @@ def inventory_setup():
                     db.session.execute(
                         text("INSERT INTO category (name) VALUES (:name)"), {"name": name}
                     )
+                    bump_reference_version()
                     db.session.commit()
                     flash("Category added successfully!", "success")
                 except IntegrityError:
@@ -261,6 +360,7 @@ def inventory_setup():
                     db.session.execute(
                         text("INSERT INTO unit (name) VALUES (:name)"), {"name": name}
                     )
+                    bump_reference_version()
                     db.session.commit()
                     flash("Unit added successfully!", "success")
                 except IntegrityError:
@@ -269,9 +369,8 @@ def inventory_setup():
 
         return redirect(url_for("main.inventory_setup"))
     
-    categories = db.session.execute(text("SELECT * FROM category ORDER BY name")).fetchall()
-    items = db.session.execute(text("SELECT * FROM item ORDER BY name")).fetchall()
-    units = db.session.execute(text("SELECT * FROM unit ORDER BY name")).fetchall()
+    lists = reference_lists()
+    categories, items, units = lists['category'], lists['item'], lists['unit']
 
     return render_template("inventory_setup.html", categories=categories, items=items, units=units)
 
@@ -283,15 +382,25 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
 
+        users_version = home_version(USERS)
         result = db.session.execute(
-            text("SELECT id, username, email, password_hash FROM user WHERE username = :username"),
-            {"username": username}
+            text("SELECT id, username, email, location_id, password_hash FROM user WHERE username = :username"),
+            {"username": username}, bind_arguments=home_bind()
         ).fetchone()
 
-        if result and check_password_hash(result.password_hash, password):
-            user = User(result.id, result.username, result.email, result.password_hash)
+        if result and password_hasher.verify(result.password_hash, password):
+            if password_hasher.needs_rehash(result.password_hash):
+                # The configured method or cost changed; upgrade while we have the plain password.
+                db.session.execute(
+                    text("UPDATE user SET password_hash = :password_hash WHERE id = :id"),
+                    {"password_hash": password_hasher.hash(password), "id": result.id}, bind_arguments=home_bind()
+                )
+                db.session.commit()
+
+            user = User(result.id, result.username, result.email, result.location_id)
+            user_cache.put(user, users_version)
             login_user(user)
-            print(f"DEBUG: User logged in: {user.username}") 
+            current_app.logger.info("User logged in: %s", user.username)
             # flash("Logged in successfully.", "success")
             return redirect(url_for('main.home'))
         else:
@@ -309,24 +418,19 @@ def logout():
 @main.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
-    import os
-
-    db_path = os.path.join(current_app.instance_path, 'inventory.db')
-
     if request.method == 'POST':
         current_password = request.form['current_password']
         new_password = request.form['new_password']
         confirm_password = request.form['confirm_password']
 
         # 1. Get stored password hash from DB
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        c.execute("SELECT password_hash FROM user WHERE id = ?", (current_user.id,))
-        stored_hash = c.fetchone()[0]
-        conn.close()
+        stored_hash = db.session.execute(
+            text("SELECT password_hash FROM user WHERE id = :id"),
+            {"id": current_user.id}, bind_arguments=home_bind()
+        ).scalar()
 
         # 2. Verify current password
-        if not check_password_hash(stored_hash, current_password):
+        if not password_hasher.verify(stored_hash, current_password):
             flash('Current password is incorrect.', 'danger')
             return redirect(url_for('main.profile'))
 
@@ -336,12 +440,13 @@ def profile():
             return redirect(url_for('main.profile'))
 
         # 4. Update password
-        new_hash = generate_password_hash(new_password)
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        c.execute("UPDATE user SET password_hash = ? WHERE id = ?", (new_hash, current_user.id))
-        conn.commit()
-        conn.close()
+        new_hash = password_hasher.hash(new_password)
+        db.session.execute(
+            text("UPDATE user SET password_hash = :password_hash WHERE id = :id"),
+            {"password_hash": new_hash, "id": current_user.id}, bind_arguments=home_bind()
+        )
+        db.session.commit()
+        user_cache.invalidate(current_user.id)
 
         flash('Password updated successfully.', 'success')
         return redirect(url_for('main.profile'))
@@ -365,6 +470,7 @@ def edit_item(id):
             text("UPDATE item SET name = :name WHERE id = :id"),
             {"name": new_name, "id": id}
         )
+        bump_reference_version()
         db.session.commit()
         return redirect(url_for('main.inventory_setup'))
 
@@ -377,6 +483,7 @@ def delete_item(id):
         text("DELETE FROM item WHERE id = :id"),
         {"id": id}
     )
+    bump_reference_version()
     db.session.commit()
     flash('Item deleted successfully!', 'success')
     return redirect(url_for('main.inventory_setup'))
@@ -399,6 +506,7 @@ def edit_category(id):
             text("UPDATE category SET name = :name WHERE id = :id"),
             {"name": new_name, "id": id}
         )
+        bump_reference_version()
         db.session.commit()
         return redirect(url_for('main.inventory_setup'))
 
@@ -411,6 +519,7 @@ def delete_category(id):
         text("DELETE FROM category WHERE id = :id"),
         {"id": id}
     )
+    bump_reference_version()
     db.session.commit()
     flash('Category deleted successfully!', 'success')
     return redirect(url_for('main.inventory_setup'))
@@ -432,6 +541,7 @@ def edit_unit(id):
             text("UPDATE unit SET name = :name WHERE id = :id"),
             {"name": new_name, "id": id}
         )
+        bump_reference_version()
         db.session.commit()
         return redirect(url_for('main.inventory_setup'))
 
@@ -444,137 +554,136 @@ def delete_unit(id):
         text("DELETE FROM unit WHERE id = :id"),
         {"id": id}
     )
+    bump_reference_version()
     db.session.commit()
     flash('Unit deleted successfully!', 'success')
     return redirect(url_for('main.inventory_setup'))
 
 
-@main.route("/reports", methods=["GET", "POST"])
-def reports():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
-    # Get list of items
-    cur.execute("SELECT id, name FROM item ORDER BY name")
-    items = cur.fetchall()
-
-    if not items:
-        return render_template(
-            "reports.html",
-            items=[],
-            selected_item_id=None,
-            start_date="",
-            end_date="",
-            dates=[],
-            action_types=[],
-            chart_data={},
-            balance_data=[],
-            total_spend=0
-        )
-
-    # Default: first item if none selected
-    selected_item_id = request.form.get("item_id", items[0]["id"])
-    start_date = request.form.get("start_date", "")
-    end_date = request.form.get("end_date", "")
-
-    # Build WHERE clause with date filter
-    where_clauses = ["item_id = ?"]
-    params = [selected_item_id]
-
-    if start_date:
-        where_clauses.append("date >= ?")
-        params.append(start_date)
-    if end_date:
-        where_clauses.append("date <= ?")
-        params.append(end_date)
-
-    where_sql = " AND ".join(where_clauses)
-
-    # Query inventory actions for selected item with optional date range
-    cur.execute(
-        f"""
-        SELECT date, action_type, quantity, price
-        FROM actions
-        WHERE {where_sql}
-        ORDER BY date
-        """,
-        params
-    )
-    rows = cur.fetchall()
-    conn.close()
-
-    if not rows:
+@main.route('/api/reports/daily')
+@login_required
+@conditional(LEDGER, REFERENCE)
+def daily_report_api():
+    # ?item_id=1&item_id=2&range=2025-01-01..2025-01-31&range=2025-02-01..2025-02-28
+    # or a single start_date / end_date; no item_id means every item.
+    try:
+        item_ids = [int(i) for i in request.args.getlist('item_id')]
+        ranges = [r.split('..', 1) for r in request.args.getlist('range')]
+        if not ranges:
+            ranges = [[request.args['start_date'], request.args['end_date']]]
+        ranges = [(canonical_date(start), canonical_date(end)) for start, end in ranges]
+    except (KeyError, ValueError):
+        return jsonify({"error": "Give item_id values and either range=START..END or start_date and end_date."}), 400
+
+    with read_connection() as conn:
+        return jsonify({
+            "ranges": [
+                {"start_date": start, "end_date": end, "series": daily_series(conn, item_ids, start, end)}
+                for start, end in ranges
+            ]
+        })
+
+def render_report(items, selected_item_id, start_date, end_date, report, **context):
+    if not report:
         return render_template(
             "reports.html",
             items=items,
-            selected_item_id=int(selected_item_id),
+            selected_item_id=selected_item_id,
             start_date=start_date,
             end_date=end_date,
             dates=[],
             action_types=[],
             chart_data={},
             balance_data=[],
-            total_spend=0
+            total_spend=0,
+            **context
         )
 
-    # Process data for charts
-    dates = sorted(set([row["date"] for row in rows]))
-    action_types = sorted(set([row["action_type"] for row in rows]))
-    chart_data = {atype: [] for atype in action_types}
-    balance_data = []
-
-    # Running totals per action type for cumulative chart
-    running = {atype: 0 for atype in action_types}
-    cumulative_balance = 0
-    total_spend = 0
-
-    for d in dates:
-        daily_rows = [r for r in rows if r["date"] == d]
-
-        # Cumulative quantity per action type
-        for atype in action_types:
-            qty = sum(float(r["quantity"]) for r in daily_rows if r["action_type"] == atype)
-            running[atype] += qty
-            chart_data[atype].append(running[atype])
-
-        # Update cumulative balance
-        in_qty = sum(float(r["quantity"]) for r in daily_rows if r["action_type"].lower() == "delivery")
-        out_qty = sum(float(r["quantity"]) for r in daily_rows if r["action_type"].lower() in ("sales", "consumption", "waste"))
-        cumulative_balance += in_qty - out_qty
-        balance_data.append(cumulative_balance)
-
-        # Update total spend on deliveries
-        total_spend += sum(float(r["price"]) for r in daily_rows if r["action_type"].lower() == "delivery")
-
-    formatted_total_spend = f"${total_spend:,.2f}"
-
-    # Latest delivery price per unit
-    delivery_rows = [r for r in rows if r["action_type"].lower() == "delivery"]
-    if delivery_rows:
-        latest_delivery = delivery_rows[-1]  # last delivery by order in rows
-        latest_price_per_unit = float(latest_delivery["price"]) / float(latest_delivery["quantity"])
-    else:
-        latest_price_per_unit = 0
-
-    formatted_latest_price = f"${latest_price_per_unit:,.2f}"
-
-    # Total Quantity Sold/Consumed/Wasted
-    total_sold_consumed_wasted = sum(
-        float(r["quantity"]) for r in rows if r["action_type"].lower() in ("sales", "consumption", "waste")
-    )
+    formatted_total_spend = f"${report['total_spend']:,.2f}"
+    formatted_latest_price = f"${report['latest_price_per_unit']:,.2f}"
+    stock_value = report['average_value'] if current_app.config['VALUATION_METHOD'] == 'average' else report['fifo_value']
+    formatted_stock_value = f"${stock_value:,.2f}"
+    formatted_average_cost = f"${report['average_cost']:,.2f}"
 
     return render_template(
         "reports.html",
         items=items,
-        selected_item_id=int(selected_item_id),
+        selected_item_id=selected_item_id,
         start_date=start_date,
         end_date=end_date,
-        dates=dates,
-        action_types=action_types,
-        chart_data=chart_data,
-        balance_data=balance_data,
+        dates=report['dates'],
+        action_types=report['action_types'],
+        chart_data=report['chart_data'],
+        balance_data=report['balance_data'],
         formatted_total_spend=formatted_total_spend,
         formatted_latest_price=formatted_latest_price,
-        total_sold_consumed_wasted=total_sold_consumed_wasted
-    )
\ No newline at end of file
+        formatted_stock_value=formatted_stock_value,
+        formatted_average_cost=formatted_average_cost,
+        total_sold_consumed_wasted=report['total_sold_consumed_wasted'],
+        **context
+    )
+
+@main.route("/reports", methods=["GET", "POST"])
+@conditional(LEDGER, REFERENCE, config=('VALUATION_METHOD',))
+def reports():
+    # Get list of items
+    items = reference_lists()['item']
+
+    if not items:
+        return render_report([], None, "", "", None)
+
+    # Default: first item if none selected
+    selected_item_id = request.values.get("item_id", items[0].id)
+    start_date = request.values.get("start_date", "")
+    end_date = request.values.get("end_date", "")
+
+    snapshot = ledger_snapshot()
+    with read_connection() as conn:
+        report = item_report(conn, selected_item_id, start_date, end_date, snapshot)
+
+    return render_report(items, int(selected_item_id), start_date, end_date, report)
+
+# Group views: the same aggregation on every location's shard, run in
+# parallel through location_pool and merged by item and unit name.
+
+@main.route('/group/inventory')
+@login_required
+def group_inventory():
+    method = current_app.config['VALUATION_METHOD']
+    locations = all_locations()
+    results = location_pool.map(lambda location: inventory_rows(method), locations)
+    inventory = merge_inventory(zip(locations, results))
+    total_inventory_price = sum(row.total_price for row in inventory)
+    return render_template(
+        'inventory.html',
+        inventory=inventory,
+        locations=locations,
+        as_of='',
+        total_inventory_price=total_inventory_price,
+        formatted_total_inventory=f"${total_inventory_price:,.2f}"
+    )
+
+@main.route('/group/reports')
+@login_required
+def group_reports():
+    locations = all_locations()
+    names = location_pool.map(lambda location: [item.name for item in reference_lists()['item']], locations)
+    items = [GroupItem(name, name) for name in sorted(set().union(*names))]
+    if not items:
+        return render_report([], None, "", "", None, group=True)
+
+    # Items are matched by name; ids differ from shard to shard.
+    selected = request.args.get("item_id", items[0].id)
+    start_date = request.args.get("start_date", "")
+    end_date = request.args.get("end_date", "")
+
+    def location_report(location):
+        item = next((row for row in reference_lists()['item'] if row.name == selected), None)
+        if item is None:
+            return None
+        snapshot = ledger_snapshot()
+        with read_connection() as conn:
+            return item_report(conn, item.id, start_date, end_date, snapshot)
+
+    report = merge_reports(location_pool.map(location_report, locations))
+    return render_report(items, selected, start_date, end_date, report, group=True)
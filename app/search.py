@@ -0,0 +1,78 @@
+import bisect
+import threading
+from .extensions import current_location
+from .lookups import TABLES, reference_lists
+from .versions import REFERENCE, current_version
+
+# Typeahead search over category / item / unit names. Each table gets two
+# sorted arrays, one of whole names and one of the words inside them, so a
+# prefix lookup is a bisect plus a short scan. The index is built from
+# reference_lists() and rebuilt when the 'reference' version moves, which
+# every setup route bumps, so it never serves a deleted or renamed entry.
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+_lock = threading.Lock()
+_cached = {}  # location -> (version, indexes)
+
+
+class NameIndex:
+    def __init__(self, rows):
+        self.rows = sorted(((row.name.casefold(), row.id, row.name) for row in rows))
+        self.names = [key for key, _, _ in self.rows]
+        words = sorted(
+            (word, position)
+            for position, (key, _, _) in enumerate(self.rows)
+            for word in set(key.split()[1:])
+        )
+        self.words = [word for word, _ in words]
+        self.word_rows = [position for _, position in words]
+
+    def _prefixed(self, keys, prefix):
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + '\uffff', start)
+        return range(start, end)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Whole-name prefix matches first, then word prefix, then substring."""
+        query = ' '.join(query.casefold().split())
+        seen = []
+        for position in self._prefixed(self.names, query):
+            seen.append(position)
+            if len(seen) >= limit:
+                break
+        if len(seen) < limit and query:
+            for i in self._prefixed(self.words, query):
+                if self.word_rows[i] not in seen:
+                    seen.append(self.word_rows[i])
+                    if len(seen) >= limit:
+                        break
+        if len(seen) < limit and len(query) >= 3:
+            for position, key in enumerate(self.names):
+                if query in key and position not in seen:
+                    seen.append(position)
+                    if len(seen) >= limit:
+                        break
+        return [{'id': self.rows[p][1], 'name': self.rows[p][2]} for p in seen]
+
+
+def name_indexes():
+    location = current_location()
+    version = current_version(REFERENCE)
+    cached_version, indexes = _cached.get(location, (None, None))
+    if indexes is not None and cached_version == version:
+        return indexes
+
+    lists = reference_lists()
+    indexes = {table: NameIndex(lists[table]) for table in TABLES}
+    with _lock:
+        _cached[location] = (version, indexes)
+    return indexes
+
+
+def search_names(table, query, limit=DEFAULT_LIMIT):
+    if table not in TABLES:
+        raise ValueError(f"Unknown type: {table!r}")
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+    return name_indexes()[table].search(query or '', limit)
@@ -0,0 +1,483 @@
+import fcntl
+import json
+import mmap
+import os
+import shutil
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import date
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from .extensions import current_location, location_context, read_connection
+from .ledger import ACTION_TYPES
+from .stock import OUT_TYPES
+from .versions import LEDGER, current_version
+
+# Columnar snapshot of the actions ledger for in-process analytics. Each
+# column is a flat file of fixed-width values, memory-mapped read-only, so
+# every worker process shares the same pages through the OS page cache and
+# a scan touches machine numbers instead of one Row object per value.
+#
+# The snapshot has two segments:
+#
+#   base  every action up to base_last_id, sorted by (item, unit, type,
+#         date, id). A key's rows of one type are a contiguous slice, so
+#         lookups are bisects and sums run over slices in C.
+#   tail  actions appended since, in id order; scanned row by row, and
+#         kept short by folding it into a new base past SNAPSHOT_TAIL_ROWS.
+#
+# A refresh appends actions with ids above the last exported one. Updates
+# and deletes (found in change_log) rebuild the tail if they only touch
+# tail rows, otherwise the whole snapshot. Rebuilds write a new generation
+# directory and switch meta.json over to it; processes still mapping the
+# old files keep reading them until they next refresh.
+#
+# Requests never export: a stale snapshot is refreshed on a background
+# thread (or by `flask snapshot refresh`), and until it catches up the
+# views read SQLite as they do with the snapshot disabled.
+
+snapshot_cli = AppGroup('snapshot', help='Maintain the columnar ledger snapshot.')
+
+# (file, array typecode, SQL expression). Dates are date.toordinal() values;
+# amounts are cast the way SUM() reads them, so an empty price counts as 0.
+# Legacy rows whose date is not YYYY-MM-DD (migration 1 leaves the ones it
+# can't parse) have no ordinal and are left out; meta counts them.
+COLUMNS = (
+    ('id', 'q', "id"),
+    ('item', 'i', "item_id"),
+    ('unit', 'i', "unit_id"),
+    ('type', 'b', "action_type"),
+    ('date', 'i', "CAST(julianday(date) - 1721424.5 AS INTEGER)"),
+    ('quantity', 'd', "CAST(quantity AS REAL)"),
+    ('price', 'd', "CAST(COALESCE(price, 0) AS REAL)"),
+)
+
+# Codes in name order, so sorting by action_type in SQL sorts by code.
+ACTION_CODES = tuple(sorted(ACTION_TYPES))
+CODE = {name: code for code, name in enumerate(ACTION_CODES)}
+DELIVERY = CODE['delivery']
+SIGN = tuple(1.0 if name == 'delivery' else -1.0 if name in OUT_TYPES else 0.0 for name in ACTION_CODES)
+
+EXPORT_SQL = "SELECT " + ", ".join(expression for _, _, expression in COLUMNS) + " FROM actions WHERE date IS date(date)"
+BASE_SQL = EXPORT_SQL + " AND id <= ? ORDER BY item_id, unit_id, action_type, date, id"
+TAIL_SQL = EXPORT_SQL + " AND id > ? AND id <= ? ORDER BY id"
+SKIPPED_SQL = "SELECT COUNT(*) FROM actions WHERE id > ? AND id <= ? AND date IS NOT date(date)"
+
+POSITION_SQL = "SELECT (SELECT COALESCE(MAX(seq), 0) FROM change_log), (SELECT COALESCE(MAX(id), 0) FROM actions)"
+
+# Lowest action id updated or deleted since the last refresh.
+CHANGED_SQL = """
+    SELECT MIN(row_id) FROM change_log
+    WHERE seq > ? AND seq <= ? AND table_name = 'actions' AND op != 'insert'
+"""
+
+CHUNK_ROWS = 50000
+
+_lock = threading.Lock()
+_open = {}  # location -> Snapshot
+_refreshing = set()  # locations with a background refresh running
+
+
+def snapshot_dir(location):
+    name = 'home' if location is None else f"location_{location}"
+    return os.path.join(current_app.config['SNAPSHOT_DIR'], name)
+
+
+def read_meta(root):
+    try:
+        with open(os.path.join(root, 'meta.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_meta(root, meta):
+    path = os.path.join(root, 'meta.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+@contextmanager
+def _exclusive(root):
+    # One refresh at a time per snapshot, across processes.
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _export(conn, sql, params, directory, segment, rows=0):
+    """Append the query's rows to a segment's column files; returns the segment's row count."""
+    files = []
+    for name, typecode, _ in COLUMNS:
+        f = open(os.path.join(directory, f"{segment}.{name}"), 'ab')
+        # Drop anything past the recorded length, e.g. from an interrupted refresh.
+        f.truncate(rows * array(typecode).itemsize)
+        files.append(f)
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            chunk = cursor.fetchmany(CHUNK_ROWS)
+            if not chunk:
+                break
+            columns = list(zip(*chunk))
+            columns[3] = map(CODE.__getitem__, columns[3])
+            for f, (_, typecode, _), values in zip(files, COLUMNS, columns):
+                array(typecode, values).tofile(f)
+            rows += len(chunk)
+        for f in files:
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        for f in files:
+            f.close()
+    return rows
+
+
+def _new_generation(root, meta):
+    generation = (meta['generation'] + 1) if meta else 1
+    directory = os.path.join(root, str(generation))
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    return generation, directory
+
+
+def _drop_old_generations(root, generation):
+    for name in os.listdir(root):
+        if name.isdigit() and int(name) != generation:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def _skipped(conn, after, until):
+    count = conn.execute(SKIPPED_SQL, (after, until)).fetchone()[0]
+    if count:
+        current_app.logger.warning(
+            "%d actions between ids %d and %d have a date that is not YYYY-MM-DD and are left out of the snapshot",
+            count, after + 1, until)
+    return count
+
+
+def refresh(location, rebuild=False):
+    """Bring the location's snapshot files up to date with its ledger; returns the new meta."""
+    root = snapshot_dir(location)
+    with _exclusive(root), read_connection() as conn:
+        meta = read_meta(root)
+        # One read transaction, so the change_log position and the exported
+        # rows describe the same state of the ledger.
+        conn.execute("BEGIN")
+        try:
+            seq, max_id = conn.execute(POSITION_SQL).fetchone()
+            changed = None
+            if meta and not rebuild:
+                changed = conn.execute(CHANGED_SQL, (meta['change_seq'], seq)).fetchone()[0]
+            tail_limit = current_app.config['SNAPSHOT_TAIL_ROWS']
+
+            if (rebuild or meta is None
+                    or (changed is not None and changed <= meta['base_last_id'])
+                    or meta['tail_rows'] + max_id - meta['last_id'] > tail_limit):
+                generation, directory = _new_generation(root, meta)
+                base_rows = _export(conn, BASE_SQL, (max_id,), directory, 'base')
+                _export(conn, TAIL_SQL, (max_id, max_id), directory, 'tail')
+                skipped = _skipped(conn, 0, max_id)
+                meta = {'generation': generation, 'base_rows': base_rows, 'base_last_id': max_id, 'tail_rows': 0,
+                        'base_skipped': skipped, 'skipped': skipped}
+            elif changed is not None:
+                # Only tail rows changed: keep the base (hard links) and export the tail again.
+                generation, directory = _new_generation(root, meta)
+                old = os.path.join(root, str(meta['generation']))
+                for name, _, _ in COLUMNS:
+                    os.link(os.path.join(old, f"base.{name}"), os.path.join(directory, f"base.{name}"))
+                tail_rows = _export(conn, TAIL_SQL, (meta['base_last_id'], max_id), directory, 'tail')
+                meta = dict(meta, generation=generation, tail_rows=tail_rows,
+                            skipped=meta.get('base_skipped', 0) + _skipped(conn, meta['base_last_id'], max_id))
+            elif max_id > meta['last_id']:
+                directory = os.path.join(root, str(meta['generation']))
+                tail_rows = _export(conn, TAIL_SQL, (meta['last_id'], max_id), directory, 'tail', meta['tail_rows'])
+                meta = dict(meta, tail_rows=tail_rows,
+                            skipped=meta.get('skipped', 0) + _skipped(conn, meta['last_id'], max_id))
+        finally:
+            conn.rollback()
+
+        meta = dict(meta, last_id=max_id, change_seq=seq)
+        write_meta(root, meta)
+        _drop_old_generations(root, meta['generation'])
+    return meta
+
+
+class Segment:
+    """Read-only column views over one segment's files."""
+
+    def __init__(self, directory, name, rows):
+        self.rows = rows
+        for column, typecode, _ in COLUMNS:
+            setattr(self, column, self._map(os.path.join(directory, f"{name}.{column}"), typecode))
+        self._runs = None
+
+    def _map(self, path, typecode):
+        size = self.rows * array(typecode).itemsize
+        if not size:
+            return memoryview(array(typecode))
+        with open(path, 'rb') as f:
+            # The view keeps the mapping alive; the descriptor can go.
+            mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        return memoryview(mapped).cast(typecode)
+
+    def key_range(self, item_id):
+        return bisect_left(self.item, item_id), bisect_right(self.item, item_id)
+
+    def type_runs(self, lo, hi):
+        """(item, unit, type code, start, end) for each run of equal keys in base[lo:hi]."""
+        item, unit, code = self.item, self.unit, self.type
+        while lo < hi:
+            item_end = bisect_right(item, item[lo], lo, hi)
+            while lo < item_end:
+                unit_end = bisect_right(unit, unit[lo], lo, item_end)
+                while lo < unit_end:
+                    end = bisect_right(code, code[lo], lo, unit_end)
+                    yield item[lo], unit[lo], code[lo], lo, end
+                    lo = end
+
+    def runs(self):
+        # Every run in the segment, built on first use and kept with the mapping.
+        if self._runs is None:
+            self._runs = list(self.type_runs(0, self.rows))
+        return self._runs
+
+
+class Snapshot:
+    def __init__(self, root, meta, previous=None):
+        self.meta = meta
+        directory = os.path.join(root, str(meta['generation']))
+        if previous is not None and previous.meta['generation'] == meta['generation']:
+            self.base = previous.base
+        else:
+            self.base = Segment(directory, 'base', meta['base_rows'])
+        self.tail = Segment(directory, 'tail', meta['tail_rows'])
+        self.ledger_version = None
+
+    def _tail_positions(self, item_id):
+        return [i for i, value in enumerate(self.tail.item) if value == item_id]
+
+    def report_groups(self, item_id, start_date='', end_date=''):
+        """Rows like reporting.GROUPED_SQL: (date, action_type, quantity, price) by date.
+
+        None when the arguments can't be read as an item id and ISO dates;
+        the caller then asks SQLite, which compares them as strings.
+        """
+        try:
+            item_id = int(item_id)
+            start = date.fromisoformat(start_date).toordinal() if start_date else 0
+            end = date.fromisoformat(end_date).toordinal() if end_date else date.max.toordinal()
+        except ValueError:
+            return None
+
+        groups = {}
+        base = self.base
+        dates, quantity, price = base.date, base.quantity, base.price
+        for _, _, code, lo, hi in base.type_runs(*base.key_range(item_id)):
+            i = bisect_left(dates, start, lo, hi)
+            stop = bisect_right(dates, end, i, hi)
+            while i < stop:
+                day = dates[i]
+                j = bisect_right(dates, day, i, stop)
+                group = groups.setdefault((day, code), [0.0, 0.0])
+                group[0] += sum(quantity[i:j])
+                group[1] += sum(price[i:j])
+                i = j
+
+        tail = self.tail
+        for i in self._tail_positions(item_id):
+            day = tail.date[i]
+            if start <= day <= end:
+                group = groups.setdefault((day, tail.type[i]), [0.0, 0.0])
+                group[0] += tail.quantity[i]
+                group[1] += tail.price[i]
+
+        names = {}
+        rows = []
+        for (day, code), (q, p) in sorted(groups.items()):
+            if day not in names:
+                names[day] = date.fromordinal(day).isoformat()
+            rows.append((names[day], ACTION_CODES[code], q, p))
+        return rows
+
+    def latest_delivery(self, item_id, start_date='', end_date=''):
+        """(price, quantity, date) of the item's last delivery in the range, like LATEST_DELIVERY_SQL."""
+        item_id = int(item_id)
+        start = date.fromisoformat(start_date).toordinal() if start_date else 0
+        end = date.fromisoformat(end_date).toordinal() if end_date else date.max.toordinal()
+
+        best = None  # (date, id, segment, position)
+        base = self.base
+        for _, _, code, lo, hi in base.type_runs(*base.key_range(item_id)):
+            if code != DELIVERY:
+                continue
+            i = bisect_right(base.date, end, lo, hi) - 1
+            if i >= lo and base.date[i] >= start and (best is None or (base.date[i], base.id[i]) > best[:2]):
+                best = (base.date[i], base.id[i], base, i)
+        tail = self.tail
+        for i in self._tail_positions(item_id):
+            if tail.type[i] == DELIVERY and start <= tail.date[i] <= end:
+                if best is None or (tail.date[i], tail.id[i]) > best[:2]:
+                    best = (tail.date[i], tail.id[i], tail, i)
+
+        if best is None:
+            return None
+        _, _, segment, i = best
+        return segment.price[i], segment.quantity[i], date.fromordinal(segment.date[i]).isoformat()
+
+    def balances_as_of(self, day):
+        """{(item_id, unit_id): state} at the close of day, in checkpoints.new_state() form."""
+        cutoff = date.fromisoformat(day).toordinal()
+        # [net quantity, latest date, latest delivery (date, id), unit price]
+        keys = {}
+
+        base = self.base
+        dates, ids, quantity, price = base.date, base.id, base.quantity, base.price
+        for item, unit, code, lo, hi in base.runs():
+            end = bisect_right(dates, cutoff, lo, hi)
+            if end == lo:
+                continue
+            state = keys.get((item, unit))
+            if state is None:
+                state = keys[(item, unit)] = [0.0, 0, None, None]
+            if SIGN[code]:
+                state[0] += SIGN[code] * sum(quantity[lo:end])
+            last = end - 1
+            if dates[last] > state[1]:
+                state[1] = dates[last]
+            if code == DELIVERY:
+                state[2] = (dates[last], ids[last])
+                state[3] = price[last] / quantity[last] if price[last] and quantity[last] else None
+
+        tail = self.tail
+        for item, unit, code, d, action_id, q, p in zip(
+                tail.item, tail.unit, tail.type, tail.date, tail.id, tail.quantity, tail.price):
+            if d > cutoff:
+                continue
+            state = keys.get((item, unit))
+            if state is None:
+                state = keys[(item, unit)] = [0.0, 0, None, None]
+            state[0] += SIGN[code] * q
+            if d > state[1]:
+                state[1] = d
+            if code == DELIVERY and (state[2] is None or (d, action_id) > state[2]):
+                state[2] = (d, action_id)
+                state[3] = p / q if p and q else None
+
+        names = {}
+
+        def iso(ordinal):
+            if ordinal not in names:
+                names[ordinal] = date.fromordinal(ordinal).isoformat()
+            return names[ordinal]
+
+        return {
+            key: {
+                'net_quantity': net,
+                'latest_date': iso(latest),
+                'latest_delivery_date': iso(delivery[0]) if delivery else None,
+                'latest_unit_price': unit_price,
+            }
+            for key, (net, latest, delivery, unit_price) in keys.items()
+        }
+
+
+def open_snapshot(location, meta, previous=None):
+    root = snapshot_dir(location)
+    try:
+        return Snapshot(root, meta, previous)
+    except FileNotFoundError:
+        # Another process switched generations after we read meta.json.
+        return Snapshot(root, read_meta(root), previous)
+
+
+def _background_refresh(app, location):
+    try:
+        with location_context(location, app):
+            refresh(location)
+    except Exception:
+        app.logger.exception("Snapshot refresh failed for location %s", location)
+    finally:
+        with _lock:
+            _refreshing.discard(location)
+
+
+def refresh_later(location):
+    """Start a background refresh of the location's snapshot unless one is running."""
+    with _lock:
+        if location in _refreshing:
+            return
+        _refreshing.add(location)
+    app = current_app._get_current_object()
+    threading.Thread(target=_background_refresh, args=(app, location), name='snapshot-refresh', daemon=True).start()
+
+
+def ledger_snapshot():
+    """The current location's Snapshot if it matches the ledger; None when disabled or stale.
+
+    A stale snapshot is refreshed in the background, so the caller falls back
+    to SQL for this request instead of waiting for the export.
+    """
+    if not current_app.config['SNAPSHOT_ENABLED']:
+        return None
+    location = current_location()
+    version = current_version(LEDGER)
+    snapshot = _open.get(location)
+    if snapshot is not None and snapshot.ledger_version == version:
+        return snapshot
+
+    meta = read_meta(snapshot_dir(location))
+    if meta is not None:
+        with read_connection() as conn:
+            position = tuple(conn.execute(POSITION_SQL).fetchone())
+    if meta is None or position != (meta['change_seq'], meta['last_id']):
+        refresh_later(location)
+        return None
+
+    if snapshot is None or snapshot.meta != meta:
+        snapshot = open_snapshot(location, meta, snapshot)
+    snapshot.ledger_version = version
+    with _lock:
+        _open[location] = snapshot
+    return snapshot
+
+
+@snapshot_cli.command('refresh')
+@click.option('--rebuild', is_flag=True, help='Export the whole ledger again.')
+def refresh_command(rebuild):
+    """Export new actions into the snapshot, rebuilding it after updates and deletes."""
+    meta = refresh(current_location(), rebuild)
+    click.echo(f"Snapshot generation {meta['generation']}: {meta['base_rows']} base rows, "
+               f"{meta['tail_rows']} tail rows, up to action {meta['last_id']}.")
+    if meta.get('skipped'):
+        click.echo(f"{meta['skipped']} actions with a date that is not YYYY-MM-DD are left out; "
+                   f"fix their dates for the snapshot to match SQL.")
+
+
+@snapshot_cli.command('status')
+def status_command():
+    """Show the snapshot's size and how far it lags the ledger."""
+    root = snapshot_dir(current_location())
+    meta = read_meta(root)
+    if meta is None:
+        click.echo(f"No snapshot in {root}.")
+        return
+    directory = os.path.join(root, str(meta['generation']))
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    with read_connection() as conn:
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM actions").fetchone()[0]
+    click.echo(f"{root}: generation {meta['generation']}, {meta['base_rows']} base + {meta['tail_rows']} tail rows, "
+               f"{size / 1024 / 1024:.1f} MB, {max_id - meta['last_id']} actions behind.")
+    if meta.get('skipped'):
+        click.echo(f"{meta['skipped']} actions with a date that is not YYYY-MM-DD are left out; "
+                   f"fix their dates for the snapshot to match SQL.")
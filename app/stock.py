@@ -0,0 +1,182 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from .extensions import db
+
+# stock_balance keeps one row per (item, unit) so the inventory page does not
+# have to aggregate the whole actions ledger on every view. It is updated in
+# the same transaction as the ledger writes in action() / delete_action().
+
+OUT_TYPES = ('sales', 'consumption', 'waste')
+
+stock_cli = AppGroup('stock', help='Maintain the stock_balance summary table.')
+
+
+def signed_quantity(action_type, quantity):
+    if action_type == 'delivery':
+        return float(quantity)
+    if action_type in OUT_TYPES:
+        return -float(quantity)
+    return 0.0
+
+
+UPSERT_SQL = """
+    INSERT INTO stock_balance (item_id, unit_id, net_quantity, latest_date, latest_delivery_date, latest_unit_price)
+    VALUES (:item_id, :unit_id, :net_quantity, :date, :delivery_date, :unit_price)
+    ON CONFLICT (item_id, unit_id) DO UPDATE SET
+        net_quantity = net_quantity + excluded.net_quantity,
+        latest_date = CASE
+            WHEN latest_date IS NULL OR excluded.latest_date > latest_date THEN excluded.latest_date
+            ELSE latest_date
+        END,
+        latest_unit_price = CASE
+            WHEN excluded.latest_delivery_date IS NOT NULL
+                 AND (latest_delivery_date IS NULL OR excluded.latest_delivery_date >= latest_delivery_date)
+            THEN excluded.latest_unit_price
+            ELSE latest_unit_price
+        END,
+        latest_delivery_date = CASE
+            WHEN excluded.latest_delivery_date IS NOT NULL
+                 AND (latest_delivery_date IS NULL OR excluded.latest_delivery_date >= latest_delivery_date)
+            THEN excluded.latest_delivery_date
+            ELSE latest_delivery_date
+        END
+"""
+
+
+def apply_actions(rows):
+    # Caller commits, so the balance moves together with the ledger insert.
+    # Rows are folded per (item, unit) first so a large batch costs one
+    # upsert per key rather than one per row.
+    deltas = {}
+    for row in rows:
+        key = (int(row['item_id']), int(row['unit_id']))
+        delta = deltas.setdefault(key, {
+            'item_id': key[0],
+            'unit_id': key[1],
+            'net_quantity': 0.0,
+            'date': row['date'],
+            'delivery_date': None,
+            'unit_price': None,
+        })
+        delta['net_quantity'] += signed_quantity(row['action_type'], row['quantity'])
+        if row['date'] > delta['date']:
+            delta['date'] = row['date']
+        if row['action_type'] == 'delivery' and (delta['delivery_date'] is None or row['date'] >= delta['delivery_date']):
+            delta['delivery_date'] = row['date']
+            price = row['price']
+            delta['unit_price'] = float(price) / float(row['quantity']) if price and float(row['quantity']) else None
+
+    if deltas:
+        db.session.execute(text(UPSERT_SQL), list(deltas.values()))
+
+
+# Same aggregation the inventory page used to run over the full ledger,
+# optionally restricted to a single (item, unit) key.
+LEDGER_BALANCE_SQL = """
+    WITH ranked_deliveries AS (
+        SELECT
+            item_id,
+            unit_id,
+            date,
+            price * 1.0 / NULLIF(quantity, 0) AS unit_price,
+            ROW_NUMBER() OVER (PARTITION BY item_id, unit_id ORDER BY date DESC, id DESC) AS rn
+        FROM actions
+        WHERE action_type = 'delivery' {key_filter}
+    ),
+    summary AS (
+        SELECT
+            item_id,
+            unit_id,
+            MAX(date) AS latest_date,
+            SUM(CASE
+                    WHEN action_type = 'delivery' THEN quantity
+                    WHEN action_type IN ('sales', 'consumption', 'waste') THEN -quantity
+                    ELSE 0
+                END) AS net_quantity
+        FROM actions
+        WHERE 1 = 1 {key_filter}
+        GROUP BY item_id, unit_id
+    )
+    SELECT
+        s.item_id,
+        s.unit_id,
+        s.net_quantity,
+        s.latest_date,
+        rd.date AS latest_delivery_date,
+        rd.unit_price AS latest_unit_price
+    FROM summary s
+    LEFT JOIN ranked_deliveries rd
+        ON rd.item_id = s.item_id AND rd.unit_id = s.unit_id AND rd.rn = 1
+"""
+
+KEY_FILTER = "AND item_id = :item_id AND unit_id = :unit_id"
+
+
+def refresh_key(item_id, unit_id):
+    # Deletes can remove the latest delivery, so the key is recomputed from
+    # its own ledger rows rather than adjusted in place.
+    db.session.execute(
+        text("DELETE FROM stock_balance WHERE item_id = :item_id AND unit_id = :unit_id"),
+        {'item_id': item_id, 'unit_id': unit_id}
+    )
+    db.session.execute(
+        text("""
+            INSERT INTO stock_balance (item_id, unit_id, net_quantity, latest_date, latest_delivery_date, latest_unit_price)
+        """ + LEDGER_BALANCE_SQL.format(key_filter=KEY_FILTER)),
+        {'item_id': item_id, 'unit_id': unit_id}
+    )
+
+
+def rebuild_stock_balance():
+    db.session.execute(text("DELETE FROM stock_balance"))
+    db.session.execute(text("""
+        INSERT INTO stock_balance (item_id, unit_id, net_quantity, latest_date, latest_delivery_date, latest_unit_price)
+    """ + LEDGER_BALANCE_SQL.format(key_filter="")))
+
+
+def verify_stock_balance(tolerance=1e-6):
+    expected = {
+        (r.item_id, r.unit_id): r
+        for r in db.session.execute(text(LEDGER_BALANCE_SQL.format(key_filter=""))).fetchall()
+    }
+    stored = {
+        (r.item_id, r.unit_id): r
+        for r in db.session.execute(text("SELECT * FROM stock_balance")).fetchall()
+    }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        exp = expected.get(key)
+        got = stored.get(key)
+        if exp is None or got is None:
+            mismatches.append((key, exp, got))
+            continue
+        if (abs(float(exp.net_quantity or 0) - float(got.net_quantity or 0)) > tolerance
+                or exp.latest_date != got.latest_date
+                or (exp.latest_unit_price is None) != (got.latest_unit_price is None)
+                or (exp.latest_unit_price is not None
+                    and abs(exp.latest_unit_price - got.latest_unit_price) > tolerance)):
+            mismatches.append((key, exp, got))
+    return mismatches
+
+
+@stock_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild stock_balance from the actions ledger."""
+    rebuild_stock_balance()
+    db.session.commit()
+    count = db.session.execute(text("SELECT COUNT(*) FROM stock_balance")).scalar()
+    click.echo(f"Rebuilt stock_balance: {count} rows.")
+
+
+@stock_cli.command('verify')
+def verify_command():
+    """Compare stock_balance against the actions ledger."""
+    mismatches = verify_stock_balance()
+    if not mismatches:
+        click.echo("stock_balance matches the ledger.")
+        return
+    for key, expected, stored in mismatches:
+        click.echo(f"item_id={key[0]} unit_id={key[1]}: ledger={expected and tuple(expected)} stored={stored and tuple(stored)}")
+    raise SystemExit(1)
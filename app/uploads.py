@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+from .extensions import db
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # thumbnails are skipped without Pillow
+    Image = None
+
+# Receipt photos are stored under their SHA-256, so the same bill uploaded
+# twice is kept once and two different 'photo.jpg' files never collide.
+# Files are sharded by the first two hex digits:
+#
+#   static/uploads/ab/ab3f...e1.jpg         original
+#   static/uploads/thumbs/ab3f...e1.jpg     small JPEG for the action log
+
+CHUNK_SIZE = 64 * 1024
+THUMBNAIL_SIZE = (160, 160)
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.bmp'}
+
+log = logging.getLogger(__name__)
+uploads_cli = AppGroup('uploads', help='Maintain stored receipt photos.')
+
+# One background thread is enough: thumbnails are small and uploads rare.
+_thumbnailer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+
+
+def _extension(filename):
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return ext if ext in IMAGE_EXTENSIONS else '.bin'
+
+
+def store_upload(file_storage):
+    """Stream an uploaded file to disk while hashing it; return its static/ path."""
+    upload_dir = current_app.config['UPLOAD_FOLDER']
+    max_bytes = current_app.config.get('MAX_CONTENT_LENGTH')
+    os.makedirs(upload_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, prefix='.incoming-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise RequestEntityTooLarge()
+                digest.update(chunk)
+                out.write(chunk)
+
+        name = digest.hexdigest() + _extension(file_storage.filename)
+        shard_dir = os.path.join(upload_dir, name[:2])
+        final_path = os.path.join(shard_dir, name)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(shard_dir, exist_ok=True)
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    schedule_thumbnail(final_path)
+    return f'static/uploads/{name[:2]}/{name}'
+
+
+def thumbnail_path(upload_dir, photo_path):
+    stem = os.path.splitext(os.path.basename(photo_path))[0]
+    return os.path.join(upload_dir, 'thumbs', stem + '.jpg')
+
+
+def thumbnail_url_path(photo_path):
+    """The static/ path of a photo's thumbnail, or None if it hasn't been made."""
+    if not photo_path:
+        return None
+    upload_dir = current_app.config['UPLOAD_FOLDER']
+    if not os.path.exists(thumbnail_path(upload_dir, photo_path)):
+        return None
+    stem = os.path.splitext(os.path.basename(photo_path))[0]
+    return f'static/uploads/thumbs/{stem}.jpg'
+
+
+def make_thumbnail(source, target):
+    if Image is None or os.path.exists(target):
+        return
+    try:
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail(THUMBNAIL_SIZE)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_target = target + '.tmp'
+            img.convert('RGB').save(tmp_target, 'JPEG', quality=80, optimize=True)
+            os.replace(tmp_target, target)
+    except Exception:
+        log.warning("Could not create thumbnail for %s", source, exc_info=True)
+
+
+def schedule_thumbnail(photo_file):
+    upload_dir = current_app.config['UPLOAD_FOLDER']
+    return _thumbnailer.submit(make_thumbnail, photo_file, thumbnail_path(upload_dir, photo_file))
+
+
+@uploads_cli.command('thumbnails')
+def thumbnails_command():
+    """Create missing thumbnails for every photo referenced by the ledger."""
+    static_root = os.path.dirname(current_app.config['UPLOAD_FOLDER'])
+    paths = db.session.execute(
+        text("SELECT DISTINCT photo_path FROM actions WHERE photo_path IS NOT NULL")
+    ).scalars().all()
+    for photo_path in paths:
+        source = os.path.join(static_root, photo_path.split('static/', 1)[1])
+        if os.path.exists(source):
+            schedule_thumbnail(source).result()
+    click.echo(f"Checked {len(paths)} photos.")
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import text
+from .extensions import db, home_bind
+from .versions import USERS, home_version
+
+
+class User:
+    """The logged-in user as Flask-Login sees it.
+
+    Only identity fields are kept; password hashes are read from the user
+    table when they are needed, so cached User objects never hold one.
+    """
+
+    __slots__ = ('id', 'username', 'email', 'location_id')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, username, email, location_id=None):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.location_id = location_id
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, User) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class UserCache:
+    """Bounded LRU of User objects with a time-to-live per entry.
+
+    Entries also carry the 'users' version they were read at; a bump (for
+    example 'flask locations assign') makes every process reload the user on
+    its next request instead of routing it by a stale location until the TTL.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, maxsize, ttl):
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, user_id, version):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now and entry[2] == version:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def put(self, user, version):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, user, version)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+user_cache = UserCache()
+
+
+def get_user(user_id):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    # Read before the row, so a change committed in between fails the next check.
+    version = home_version(USERS)
+    user = user_cache.get(user_id, version)
+    if user is not None:
+        return user
+
+    result = db.session.execute(
+        text("SELECT id, username, email, location_id FROM user WHERE id = :id"),
+        {"id": user_id}, bind_arguments=home_bind()
+    ).fetchone()
+    if not result:
+        return None
+
+    user = User(result.id, result.username, result.email, result.location_id)
+    user_cache.put(user, version)
+    return user
@@ -0,0 +1,356 @@
+from itertools import groupby
+import click
+from sqlalchemy import text
+from .extensions import db
+from .stock import OUT_TYPES, stock_cli
+
+# Cost valuation per (item, unit), kept alongside the ledger.
+#
+#   cost_layer       FIFO layers still on hand: one row per delivery that has
+#                    not been fully consumed, in the order it arrived.
+#   stock_valuation  on-hand quantity, FIFO value, the running weighted
+#                    average cost and head_seq, the oldest layer with stock.
+#
+# New actions are folded in ledger order: a delivery appends a layer and
+# moves the average, an outflow consumes layers from the head. fifo_value is
+# kept up to date by adding and subtracting what moves, and an outflow reads
+# layers from head_seq on in small pages, so a write costs the layers it
+# actually touches rather than everything still on hand. Anything that breaks
+# the order (a delete, or an insert dated before the key's last valued
+# action) replays that key from the start. valuation_progress records the
+# highest actions.id already folded in.
+
+VALUATION_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS cost_layer (
+        item_id INTEGER NOT NULL,
+        unit_id INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        date DATE NOT NULL,
+        quantity REAL NOT NULL,
+        unit_cost REAL NOT NULL,
+        PRIMARY KEY (item_id, unit_id, seq)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stock_valuation (
+        item_id INTEGER NOT NULL,
+        unit_id INTEGER NOT NULL,
+        on_hand REAL NOT NULL DEFAULT 0,
+        fifo_value REAL NOT NULL DEFAULT 0,
+        avg_cost REAL NOT NULL DEFAULT 0,
+        deficit REAL NOT NULL DEFAULT 0,
+        next_seq INTEGER NOT NULL DEFAULT 0,
+        head_seq INTEGER NOT NULL DEFAULT 0,
+        last_date DATE,
+        PRIMARY KEY (item_id, unit_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS valuation_progress (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_action_id INTEGER NOT NULL
+    )
+    """,
+)
+
+UPSERT_VALUATION_SQL = """
+    INSERT INTO stock_valuation (item_id, unit_id, on_hand, fifo_value, avg_cost, deficit, next_seq, head_seq, last_date)
+    VALUES (:item_id, :unit_id, :on_hand, :fifo_value, :avg_cost, :deficit, :next_seq, :head_seq, :last_date)
+    ON CONFLICT (item_id, unit_id) DO UPDATE SET
+        on_hand = excluded.on_hand,
+        fifo_value = excluded.fifo_value,
+        avg_cost = excluded.avg_cost,
+        deficit = excluded.deficit,
+        next_seq = excluded.next_seq,
+        head_seq = excluded.head_seq,
+        last_date = excluded.last_date
+"""
+
+INSERT_LAYER_SQL = """
+    INSERT INTO cost_layer (item_id, unit_id, seq, date, quantity, unit_cost)
+    VALUES (:item_id, :unit_id, :seq, :date, :quantity, :unit_cost)
+"""
+
+KEY_WHERE = "item_id = :item_id AND unit_id = :unit_id"
+
+# Stored layers read per query once an outflow reaches the end of what is loaded.
+LAYER_PAGE = 16
+
+# Joined into inventory queries as v; value_sql() picks the column.
+VALUE_EXPRESSIONS = {
+    'fifo': "v.fifo_value",
+    'average': "MAX(v.on_hand, 0) * v.avg_cost",
+}
+
+
+INVENTORY_SQL = """
+    SELECT
+        i.name AS item_name,
+        u.name AS unit_name,
+        s.latest_date,
+        ROUND(s.net_quantity, 1) AS net_quantity,
+        ROUND({value_sql}, 2) AS total_price
+    FROM stock_balance s
+    JOIN item i ON s.item_id = i.id
+    JOIN unit u ON s.unit_id = u.id
+    LEFT JOIN stock_valuation v ON v.item_id = s.item_id AND v.unit_id = s.unit_id
+    ORDER BY s.latest_date DESC
+"""
+
+
+def value_sql(method):
+    return VALUE_EXPRESSIONS[method if method in VALUE_EXPRESSIONS else 'fifo']
+
+
+def state_value(state, method):
+    """A replayed state's stock value, like value_sql() gives for stored rows."""
+    if method == 'average':
+        return max(state['on_hand'], 0) * state['avg_cost']
+    return sum(layer[2] * layer[3] for layer in state['layers'][state['head']:])
+
+
+def inventory_rows(method):
+    """Current stock per (item, unit) with its value, newest activity first."""
+    return db.session.execute(text(INVENTORY_SQL.format(value_sql=value_sql(method)))).fetchall()
+
+
+def new_state():
+    return {
+        'on_hand': 0.0, 'fifo_value': 0.0, 'avg_cost': 0.0, 'deficit': 0.0,
+        'next_seq': 0, 'head_seq': 0, 'last_date': None,
+        'layers': [], 'head': 0, 'stored': 0, 'load_from': 0, 'stored_end': 0,
+    }
+
+
+def load_state(key):
+    """The key's stored totals; its layers are read later, only as outflows reach them."""
+    row = db.session.execute(
+        text(f"""
+            SELECT on_hand, fifo_value, avg_cost, deficit, next_seq, head_seq, last_date
+            FROM stock_valuation WHERE {KEY_WHERE}
+        """),
+        {'item_id': key[0], 'unit_id': key[1]}
+    ).fetchone()
+    if row is None:
+        return None
+    state = dict(new_state(), **row._mapping)
+    # Layers are [seq, date, quantity, unit_cost, stored_quantity]: the first
+    # 'stored' entries come from cost_layer (seq in [head_seq, next_seq)),
+    # the rest are created in this pass and have stored_quantity None.
+    state['load_from'] = state['head_seq']
+    state['stored_end'] = state['next_seq']
+    return state
+
+
+def load_layers(key, state):
+    """Read the next page of stored layers, after those already loaded."""
+    rows = db.session.execute(
+        text(f"""
+            SELECT seq, date, quantity, unit_cost FROM cost_layer
+            WHERE {KEY_WHERE} AND seq >= :seq AND seq < :end
+            ORDER BY seq LIMIT :limit
+        """),
+        {'item_id': key[0], 'unit_id': key[1], 'seq': state['load_from'], 'end': state['stored_end'], 'limit': LAYER_PAGE}
+    ).fetchall()
+    loaded = [[r.seq, r.date, r.quantity, r.unit_cost, r.quantity] for r in rows]
+    stored = state['stored']
+    state['layers'][stored:stored] = loaded
+    state['stored'] += len(loaded)
+    state['load_from'] = loaded[-1][0] + 1 if len(loaded) == LAYER_PAGE else state['stored_end']
+
+
+def apply(key, state, action):
+    quantity = float(action.quantity)
+    if action.action_type == 'delivery':
+        unit_cost = float(action.price) / quantity if action.price and quantity else state['avg_cost']
+        if state['on_hand'] <= 0:
+            state['avg_cost'] = unit_cost
+        else:
+            state['avg_cost'] = (state['on_hand'] * state['avg_cost'] + quantity * unit_cost) / (state['on_hand'] + quantity)
+        state['on_hand'] += quantity
+
+        # Stock issued while nothing was on hand is settled from this delivery first.
+        settled = min(state['deficit'], quantity)
+        state['deficit'] -= settled
+        if quantity > settled:
+            state['layers'].append([state['next_seq'], action.date, quantity - settled, unit_cost, None])
+            state['next_seq'] += 1
+            state['fifo_value'] += (quantity - settled) * unit_cost
+    elif action.action_type in OUT_TYPES:
+        state['on_hand'] -= quantity
+        layers = state['layers']
+        head = state['head']
+        while quantity > 1e-9:
+            # Stored layers come before this pass's new ones.
+            if head == state['stored'] and state['load_from'] < state['stored_end']:
+                load_layers(key, state)
+                continue
+            if head == len(layers):
+                break
+            taken = min(layers[head][2], quantity)
+            layers[head][2] -= taken
+            state['fifo_value'] -= taken * layers[head][3]
+            quantity -= taken
+            if layers[head][2] <= 1e-9:
+                head += 1
+        state['head'] = head
+        state['deficit'] += max(quantity, 0.0)
+        if head == len(layers) and state['load_from'] >= state['stored_end']:
+            # No layers left; drop any rounding left in the running value.
+            state['fifo_value'] = 0.0
+
+    if state['last_date'] is None or action.date > state['last_date']:
+        state['last_date'] = action.date
+
+
+def save_state(key, state):
+    params = {'item_id': key[0], 'unit_id': key[1]}
+    layers = state['layers']
+    head = state['head']
+    stored = state['stored']
+
+    # Fully consumed layers form a prefix; stored ones are deleted in one range.
+    consumed = min(head, stored)
+    if consumed:
+        db.session.execute(
+            text(f"DELETE FROM cost_layer WHERE {KEY_WHERE} AND seq <= :seq"),
+            dict(params, seq=layers[consumed - 1][0])
+        )
+
+    updated = [
+        dict(params, seq=layer[0], quantity=layer[2])
+        for layer in layers[head:stored] if layer[2] != layer[4]
+    ]
+    if updated:
+        db.session.execute(
+            text(f"UPDATE cost_layer SET quantity = :quantity WHERE {KEY_WHERE} AND seq = :seq"),
+            updated
+        )
+    created = [
+        dict(params, seq=layer[0], date=layer[1], quantity=layer[2], unit_cost=layer[3])
+        for layer in layers[max(head, stored):]
+    ]
+    if created:
+        db.session.execute(text(INSERT_LAYER_SQL), created)
+
+    if head < stored:
+        head_seq = layers[head][0]
+    elif state['load_from'] < state['stored_end']:
+        head_seq = state['load_from']
+    elif head < len(layers):
+        head_seq = layers[head][0]
+    else:
+        head_seq = state['next_seq']
+    db.session.execute(text(UPSERT_VALUATION_SQL), dict(
+        params,
+        on_hand=state['on_hand'],
+        fifo_value=state['fifo_value'],
+        avg_cost=state['avg_cost'],
+        deficit=state['deficit'],
+        next_seq=state['next_seq'],
+        head_seq=head_seq,
+        last_date=state['last_date'],
+    ))
+
+
+def revalue_key(item_id, unit_id):
+    """Replay one key's ledger from scratch."""
+    params = {'item_id': item_id, 'unit_id': unit_id}
+    db.session.execute(text(f"DELETE FROM cost_layer WHERE {KEY_WHERE}"), params)
+    db.session.execute(text(f"DELETE FROM stock_valuation WHERE {KEY_WHERE}"), params)
+
+    state = new_state()
+    actions = db.session.execute(
+        text(f"""
+            SELECT date, action_type, quantity, price FROM actions
+            WHERE {KEY_WHERE}
+            ORDER BY date, id
+        """),
+        params
+    ).fetchall()
+    if not actions:
+        return
+    for action in actions:
+        apply((item_id, unit_id), state, action)
+    # A replay already holds every open layer, so store the exact sum.
+    state['fifo_value'] = sum(layer[2] * layer[3] for layer in state['layers'][state['head']:])
+    save_state((item_id, unit_id), state)
+
+
+def last_valued_id():
+    return db.session.execute(text("SELECT last_action_id FROM valuation_progress WHERE id = 1")).scalar() or 0
+
+
+def set_last_valued_id(action_id):
+    db.session.execute(
+        text("""
+            INSERT INTO valuation_progress (id, last_action_id) VALUES (1, :id)
+            ON CONFLICT (id) DO UPDATE SET last_action_id = excluded.last_action_id
+        """),
+        {"id": action_id}
+    )
+
+
+def update_valuation():
+    """Fold every action not yet valued; the caller owns the transaction.
+
+    Runs after the caller's INSERT, so it holds SQLite's write lock and sees
+    exactly the rows no other writer has valued.
+    """
+    after = last_valued_id()
+    # Streamed one key at a time so a full rebuild never holds the whole
+    # ledger in memory.
+    actions = db.session.execute(
+        text("""
+            SELECT id, item_id, unit_id, date, action_type, quantity, price FROM actions
+            WHERE id > :after
+            ORDER BY item_id, unit_id, date, id
+        """),
+        {"after": after}
+    )
+
+    last_id = after
+    for key, key_actions in groupby(actions, key=lambda action: (action.item_id, action.unit_id)):
+        key_actions = list(key_actions)
+        last_id = max(last_id, max(action.id for action in key_actions))
+        state = load_state(key)
+        if state is not None and state['last_date'] and key_actions[0].date < state['last_date']:
+            # Back-dated: FIFO order changes for everything after it.
+            revalue_key(*key)
+            continue
+        state = state or new_state()
+        for action in key_actions:
+            apply(key, state, action)
+        save_state(key, state)
+
+    if last_id > after:
+        set_last_valued_id(last_id)
+
+
+def rebuild_valuation():
+    db.session.execute(text("DELETE FROM cost_layer"))
+    db.session.execute(text("DELETE FROM stock_valuation"))
+    db.session.execute(text("DELETE FROM valuation_progress"))
+    update_valuation()
+
+
+def item_valuation(conn, item_id):
+    """(on_hand, fifo_value, average_value) summed over an item's units, for the reports page."""
+    return conn.execute(
+        """
+        SELECT COALESCE(SUM(on_hand), 0), COALESCE(SUM(fifo_value), 0),
+               COALESCE(SUM(MAX(on_hand, 0) * avg_cost), 0)
+        FROM stock_valuation WHERE item_id = ?
+        """,
+        [item_id]
+    ).fetchone()
+
+
+@stock_cli.command('revalue')
+def revalue_command():
+    """Rebuild FIFO layers and average costs from the actions ledger."""
+    rebuild_valuation()
+    db.session.commit()
+    count = db.session.execute(text("SELECT COUNT(*) FROM cost_layer")).scalar()
+    click.echo(f"Revalued stock: {count} open cost layers.")
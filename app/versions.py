@@ -0,0 +1,134 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, g, request, make_response
+from flask_login import current_user
+from sqlalchemy import text
+from .extensions import current_location, db, home_bind
+
+# Named change counters kept in the cache_versions table. Writers bump a
+# counter inside their own transaction; readers use it to validate caches
+# and HTTP validators.
+#
+#   'reference'  category / item / unit names
+#   'ledger'     rows in actions
+#   'users'      user rows, e.g. a location assignment (home database only)
+
+REFERENCE = 'reference'
+LEDGER = 'ledger'
+USERS = 'users'
+
+
+def _versions(location):
+    # Per database, so a request routed to a shard can still read the home counters.
+    versions = g.setdefault('versions', {})
+    if location not in versions:
+        rows = db.session.execute(
+            text("SELECT name, version, updated_at FROM cache_versions"),
+            bind_arguments=home_bind() if location is None else None
+        ).fetchall()
+        versions[location] = {row.name: (row.version, row.updated_at) for row in rows}
+    return versions[location]
+
+
+def get_versions():
+    """{name: (version, updated_at)} for the current location's database, read once per request."""
+    return _versions(current_location())
+
+
+def current_version(name):
+    return get_versions().get(name, (0, None))[0]
+
+
+def home_version(name):
+    """A counter from the home database, whichever location the request is routed to."""
+    return _versions(None).get(name, (0, None))[0]
+
+
+def bump_version(name, bind_arguments=None):
+    # Call before the handler's commit so the bump and the change land together.
+    db.session.execute(
+        text("""
+            INSERT INTO cache_versions (name, version, updated_at) VALUES (:name, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT (name) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        """),
+        {"name": name}, bind_arguments=bind_arguments
+    )
+    g.pop('versions', None)
+
+
+def build_digest(app):
+    """Short hash of the code, templates and static files pages are rendered from.
+
+    Uploaded photos are left out; they don't change how a page renders.
+    """
+    uploads = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    digest = hashlib.sha1()
+    for directory, dirnames, filenames in os.walk(app.root_path):
+        dirnames[:] = sorted(
+            name for name in dirnames
+            if name != '__pycache__' and os.path.abspath(os.path.join(directory, name)) != uploads
+        )
+        for name in sorted(filenames):
+            if name.endswith('.pyc'):
+                continue
+            path = os.path.join(directory, name)
+            digest.update(os.path.relpath(path, app.root_path).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def _last_modified(names):
+    stamps = [get_versions().get(name, (0, None))[1] for name in names]
+    stamps = [s for s in stamps if s]
+    if not stamps:
+        return None
+    return datetime.strptime(max(stamps), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+def conditional(*names, config=()):
+    """Answer GETs with 304 while the named versions, user and query are unchanged.
+
+    The ETag covers the version counters, the logged-in user, their location,
+    the request arguments, the build (BUILD_ID) and the app.config values
+    named in config, so the view (and its aggregation queries) only runs
+    when the page could actually differ.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            versions = get_versions()
+            key = repr((
+                request.endpoint,
+                current_app.config['BUILD_ID'],
+                [current_app.config[name] for name in config],
+                [versions.get(name, (0, None))[0] for name in names],
+                current_user.get_id(),
+                current_location(),
+                sorted(request.args.items(multi=True)),
+            ))
+            etag = hashlib.sha1(key.encode()).hexdigest()
+            last_modified = _last_modified(names)
+
+            # Only the ETag decides: updated_at has one-second resolution, so
+            # If-Modified-Since could miss two writes within the same second.
+            # Weak ETags: they stand for the data versions, not the bytes, and
+            # the same page may go out gzipped or not.
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            # Browsers may keep the page but must check back on every load.
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
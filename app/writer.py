@@ -0,0 +1,173 @@
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from .extensions import current_location, db, location_context
+
+# Group commit for action inserts. Request threads hand their rows to one
+# writer thread per process and wait; the writer collects whatever arrives
+# within a short window (or up to a row limit), writes it through
+# insert_actions() and commits once, then wakes every request in the batch.
+# Many form posts therefore cost one SQLite transaction and one fsync, and
+# inside a process there is only ever one writer competing for the lock.
+# Contention with other processes ('database is locked') is retried with
+# jittered exponential backoff before the batch fails.
+#
+# With location shards every submission remembers its request's location
+# and the writer commits each location's rows to its own shard.
+
+
+class WriteQueueBusy(Exception):
+    """Raised when the write queue is full or a batch is not durable within the wait timeout."""
+
+
+class _Submission:
+    __slots__ = ('rows', 'location', 'future')
+
+    def __init__(self, rows, location=None):
+        self.rows = rows
+        self.location = location
+        self.future = Future()
+
+
+class ActionWriter:
+    def __init__(self, max_batch_rows=500, max_delay=0.005, queue_limit=1000,
+                 retries=5, backoff=0.02, wait_timeout=30.0, synchronous='FULL'):
+        self.app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.configure(max_batch_rows, max_delay, queue_limit, retries, backoff, wait_timeout, synchronous)
+
+    def configure(self, max_batch_rows, max_delay, queue_limit, retries, backoff, wait_timeout, synchronous):
+        self.max_batch_rows = max_batch_rows
+        self.max_delay = max_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.wait_timeout = wait_timeout
+        self.synchronous = synchronous
+        # A running writer thread is blocked on the existing queue, so a
+        # second create_app() in the same process only resizes it.
+        if getattr(self, '_queue', None) is None:
+            self._queue = queue.Queue(maxsize=queue_limit)
+        else:
+            with self._queue.mutex:
+                self._queue.maxsize = queue_limit
+        self._stats = {'batches': 0, 'rows': 0, 'retries': 0, 'failures': 0}
+
+    def init_app(self, app):
+        self.app = app
+
+    def _ensure_thread(self):
+        # Started on first use so CLI commands and migrations never spawn it.
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='action-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, rows):
+        """Queue rows for the next batch; returns a Future resolved once they are committed."""
+        self._ensure_thread()
+        submission = _Submission(rows, current_location())
+        try:
+            self._queue.put(submission, timeout=self.wait_timeout)
+        except queue.Full:
+            raise WriteQueueBusy()
+        return submission.future
+
+    def write(self, rows):
+        """Insert rows through the writer and block until their batch is durable."""
+        future = self.submit(rows)
+        try:
+            return future.result(timeout=self.wait_timeout)
+        except FutureTimeout:
+            # The batch may still commit; the caller only stops waiting.
+            raise WriteQueueBusy()
+
+    def stats(self):
+        return dict(self._stats, queued=self._queue.qsize())
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0].rows)
+        deadline = time.monotonic() + self.max_delay
+        while size < self.max_batch_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                submission = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(submission)
+            size += len(submission.rows)
+        return batch
+
+    def _run(self):
+        while True:
+            by_location = {}
+            for submission in self._collect():
+                by_location.setdefault(submission.location, []).append(submission)
+            for location, batch in by_location.items():
+                # location_context() also removes the session afterwards.
+                with location_context(location, self.app):
+                    self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self._commit_batch(batch)
+        except Exception as e:
+            # A bad row fails the whole transaction; retry one by one so
+            # only the offending request sees the error.
+            if len(batch) == 1:
+                self._stats['failures'] += 1
+                batch[0].future.set_exception(e)
+                return
+            for submission in batch:
+                try:
+                    self._commit_batch([submission])
+                except Exception as e:
+                    self._stats['failures'] += 1
+                    submission.future.set_exception(e)
+
+    def _commit_batch(self, batch):
+        from .ledger import insert_actions
+
+        rows = [row for submission in batch for row in submission.rows]
+        # Acknowledged means durable: fsync the WAL on this commit even though
+        # pooled connections normally run with synchronous = NORMAL. The
+        # session is pinned to one connection so the pragma, every attempt's
+        # commit and the reset all happen on it.
+        engine = db.session.get_bind()
+        db.session.remove()
+        with engine.connect() as conn:
+            conn.execute(text(f"PRAGMA synchronous = {self.synchronous}"))
+            conn.commit()
+            db.session(bind=conn)
+            try:
+                for attempt in range(self.retries + 1):
+                    try:
+                        insert_actions(rows)
+                        db.session.commit()
+                        break
+                    except Exception as e:
+                        db.session.rollback()
+                        locked = isinstance(e, OperationalError) and 'locked' in str(e)
+                        if not locked or attempt == self.retries:
+                            raise
+                        self._stats['retries'] += 1
+                        time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+            finally:
+                db.session.remove()
+                conn.execute(text("PRAGMA synchronous = NORMAL"))
+                conn.commit()
+
+        self._stats['batches'] += 1
+        self._stats['rows'] += len(rows)
+        for submission in batch:
+            submission.future.set_result(len(submission.rows))
+
+
+action_writer = ActionWriter()
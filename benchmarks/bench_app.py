@@ -0,0 +1,269 @@
+"""End-to-end request benchmark on a synthetic ledger.
+
+Generates a seeded database with benchmarks/synthetic.py, builds the derived
+tables through the app's migrations, then drives login, /inventory,
+/action, /reports and the daily report API with the Flask test client.
+For each scenario it prints latency percentiles, SQL statements per
+request (including those the action writer thread runs on the request's
+behalf) and the peak Python memory of one request:
+
+    python benchmarks/bench_app.py --actions 100000 --items 2000 --years 3
+    python benchmarks/bench_app.py --actions 1000000 --db /tmp/bench-1m.db --save-baseline baseline.json
+    python benchmarks/bench_app.py --actions 1000000 --db /tmp/bench-1m.db --baseline baseline.json
+
+--db keeps the generated and migrated database so later runs skip the
+setup; every run works on a scratch copy, so posted actions don't pile up.
+With --baseline the run is compared against a saved result and exits 1 when
+a scenario's p95 grows by more than --tolerance or it issues more queries.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks._util import percentile  # noqa: E402
+from benchmarks.synthetic import generate  # noqa: E402
+
+PASSWORD = 'bench-password'
+
+
+def prepare(args, workdir):
+    """Return the path of a migrated database for this run, generating it if needed."""
+    path = args.db or os.path.join(workdir, 'source.db')
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        generate(path, args.actions, args.items, args.categories, args.years, args.seed)
+        print(f"generated {args.actions} actions in {time.perf_counter() - started:.1f}s")
+
+        from app import create_app
+        os.environ['DATABASE_PATH'] = path
+        started = time.perf_counter()
+        create_app()
+        print(f"migrated in {time.perf_counter() - started:.1f}s")
+
+    scratch = os.path.join(workdir, 'inventory.db')
+    shutil.copy(path, scratch)
+    return scratch
+
+
+def scenarios(rng, items, first_day, last_day):
+    span = (last_day - first_day).days
+
+    def some_item():
+        # Mostly the busy items, like real traffic; synthetic ids are popularity-ordered.
+        return items[min(len(items) - 1, int(rng.paretovariate(1.2)) - 1)]
+
+    def some_day():
+        return (first_day + timedelta(days=rng.randrange(span))).isoformat()
+
+    def login(client):
+        response = client.post('/login', data={'username': 'bench', 'password': PASSWORD})
+        client.get('/logout')
+        return response
+
+    def inventory(client):
+        return client.get('/inventory')
+
+    def inventory_as_of(client):
+        return client.get('/inventory', query_string={'as_of': some_day()})
+
+    def action(client):
+        item_id, category_id, unit_id = some_item()
+        return client.post('/action', data={
+            'date': last_day.isoformat(),
+            'action_type': rng.choice(('delivery', 'sales', 'consumption')),
+            'category_id[]': [category_id] * 3,
+            'item_id[]': [item_id] * 3,
+            'unit_id[]': [unit_id] * 3,
+            'quantity[]': ['2'] * 3,
+            'price[]': ['5.00'] * 3,
+        })
+
+    def reports(client):
+        return client.get('/reports', query_string={'item_id': some_item()[0]})
+
+    def reports_range(client):
+        start = some_day()
+        end = min(last_day, date.fromisoformat(start) + timedelta(days=90)).isoformat()
+        return client.get('/reports', query_string={'item_id': some_item()[0], 'start_date': start, 'end_date': end})
+
+    def daily_api(client):
+        start = some_day()
+        end = min(last_day, date.fromisoformat(start) + timedelta(days=30)).isoformat()
+        return client.get('/api/reports/daily', query_string={
+            'item_id': [some_item()[0] for _ in range(5)], 'start_date': start, 'end_date': end,
+        })
+
+    return [
+        ('login', login, 302),
+        ('inventory', inventory, 200),
+        ('inventory_as_of', inventory_as_of, 200),
+        ('action', action, 302),
+        ('reports', reports, 200),
+        ('reports_range', reports_range, 200),
+        ('daily_api', daily_api, 200),
+    ]
+
+
+def run(args, path):
+    os.environ['DATABASE_PATH'] = path
+    os.environ.setdefault('METRICS_ENABLED', '1')  # so raw read_connection() statements are counted
+    # SNAPSHOT_ENABLED=1 runs as-of inventory and reports on the ledger snapshot, built in the scratch dir.
+    os.environ.setdefault('SNAPSHOT_DIR', os.path.join(os.path.dirname(path), 'snapshots'))
+
+    from sqlalchemy import event, text
+    from app import create_app
+    from app.extensions import db
+    from app.passwords import password_hasher
+
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['QUERY_COUNT_HEADER'] = True
+    with app.app_context():
+        db.session.execute(text("DELETE FROM user WHERE username = 'bench'"))
+        user_id = db.session.execute(
+            text("INSERT INTO user (username, email, password_hash) VALUES ('bench', 'bench@example.com', :h) RETURNING id"),
+            {"h": password_hasher.hash(PASSWORD)}
+        ).scalar()
+        # Item -> (category, unit) as the generator assigned them.
+        items = db.session.execute(text("""
+            SELECT item_id, MIN(category_id), MIN(unit_id) FROM actions GROUP BY item_id ORDER BY item_id
+        """)).fetchall()
+        first_day, last_day = db.session.execute(text("SELECT MIN(date), MAX(date) FROM actions")).one()
+        db.session.commit()
+
+        # /action commits on the writer thread, outside the request's
+        # X-Query-Count; count its statements here and add them per request.
+        writer_statements = [0]
+
+        def count_writer_statement(*_):
+            if threading.current_thread().name == 'action-writer':
+                writer_statements[0] += 1
+
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', count_writer_statement)
+
+    rng = random.Random(args.seed)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    results = {}
+    cases = scenarios(rng, [tuple(row) for row in items], date.fromisoformat(first_day), date.fromisoformat(last_day))
+    for name, request, expected in cases:
+        if args.only and name not in args.only:
+            continue
+        # The login scenario logs its own client in and out.
+        target = app.test_client() if name == 'login' else client
+
+        for _ in range(args.warmup):
+            request(target)
+
+        latencies, queries, errors = [], [], 0
+        for _ in range(args.requests):
+            written = writer_statements[0]
+            started = time.perf_counter()
+            response = request(target)
+            latencies.append(time.perf_counter() - started)
+            # write() returns once the batch is committed, so its statements are in.
+            queries.append(int(response.headers.get('X-Query-Count', 0)) + writer_statements[0] - written)
+            if response.status_code != expected:
+                errors += 1
+
+        # Peak allocation of one request, measured separately since tracing slows everything down.
+        tracemalloc.start()
+        request(target)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = {
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'queries': sum(queries) / len(queries),
+            'peak_kb': peak / 1024,
+            'errors': errors,
+        }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print deltas against a saved run; return the names of regressed scenarios."""
+    regressed = []
+    print(f"\n{'vs baseline':<16} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>9} {'peak':>9}")
+    for name, row in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+
+        def delta(key):
+            return (row[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+
+        print(f"{name:<16} " + " ".join(f"{delta(k):+8.1f}%" for k in ('p50_ms', 'p95_ms', 'p99_ms', 'queries', 'peak_kb')))
+        if row['p95_ms'] > base['p95_ms'] * (1 + tolerance) or row['queries'] > base['queries']:
+            regressed.append(name)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--actions", type=int, default=100000)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--categories", type=int, default=None)
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="keep the generated database here and reuse it")
+    parser.add_argument("--requests", type=int, default=50, help="timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--only", nargs="*", help="run only these scenarios")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--baseline", metavar="FILE")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth vs the baseline")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        results = run(args, prepare(args, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # A reused --db keeps the sizes it was generated with.
+    print(f"\nactions={args.actions} items={args.items} years={args.years} seed={args.seed} requests={args.requests}"
+          + (f" db={args.db}" if args.db else ""))
+    print(f"{'scenario':<16} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>9} {'peak KB':>9} {'errors':>7}")
+    for name, row in results.items():
+        print(f"{name:<16} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} {row['p99_ms']:9.2f} "
+              f"{row['queries']:9.1f} {row['peak_kb']:9.0f} {row['errors']:7d}")
+    print(f"process max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    params = {k: getattr(args, k) for k in ('actions', 'items', 'categories', 'years', 'seed')}
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'params': params, 'scenarios': results}, f, indent=2)
+        print(f"saved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['params'] != params:
+            print(f"warning: baseline was recorded with {baseline['params']}")
+        regressed = compare(results, baseline['scenarios'], args.tolerance)
+        if regressed:
+            print(f"regressed: {', '.join(regressed)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
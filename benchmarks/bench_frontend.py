@@ -0,0 +1,124 @@
+"""Bytes on the wire and cold-start render time for the main pages.
+
+Runs the app in-process against a scratch copy of instance/inventory.db.
+For each page it reports the HTML size as sent to a gzip-capable browser,
+how many of its scripts and stylesheets come from a CDN, and what a repeat
+visit still has to fetch or revalidate. Cold start starts fresh Python
+processes and times create_app() plus the first render of every page; the
+first run starts with an empty Jinja bytecode cache, the later ones reuse it:
+
+    python benchmarks/bench_frontend.py
+    python benchmarks/bench_frontend.py --cold-runs 5
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGES = ('/inventory', '/action', '/reports', '/low-stock')
+ASSET_RE = re.compile(r'<(?:script[^>]+src|link[^>]+href)="([^"]+\.(?:js|css)|[^"]*chart\.js)"')
+
+COLD_START = """
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+from app import create_app
+app = create_app()
+boot = time.perf_counter() - started
+client = app.test_client()
+with client.session_transaction() as session:
+    session['_user_id'] = os.environ['BENCH_USER_ID']
+    session['_fresh'] = True
+renders = {{}}
+for page in {pages!r}:
+    t = time.perf_counter()
+    client.get(page)
+    renders[page] = time.perf_counter() - t
+print(json.dumps({{'boot': boot, 'renders': renders}}))
+"""
+
+
+def page_weight(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    rows = []
+    for page in PAGES:
+        response = client.get(page, headers={'Accept-Encoding': 'gzip'})
+        html = client.get(page).get_data(as_text=True)
+        assets = ASSET_RE.findall(html)
+        cdn = [url for url in assets if url.startswith('http')]
+        # A repeat visit revalidates (or refetches) everything not marked immutable.
+        revalidated = 0
+        for url in assets:
+            if url.startswith('http'):
+                revalidated += 1
+                continue
+            cache_control = client.get(url).headers.get('Cache-Control', '')
+            if 'immutable' not in cache_control:
+                revalidated += 1
+        rows.append((page, len(html.encode()), len(response.get_data()), response.headers.get('Content-Encoding', '-'),
+                     len(assets), len(cdn), revalidated))
+    return rows
+
+
+def cold_start(env, runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START.format(root=ROOT, pages=PAGES)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cold-runs", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'inventory.db')
+    os.environ['JINJA_CACHE_DIR'] = os.path.join(workdir, 'jinja')
+    os.environ.setdefault('METRICS_ENABLED', '0')
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    shutil.copy(os.path.join(ROOT, 'instance', 'inventory.db'), os.environ['DATABASE_PATH'])
+
+    from sqlalchemy import text
+    from app import create_app
+    from app.extensions import db
+
+    app = create_app()
+    with app.app_context():
+        user_id = db.session.execute(text("SELECT id FROM user LIMIT 1")).scalar()
+
+    print(f"{'page':<12} {'html':>9} {'sent':>9} {'encoding':>9} {'assets':>7} {'cdn':>5} {'repeat':>7}")
+    for page, raw, sent, encoding, assets, cdn, revalidated in page_weight(app, user_id):
+        print(f"{page:<12} {raw:9d} {sent:9d} {encoding:>9} {assets:7d} {cdn:5d} {revalidated:7d}")
+    print("html/sent: bytes without and with Accept-Encoding: gzip; repeat: assets a repeat view refetches or revalidates")
+
+    env = dict(os.environ, BENCH_USER_ID=str(user_id))
+    shutil.rmtree(os.environ['JINJA_CACHE_DIR'], ignore_errors=True)
+    runs = cold_start(env, args.cold_runs)
+    print(f"\n{'cold start':<12} {'boot ms':>9} " + " ".join(f"{page:>11}" for page in PAGES) + f" {'total':>9}")
+    for i, run in enumerate(runs):
+        label = 'empty cache' if i == 0 else f'warm #{i}'
+        renders = [run['renders'][page] * 1000 for page in PAGES]
+        print(f"{label:<12} {run['boot'] * 1000:9.1f} " + " ".join(f"{ms:11.1f}" for ms in renders)
+              + f" {run['boot'] * 1000 + sum(renders):9.1f}")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
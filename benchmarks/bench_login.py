@@ -0,0 +1,95 @@
+"""Login throughput under concurrent clients.
+
+Runs the app against a scratch copy of instance/inventory.db. Several
+client threads log in repeatedly while a probe thread keeps requesting a
+cheap page, so the output shows both login throughput and how much the
+hashing slows unrelated requests:
+
+    python benchmarks/bench_login.py --clients 16 --logins 10
+    PASSWORD_HASH_WORKERS=4 python benchmarks/bench_login.py
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks._util import percentile  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--logins", type=int, default=10, help="logins per client")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'inventory.db')
+    shutil.copy(os.path.join(ROOT, 'instance', 'inventory.db'), os.environ['DATABASE_PATH'])
+
+    from sqlalchemy import text
+    from app import create_app
+    from app.extensions import db
+    from app.passwords import password_hasher
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        password_hash = password_hasher.hash('bench-password')
+        for i in range(args.clients):
+            db.session.execute(
+                text("INSERT INTO user (username, email, password_hash) VALUES (:u, :e, :h)"),
+                {"u": f"bench{i}", "e": f"bench{i}@example.com", "h": password_hash}
+            )
+        db.session.commit()
+
+    login_latencies = []
+    probe_latencies = []
+    done = threading.Event()
+
+    def client(i):
+        c = app.test_client()
+        for _ in range(args.logins):
+            started = time.perf_counter()
+            response = c.post('/login', data={'username': f'bench{i}', 'password': 'bench-password'})
+            login_latencies.append(time.perf_counter() - started)
+            assert response.status_code == 302, response.status_code
+            c.get('/logout')
+
+    def probe():
+        c = app.test_client()
+        while not done.is_set():
+            started = time.perf_counter()
+            c.get('/login')
+            probe_latencies.append(time.perf_counter() - started)
+
+    probe_thread = threading.Thread(target=probe)
+    probe_thread.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    probe_thread.join()
+
+    total = len(login_latencies)
+    print(f"method={password_hasher.method} clients={args.clients} logins={total}")
+    print(f"throughput:      {total / elapsed:8.1f} logins/sec")
+    print(f"login p50/p99:   {percentile(login_latencies, 50) * 1000:8.1f} / {percentile(login_latencies, 99) * 1000:.1f} ms")
+    print(f"other p50/p99:   {percentile(probe_latencies, 50) * 1000:8.1f} / {percentile(probe_latencies, 99) * 1000:.1f} ms"
+          f"  ({len(probe_latencies)} requests, mean {statistics.mean(probe_latencies or [0]) * 1000:.1f} ms)")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
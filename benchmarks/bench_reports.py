@@ -0,0 +1,133 @@
+"""Compare the old per-date rescan in reports() with app.reporting.item_report.
+
+Builds a ledger for one high-volume item over a year in a scratch database,
+lets the app's migrations build the derived tables (rollup, valuation) and
+times both implementations on it:
+
+    python benchmarks/bench_reports.py --per-day 40
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.reporting import item_report, report_filters
+from benchmarks.synthetic import base_schema
+
+ACTION_TYPES = ('delivery', 'sales', 'consumption', 'waste')
+
+
+def build_ledger(path, days, per_day, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    for ddl in base_schema():
+        conn.execute(ddl)
+    conn.execute("INSERT INTO category (id, name) VALUES (1, 'category')")
+    conn.execute("INSERT INTO item (id, name) VALUES (1, 'item')")
+    conn.execute("INSERT INTO unit (id, name) VALUES (1, 'kg')")
+    start = date(2024, 1, 1)
+    rows = []
+    for d in range(days):
+        day = (start + timedelta(days=d)).isoformat()
+        for _ in range(per_day):
+            atype = rng.choices(ACTION_TYPES, weights=(2, 6, 2, 1))[0]
+            quantity = round(rng.uniform(1, 20), 2)
+            price = round(quantity * rng.uniform(1, 5), 2) if atype == 'delivery' else None
+            rows.append((day, 1, 1, 1, quantity, price, atype))
+    conn.executemany(
+        "INSERT INTO actions (date, category_id, item_id, unit_id, quantity, price, action_type) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows
+    )
+    conn.commit()
+    conn.close()
+
+    from app import create_app
+    os.environ['DATABASE_PATH'] = path
+    create_app()
+
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn, len(rows)
+
+
+def legacy_report(conn, item_id):
+    # The loop reports() used before item_report existed
+    where_sql, params = report_filters(item_id, "", "")
+    rows = conn.execute(
+        f"SELECT date, action_type, quantity, price FROM actions WHERE {where_sql} ORDER BY date",
+        params
+    ).fetchall()
+
+    dates = sorted(set([row["date"] for row in rows]))
+    action_types = sorted(set([row["action_type"] for row in rows]))
+    chart_data = {atype: [] for atype in action_types}
+    balance_data = []
+    running = {atype: 0 for atype in action_types}
+    cumulative_balance = 0
+    total_spend = 0
+
+    for d in dates:
+        daily_rows = [r for r in rows if r["date"] == d]
+        for atype in action_types:
+            qty = sum(float(r["quantity"]) for r in daily_rows if r["action_type"] == atype)
+            running[atype] += qty
+            chart_data[atype].append(running[atype])
+        in_qty = sum(float(r["quantity"]) for r in daily_rows if r["action_type"].lower() == "delivery")
+        out_qty = sum(float(r["quantity"]) for r in daily_rows if r["action_type"].lower() in ("sales", "consumption", "waste"))
+        cumulative_balance += in_qty - out_qty
+        balance_data.append(cumulative_balance)
+        total_spend += sum(float(r["price"]) for r in daily_rows if r["action_type"].lower() == "delivery")
+
+    return dates, chart_data, balance_data, total_spend
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def compare(conn):
+    (dates, chart_data, balance_data, total_spend), legacy_ms = timed(legacy_report, conn, 1)
+    report, new_ms = timed(item_report, conn, 1)
+
+    assert report['dates'] == dates
+    assert all(
+        abs(a - b) < 1e-6
+        for atype in chart_data
+        for a, b in zip(report['chart_data'][atype], chart_data[atype])
+    )
+    assert all(abs(a - b) < 1e-6 for a, b in zip(report['balance_data'], balance_data))
+    assert abs(report['total_spend'] - total_spend) < 1e-6
+
+    print(f"legacy per-date rescan: {legacy_ms:10.1f} ms")
+    print(f"item_report:            {new_ms:10.1f} ms")
+    print(f"speedup:                {legacy_ms / new_ms:10.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--per-day", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-reports-')
+    try:
+        conn, count = build_ledger(os.path.join(workdir, 'inventory.db'), args.days, args.per_day, args.seed)
+        print(f"{count} actions over {args.days} days")
+        compare(conn)
+        conn.close()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Concurrent action posting: write latency and rows/sec.
+
+Runs the app in-process against a scratch copy of instance/inventory.db.
+Each client thread posts to /action like a station tablet. --processes
+runs that many app processes side by side on the same database file, the
+way several gunicorn workers would share it:
+
+    python benchmarks/bench_writes.py --clients 16 --posts 50
+    python benchmarks/bench_writes.py --processes 4 --clients 8
+    WRITE_QUEUE_ENABLED=0 python benchmarks/bench_writes.py   # one commit per request
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks._util import percentile  # noqa: E402
+
+
+def run_process(args, results):
+    from sqlalchemy import text
+    from app import create_app
+    from app.extensions import db
+    from app.writer import action_writer
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        user_id = db.session.execute(text("SELECT id FROM user LIMIT 1")).scalar()
+        refs = {
+            table: db.session.execute(text(f"SELECT id FROM {table} LIMIT 1")).scalar()
+            for table in ('category', 'item', 'unit')
+        }
+
+    form = {
+        'date': time.strftime('%Y-%m-%d'),
+        'action_type': 'delivery',
+        'category_id[]': [refs['category']] * args.rows,
+        'item_id[]': [refs['item']] * args.rows,
+        'unit_id[]': [refs['unit']] * args.rows,
+        'quantity[]': ['1'] * args.rows,
+        'price[]': ['2.50'] * args.rows,
+    }
+    latencies = []
+    errors = []
+
+    def client():
+        c = app.test_client()
+        with c.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        for _ in range(args.posts):
+            started = time.perf_counter()
+            try:
+                status = c.post('/action', data=form).status_code
+            except Exception as e:  # TESTING propagates view errors, e.g. 'database is locked'
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            if status != 302:
+                errors.append(status)
+
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.put((latencies, errors, action_writer.stats()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=8, help="posting threads per process")
+    parser.add_argument("--posts", type=int, default=50, help="posts per client")
+    parser.add_argument("--rows", type=int, default=3, help="action rows per post")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'inventory.db')
+    os.environ.setdefault('METRICS_ENABLED', '0')
+    shutil.copy(os.path.join(ROOT, 'instance', 'inventory.db'), os.environ['DATABASE_PATH'])
+
+    # Run migrations once up front so the workers don't race on them.
+    from app import create_app
+    create_app()
+
+    results = multiprocessing.Queue()
+    started = time.perf_counter()
+    workers = [multiprocessing.Process(target=run_process, args=(args, results)) for _ in range(args.processes)]
+    for p in workers:
+        p.start()
+    collected = [results.get() for _ in workers]
+    for p in workers:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = [value for latency, _, _ in collected for value in latency]
+    errors = [code for _, error, _ in collected for code in error]
+    batches = sum(stats['batches'] for _, _, stats in collected)
+    retries = sum(stats['retries'] for _, _, stats in collected)
+    rows = (len(latencies) - len(errors)) * args.rows
+
+    queue = os.getenv('WRITE_QUEUE_ENABLED', '1')
+    print(f"write_queue={queue} processes={args.processes} clients={args.clients} posts={len(latencies)} rows/post={args.rows}")
+    print(f"throughput:      {rows / elapsed:8.1f} rows/sec  ({len(latencies) / elapsed:.1f} posts/sec)")
+    print(f"write p50/p99:   {percentile(latencies, 50) * 1000:8.1f} / {percentile(latencies, 99) * 1000:.1f} ms")
+    if batches:
+        print(f"batches:         {batches:8d}  ({rows / batches:.1f} rows/batch, {retries} lock retries)")
+    if errors:
+        print(f"errors:          {len(errors):8d}  {sorted(set(map(str, errors)))}")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
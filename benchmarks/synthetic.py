@@ -0,0 +1,127 @@
+"""Seeded synthetic ledger for benchmarks.
+
+Creates a fresh database with the same base tables as instance/inventory.db
+and fills category, item, unit and actions. Item popularity is skewed (a
+few items get most of the traffic), each item keeps one category and unit,
+and delivery prices drift over time. The same seed and sizes always give
+the same database.
+
+    python benchmarks/synthetic.py --actions 1000000 --items 5000 --years 3 --out /tmp/bench.db
+
+Derived tables (stock_balance, rollup, checkpoints, valuation) are built by
+the app's migrations the first time create_app() opens the file.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_TABLES = ('category', 'item', 'unit', 'user', 'inventory', 'actions')
+UNITS = ('kg', 'g', 'l', 'ml', 'pcs', 'box', 'case', 'bottle', 'pack', 'dozen')
+CHUNK = 50000
+
+
+def base_schema(template=os.path.join(ROOT, 'instance', 'inventory.db')):
+    conn = sqlite3.connect(template)
+    try:
+        names = ", ".join(f"'{name}'" for name in BASE_TABLES)
+        return [row[0] for row in conn.execute(
+            f"SELECT sql FROM sqlite_master WHERE type = 'table' AND name IN ({names})"
+        )]
+    finally:
+        conn.close()
+
+
+def action_rows(rng, actions, items, days, start):
+    # Zipf-like popularity: item k is picked with weight 1 / (k + 1).
+    weights = [1.0 / (k + 1) for k in range(len(items))]
+    types = ('delivery', 'sales', 'consumption', 'waste')
+    type_weights = (2, 6, 2, 1)
+    produced = 0
+    while produced < actions:
+        n = min(CHUNK, actions - produced)
+        picks = rng.choices(items, weights=weights, k=n)
+        kinds = rng.choices(types, weights=type_weights, k=n)
+        offsets = sorted(rng.randrange(days) for _ in range(n))
+        chunk = []
+        for (item_id, category_id, unit_id, base_price), kind, offset in zip(picks, kinds, offsets):
+            quantity = round(rng.uniform(1, 40), 2)
+            price = None
+            if kind == 'delivery':
+                drift = 1 + 0.3 * offset / days
+                price = round(quantity * base_price * drift * rng.uniform(0.9, 1.1), 2)
+            chunk.append(((start + timedelta(days=offset)).isoformat(), category_id, item_id, unit_id, quantity, price, kind))
+        produced += n
+        yield chunk
+
+
+def generate(path, actions=10000, items=500, categories=None, years=2, seed=42):
+    """Write a synthetic database to path and return the number of actions."""
+    rng = random.Random(seed)
+    categories = categories or max(5, items // 25)
+    if os.path.exists(path):
+        os.remove(path)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    for ddl in base_schema():
+        conn.execute(ddl)
+
+    conn.executemany("INSERT INTO category (id, name) VALUES (?, ?)",
+                     [(i + 1, f"category-{i + 1:04d}") for i in range(categories)])
+    conn.executemany("INSERT INTO unit (id, name) VALUES (?, ?)",
+                     [(i + 1, name) for i, name in enumerate(UNITS)])
+    catalog = []
+    for i in range(items):
+        item_id = i + 1
+        catalog.append((item_id, rng.randint(1, categories), rng.randint(1, len(UNITS)), rng.uniform(0.5, 30)))
+    conn.executemany("INSERT INTO item (id, name) VALUES (?, ?)",
+                     [(item_id, f"item-{item_id:06d}") for item_id, _, _, _ in catalog])
+
+    # Spread rows over the years ending yesterday so every month but the
+    # current one is closed and gets checkpointed.
+    days = int(years * 365)
+    start = date.today() - timedelta(days=days)
+    for chunk in action_rows(rng, actions, catalog, days, start):
+        conn.executemany(
+            "INSERT INTO actions (date, category_id, item_id, unit_id, quantity, price, action_type) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            chunk
+        )
+    conn.commit()
+    conn.close()
+    return actions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--actions", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--categories", type=int, default=None)
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--migrate", action="store_true", help="also build the derived tables now")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    generate(args.out, args.actions, args.items, args.categories, args.years, args.seed)
+    print(f"{args.actions} actions over {args.items} items in {time.perf_counter() - started:.1f}s")
+
+    if args.migrate:
+        sys.path.insert(0, ROOT)
+        os.environ['DATABASE_PATH'] = args.out
+        from app import create_app
+
+        started = time.perf_counter()
+        create_app()
+        print(f"migrations in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BASE_TABLES = ('category', 'item', 'unit', 'user', 'inventory', 'actions')
+ITEMS = 3
+UNITS = 2
+# The ledger covers the months before today, so checkpoints exist for most of it.
+START = (date.today() - timedelta(days=200)).replace(day=1)
+
+
+def scratch_database(path):
+    """An empty database with instance/inventory.db's base tables and no migrations applied."""
+    template = sqlite3.connect(os.path.join(ROOT, 'instance', 'inventory.db'))
+    names = ", ".join(f"'{name}'" for name in BASE_TABLES)
+    schema = [row[0] for row in template.execute(
+        f"SELECT sql FROM sqlite_master WHERE type = 'table' AND name IN ({names})"
+    )]
+    template.close()
+
+    conn = sqlite3.connect(path)
+    for ddl in schema:
+        conn.execute(ddl)
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """A migrated app on a scratch database with a few categories, items and units."""
+    path = str(tmp_path / 'inventory.db')
+    scratch_database(path)
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO category (id, name) VALUES (1, 'category-1')")
+    conn.executemany("INSERT INTO item (id, name) VALUES (?, ?)", [(i, f"item-{i}") for i in range(1, ITEMS + 1)])
+    conn.executemany("INSERT INTO unit (id, name) VALUES (?, ?)", [(u, f"unit-{u}") for u in range(1, UNITS + 1)])
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setenv('DATABASE_PATH', path)
+    monkeypatch.setenv('SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    monkeypatch.setenv('LOCATIONS_DIR', str(tmp_path / 'locations'))
+    monkeypatch.setenv('JINJA_CACHE_DIR', '')
+    monkeypatch.setenv('SECRET_KEY', 'test')
+
+    from app import create_app, lookups, snapshot
+    # Per-process caches are keyed by version counters, which restart in every scratch database.
+    lookups._cached.clear()
+    snapshot._open.clear()
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as a fresh user."""
+    from sqlalchemy import text
+    from app.extensions import db
+
+    user_id = db.session.execute(
+        text("INSERT INTO user (username, email, password_hash) VALUES ('test', 'test@example.com', '-') RETURNING id")
+    ).scalar()
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def action_row(day, action_type, item_id, unit_id, quantity, price=None):
+    return {
+        'date': day, 'action_type': action_type, 'category_id': 1, 'item_id': item_id, 'unit_id': unit_id,
+        'quantity': quantity, 'price': price, 'photo_path': None,
+    }
+
+
+def random_ledger(rng, count=300, days=180):
+    """Deliveries and outflows in date order, with stock running out now and then."""
+    rows = []
+    for offset in sorted(rng.randrange(days) for _ in range(count)):
+        action_type = rng.choice(('delivery', 'delivery', 'sales', 'consumption', 'waste'))
+        quantity = rng.choice((1, 2, 3, 5, 8, 0.5))
+        price = round(quantity * rng.uniform(1, 9), 2) if action_type == 'delivery' and rng.random() > 0.1 else None
+        day = (START + timedelta(days=offset)).isoformat()
+        rows.append(action_row(day, action_type, rng.randint(1, ITEMS), rng.randint(1, UNITS), quantity, price))
+    return rows
+
+
+def write_ledger(rng, rows, late=20):
+    """Insert rows through the ledger in small committed batches, then some back-dated ones."""
+    from app.extensions import db
+    from app.ledger import insert_actions
+
+    pending = list(rows)
+    back_dated = [pending.pop(rng.randrange(len(pending))) for _ in range(late)]
+    while pending:
+        size = rng.randint(1, 6)
+        insert_actions(pending[:size])
+        db.session.commit()
+        del pending[:size]
+    for row in back_dated:
+        insert_actions([row])
+        db.session.commit()
+
+
+def delete_some(rng, count=15):
+    from sqlalchemy import text
+    from app.extensions import db
+    from app.ledger import remove_action
+
+    ids = [row.id for row in db.session.execute(text("SELECT id FROM actions"))]
+    for action_id in rng.sample(ids, count):
+        remove_action(action_id)
+        db.session.commit()
+
+
+def table_rows(sql):
+    """Every row of a query as plain tuples, for comparing derived tables with their rebuilds."""
+    from sqlalchemy import text
+    from app.extensions import db
+
+    return [tuple(row) for row in db.session.execute(text(sql))]
@@ -0,0 +1,72 @@
+from sqlalchemy import text
+
+from app.changes import compact_changes
+from app.extensions import db
+from app.ledger import insert_actions, remove_action
+from conftest import action_row
+
+
+def make_changes():
+    insert_actions([action_row('2026-03-01', 'delivery', 1, 1, 5, 10.0) for _ in range(3)])
+    db.session.commit()
+    db.session.execute(text("UPDATE actions SET quantity = 7 WHERE id = 1"))
+    db.session.execute(text("UPDATE item SET name = 'renamed' WHERE id = 2"))
+    db.session.commit()
+    remove_action(2)
+    db.session.commit()
+
+
+def read_feed(client, since='0', limit=2):
+    """Page through /changes; returns every change and the final cursor."""
+    changes = []
+    while True:
+        body = client.get(f'/changes?since={since}&limit={limit}').get_json()
+        changes.extend(body['changes'])
+        assert body['next_cursor'] == (str(changes[-1]['seq']) if body['changes'] else since)
+        since = body['next_cursor']
+        if not body['has_more']:
+            return changes, since
+
+
+def replay(changes):
+    """Apply a feed the way a consumer would: inserts and updates as upserts."""
+    rows = {}
+    for change in changes:
+        key = (change['table'], change['id'])
+        if change['op'] == 'delete':
+            rows.pop(key, None)
+        else:
+            rows[key] = change['data']
+    return rows
+
+
+def test_cursor_pages_through_every_change_once(client):
+    make_changes()
+    changes, cursor = read_feed(client)
+
+    assert [(c['table'], c['id'], c['op']) for c in changes] == [
+        ('actions', 1, 'insert'), ('actions', 2, 'insert'), ('actions', 3, 'insert'),
+        ('actions', 1, 'update'), ('item', 2, 'update'), ('actions', 2, 'delete'),
+    ]
+    seqs = [c['seq'] for c in changes]
+    assert seqs == sorted(set(seqs))
+
+    body = client.get(f'/changes?since={cursor}').get_json()
+    assert body == {'changes': [], 'next_cursor': cursor, 'has_more': False}
+    assert client.get('/changes?since=abc').status_code == 400
+
+
+def test_compaction_keeps_the_replayed_state(client):
+    make_changes()
+    full, cursor = read_feed(client)
+    db.session.execute(text("UPDATE change_log SET changed_at = datetime('now', '-2 days')"))
+    db.session.commit()
+
+    assert compact_changes(1) == 2
+    db.session.commit()
+    compacted, compacted_cursor = read_feed(client)
+
+    assert compacted_cursor == cursor
+    assert replay(compacted) == replay(full)
+    assert ('actions', 2) not in replay(compacted)
+    assert replay(compacted)[('actions', 1)]['quantity'] == 7
@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+from app.checkpoints import rebuild_checkpoints
+from app.extensions import db
+from app.ledger import insert_actions
+from conftest import START, action_row, delete_some, random_ledger, table_rows, write_ledger
+
+CHECKPOINT_SQL = "SELECT * FROM stock_checkpoint ORDER BY item_id, unit_id, period_end"
+LAYER_SQL = "SELECT * FROM stock_checkpoint_layer ORDER BY item_id, unit_id, period_end, seq"
+PERIOD_SQL = "SELECT period_end FROM stock_checkpoint_period ORDER BY period_end"
+
+
+def assert_matches_rebuild():
+    incremental = table_rows(CHECKPOINT_SQL), table_rows(LAYER_SQL), table_rows(PERIOD_SQL)
+    rebuild_checkpoints()
+    db.session.commit()
+
+    assert table_rows(PERIOD_SQL) == incremental[2]
+    assert table_rows(LAYER_SQL) == incremental[1]
+    rebuilt = table_rows(CHECKPOINT_SQL)
+    assert len(rebuilt) == len(incremental[0])
+    for row, kept in zip(rebuilt, incremental[0]):
+        assert row == pytest.approx(kept)
+
+
+def test_touched_checkpoints_match_a_rebuild(app):
+    rng = random.Random(11)
+    write_ledger(rng, random_ledger(rng), late=40)
+    delete_some(rng, count=30)
+    assert table_rows(PERIOD_SQL)
+    assert_matches_rebuild()
+
+
+def test_insert_before_the_first_period_matches_a_rebuild(app):
+    rng = random.Random(13)
+    write_ledger(rng, random_ledger(rng), late=0)
+    first = table_rows(PERIOD_SQL)[0]
+
+    insert_actions([action_row(START.replace(year=START.year - 1).isoformat(), 'delivery', 1, 1, 4, 10.0)])
+    db.session.commit()
+
+    assert table_rows(PERIOD_SQL)[0] < first
+    assert_matches_rebuild()
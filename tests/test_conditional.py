@@ -0,0 +1,51 @@
+from app.extensions import db
+from app.ledger import insert_actions
+from conftest import action_row
+
+
+def test_unchanged_pages_answer_304(client):
+    first = client.get('/inventory')
+    assert first.status_code == 200
+    etag, weak = first.get_etag()
+    assert weak
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    again = client.get('/inventory', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.get_etag() == (etag, True)
+
+    # gzip on the way out must not change the validator.
+    zipped = client.get('/inventory', headers={'If-None-Match': first.headers['ETag'], 'Accept-Encoding': 'gzip'})
+    assert zipped.status_code == 304
+
+
+def test_writes_and_other_arguments_change_the_etag(client):
+    first = client.get('/inventory')
+    validator = {'If-None-Match': first.headers['ETag']}
+
+    other = client.get('/inventory?as_of=2026-01-31', headers=validator)
+    assert other.status_code == 200
+    assert other.get_etag()[0] != first.get_etag()[0]
+
+    insert_actions([action_row('2026-03-01', 'delivery', 1, 1, 5, 10.0)])
+    db.session.commit()
+    changed = client.get('/inventory', headers=validator)
+    assert changed.status_code == 200
+    assert changed.get_etag()[0] != first.get_etag()[0]
+    assert b'item-1' in changed.data
+
+    assert client.get('/inventory', headers={'If-None-Match': changed.headers['ETag']}).status_code == 304
+
+
+def test_build_and_valuation_method_change_the_etag(app, client):
+    first = client.get('/inventory')
+    validator = {'If-None-Match': first.headers['ETag']}
+
+    app.config['VALUATION_METHOD'] = 'average'
+    assert client.get('/inventory', headers=validator).status_code == 200
+    app.config['VALUATION_METHOD'] = 'fifo'
+    assert client.get('/inventory', headers=validator).status_code == 304
+
+    app.config['BUILD_ID'] = 'next-release'
+    assert client.get('/inventory', headers=validator).status_code == 200
@@ -0,0 +1,93 @@
+import io
+import json
+
+import pytest
+from sqlalchemy import text
+
+from app.extensions import db
+from app.importer import import_actions
+from app.ledger import validate_amounts
+
+CSV = """date,action_type,category,item,unit,quantity,price
+2026-03-01,delivery,category-1,item-1,unit-1,5,20
+2026-03-02,sales,Category-1, ITEM-1 ,unit-1,2,
+2026-03-02,theft,category-1,item-1,unit-1,1,
+2026-03-03,sales,category-1,item-9,unit-1,1,
+not a date,sales,category-1,item-1,unit-1,1,
+2026-03-04,sales,category-1,item-1,unit-1,-1,
+2026-03-04,sales,category-1,item-1,,1,
+2026-03-05,delivery,category-1,item-2,unit-2,abc,3
+03.03.2026,waste,category-1,item-2,unit-2,1,
+"""
+
+
+def ledger():
+    return [tuple(row) for row in db.session.execute(
+        text("SELECT date, action_type, item_id, unit_id, quantity, price FROM actions ORDER BY id")
+    )]
+
+
+def test_csv_errors_are_reported_by_line_and_good_rows_imported(app):
+    result = import_actions(io.BytesIO(CSV.encode()), 'csv', batch_size=2)
+
+    assert result['imported'] == 3
+    assert result['failed'] == 6
+    assert [(error['line'], error['error'].split()[0]) for error in result['errors']] == [
+        (4, 'Unknown'), (5, 'Unknown'), (6, 'Unrecognised'), (7, 'Quantity'), (8, 'Missing'), (9, 'Please'),
+    ]
+    assert ledger() == [
+        ('2026-03-01', 'delivery', 1, 1, 5.0, 20.0),
+        ('2026-03-02', 'sales', 1, 1, 2.0, None),
+        ('2026-03-03', 'waste', 2, 2, 1.0, None),
+    ]
+
+
+def test_jsonl_reports_malformed_lines(app):
+    lines = [
+        json.dumps({'date': '2026-03-01', 'action_type': 'delivery', 'category_id': 1, 'item_id': 2, 'unit_id': 1,
+                    'quantity': 3, 'price': 9}),
+        '{"date": "2026-03-01",',
+        '',
+        '[1, 2]',
+        json.dumps({'date': '2026-03-01', 'action_type': 'sales', 'category_id': 1, 'item_id': 'x', 'unit_id': 1,
+                    'quantity': 1}),
+        json.dumps({'date': '2026-03-01', 'action_type': 'sales', 'category_id': 1, 'item_id': 7, 'unit_id': 1,
+                    'quantity': 1}),
+    ]
+    result = import_actions(io.BytesIO("\n".join(lines).encode()), 'jsonl')
+
+    assert result['imported'] == 1
+    assert [error['line'] for error in result['errors']] == [2, 4, 5, 6]
+    messages = [error['error'] for error in result['errors']]
+    assert messages[0].startswith("Invalid JSON")
+    assert messages[1:] == ["Each line must be a JSON object", "item_id must be an integer", "Unknown item_id 7"]
+    assert ledger() == [('2026-03-01', 'delivery', 2, 1, 3.0, 9.0)]
+
+
+def test_error_list_is_capped(app, monkeypatch):
+    monkeypatch.setattr('app.importer.MAX_REPORTED_ERRORS', 3)
+    rows = "date,action_type,category,item,unit,quantity,price\n" + "2026-03-01,theft,category-1,item-1,unit-1,1,\n" * 10
+    result = import_actions(io.BytesIO(rows.encode()), 'csv')
+
+    assert result['failed'] == 10
+    assert len(result['errors']) == 3
+    assert ledger() == []
+
+
+@pytest.mark.parametrize('quantity, price', [
+    ('nan', ''), ('inf', '3'), ('-inf', ''), ('1e400', ''), ('2', 'nan'), ('2', 'Infinity'),
+])
+def test_non_finite_amounts_are_rejected(quantity, price):
+    with pytest.raises(ValueError, match="valid numeric values"):
+        validate_amounts(quantity, price)
+
+
+def test_non_finite_amounts_fail_their_import_line(app):
+    rows = ("date,action_type,category,item,unit,quantity,price\n"
+            "2026-03-01,delivery,category-1,item-1,unit-1,NaN,4\n"
+            "2026-03-01,delivery,category-1,item-1,unit-1,2,inf\n"
+            "2026-03-01,delivery,category-1,item-1,unit-1,2,4\n")
+    result = import_actions(io.BytesIO(rows.encode()), 'csv')
+
+    assert [error['line'] for error in result['errors']] == [2, 3]
+    assert ledger() == [('2026-03-01', 'delivery', 1, 1, 2.0, 4.0)]
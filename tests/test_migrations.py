@@ -0,0 +1,34 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from conftest import ROOT, scratch_database
+
+BOOT = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from app import create_app
+create_app()
+"""
+
+
+def test_workers_booting_together_migrate_once(tmp_path):
+    path = str(tmp_path / 'inventory.db')
+    scratch_database(path)
+    env = dict(os.environ, DATABASE_PATH=path, SNAPSHOT_DIR=str(tmp_path / 'snapshots'),
+               LOCATIONS_DIR=str(tmp_path / 'locations'), JINJA_CACHE_DIR='', SECRET_KEY='test')
+
+    workers = [
+        subprocess.Popen([sys.executable, '-c', BOOT, ROOT], env=env, stderr=subprocess.PIPE, text=True)
+        for _ in range(6)
+    ]
+    errors = [worker.communicate(timeout=60)[1] for worker in workers]
+
+    assert [worker.returncode for worker in workers] == [0] * len(workers), errors
+    conn = sqlite3.connect(path)
+    versions = [row[0] for row in conn.execute("SELECT version FROM schema_migrations ORDER BY version")]
+    conn.close()
+
+    from app.migrations import MIGRATIONS
+    assert versions == [version for version, _, _ in MIGRATIONS]
@@ -0,0 +1,5 @@
+def test_hot_queries_use_their_indexes(app):
+    from app.migrations import MIGRATIONS, applied_versions, check_query_plans
+
+    assert applied_versions() == {version for version, _, _ in MIGRATIONS}
+    assert check_query_plans() == []
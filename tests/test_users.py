@@ -0,0 +1,32 @@
+from sqlalchemy import text
+
+from app.extensions import db
+from app.users import get_user, user_cache
+
+
+def request_user(app, user_id):
+    # Each request gets its own app context, and with it a fresh read of cache_versions.
+    with app.app_context():
+        return get_user(user_id)
+
+
+def test_assigning_a_location_reaches_cached_users(app):
+    user_id = db.session.execute(
+        text("INSERT INTO user (username, email, password_hash) VALUES ('ann', 'ann@example.com', '-') RETURNING id")
+    ).scalar()
+    db.session.commit()
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=['locations', 'add', 'shop']).exit_code == 0
+
+    assert request_user(app, user_id).location_id is None
+    hits = user_cache.stats()['hits']
+    assert request_user(app, user_id).location_id is None
+    assert user_cache.stats()['hits'] == hits + 1
+
+    result = runner.invoke(args=['locations', 'assign', 'ann', 'shop'])
+    assert result.exit_code == 0, result.output
+    shop = db.session.execute(text("SELECT id FROM location WHERE name = 'shop'")).scalar()
+    assert request_user(app, user_id).location_id == shop
+
+    assert runner.invoke(args=['locations', 'assign', 'ann']).exit_code == 0
+    assert request_user(app, user_id).location_id is None
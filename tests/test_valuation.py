@@ -0,0 +1,63 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app.checkpoints import stock_as_of
+from app.extensions import db
+from app.valuation import apply, inventory_rows, new_state, rebuild_valuation, state_value
+from conftest import START, delete_some, random_ledger, table_rows, write_ledger
+
+
+def replayed_values(day, method):
+    """{(item name, unit name): value} from replaying every action up to day from scratch."""
+    states = {}
+    for action in db.session.execute(text("""
+        SELECT item_id, unit_id, date, action_type, quantity, price FROM actions
+        WHERE date <= :day ORDER BY item_id, unit_id, date, id
+    """), {"day": day}):
+        key = (action.item_id, action.unit_id)
+        apply(key, states.setdefault(key, new_state()), action)
+    return {(f"item-{i}", f"unit-{u}"): round(state_value(state, method), 2) for (i, u), state in states.items()}
+
+
+@pytest.mark.parametrize('method', ['fifo', 'average'])
+def test_as_of_values_match_a_full_replay(app, method):
+    rng = random.Random(3)
+    write_ledger(rng, random_ledger(rng))
+    delete_some(rng)
+    assert db.session.execute(text("SELECT COUNT(*) FROM stock_checkpoint_layer")).scalar()
+
+    days = [START + timedelta(days=offset) for offset in (10, 30, 31, 45, 59, 60, 100, 150, 220)]
+    for day in [day.isoformat() for day in days]:
+        rows = stock_as_of(day, method)
+        assert {(row.item_name, row.unit_name): row.total_price for row in rows} == replayed_values(day, method)
+
+
+@pytest.mark.parametrize('method', ['fifo', 'average'])
+def test_as_of_after_the_last_action_matches_current_inventory(app, method):
+    rng = random.Random(5)
+    write_ledger(rng, random_ledger(rng))
+
+    current = {(row.item_name, row.unit_name): row.total_price for row in inventory_rows(method)}
+    as_of = {(row.item_name, row.unit_name): row.total_price for row in stock_as_of(date.today().isoformat(), method)}
+    assert as_of == pytest.approx(current)
+
+
+def test_incremental_valuation_matches_a_rebuild(app):
+    rng = random.Random(7)
+    write_ledger(rng, random_ledger(rng), late=40)
+    delete_some(rng, count=30)
+    # Appended after the deletes, so some keys fold onto a revalued state.
+    write_ledger(rng, random_ledger(rng, count=40, days=210)[-20:], late=5)
+
+    valuation_sql = "SELECT * FROM stock_valuation ORDER BY item_id, unit_id"
+    layers_sql = "SELECT * FROM cost_layer ORDER BY item_id, unit_id, seq"
+    incremental = table_rows(valuation_sql), table_rows(layers_sql)
+    rebuild_valuation()
+    db.session.commit()
+
+    assert table_rows(layers_sql) == incremental[1]
+    for rebuilt, kept in zip(table_rows(valuation_sql), incremental[0], strict=True):
+        assert rebuilt == pytest.approx(kept)
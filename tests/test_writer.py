@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.writer import ActionWriter
+from conftest import action_row
+
+
+def test_a_bad_row_fails_only_its_own_submission(app):
+    # A long window, so all three submissions land in one batch.
+    writer = ActionWriter(max_delay=0.5)
+    writer.init_app(app)
+    sizes = []
+    commit_batch = writer._commit_batch
+
+    def record(batch):
+        sizes.append(len(batch))
+        return commit_batch(batch)
+    writer._commit_batch = record
+
+    good = writer.submit([action_row('2026-03-01', 'delivery', 1, 1, 4, 12.0)])
+    bad = writer.submit([action_row('2026-03-01', 'theft', 1, 1, 1)])
+    also_good = writer.submit([action_row('2026-03-02', 'sales', 1, 1, 1), action_row('2026-03-02', 'waste', 2, 1, 1)])
+
+    assert good.result(timeout=10) == 1
+    assert also_good.result(timeout=10) == 2
+    with pytest.raises(IntegrityError):
+        bad.result(timeout=10)
+
+    # The whole batch failed once, then each submission was retried alone.
+    assert sizes == [3, 1, 1, 1]
+    stats = writer.stats()
+    assert stats['failures'] == 1
+    assert stats['rows'] == 3
+    db.session.rollback()
+    rows = db.session.execute(text("SELECT date, action_type, item_id FROM actions ORDER BY id")).fetchall()
+    assert [tuple(row) for row in rows] == [
+        ('2026-03-01', 'delivery', 1), ('2026-03-02', 'sales', 1), ('2026-03-02', 'waste', 2),
+    ]
+    assert db.session.execute(text("SELECT net_quantity FROM stock_balance WHERE item_id = 1 AND unit_id = 1")).scalar() == 3